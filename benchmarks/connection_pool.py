@@ -0,0 +1,88 @@
+"""
+Compares a session per user agent against a single shared connection pool at equal concurrency
+    against a local server. The server delays the first request of every new connection by `--handshake-ms`
+    to emulate TCP + TLS setup, and counts the connections opened:
+
+    python -m benchmarks.connection_pool --requests 2000 --concurrency 50 --agents 110
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import web
+
+from scraping.aio import AsyncUserAgentManager
+
+from typing import Dict, Any, List
+
+
+async def start_server(port: int, handshake_delay: float, latency: float) -> web.AppRunner:
+    connections = set()
+
+    async def handle(request: web.Request) -> web.Response:
+        peer = request.transport.get_extra_info('peername')
+        if peer not in connections:
+            connections.add(peer)
+            await asyncio.sleep(handshake_delay)
+        await asyncio.sleep(latency)
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app['connections'] = connections
+    app.router.add_get('/{tail:.*}', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return runner
+
+
+async def run_mode(shared_session: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    runner = await start_server(args.port, args.handshake_ms / 1000, args.latency_ms / 1000)
+    user_agents = [f"benchmark-agent/{i}" for i in range(args.agents)]
+    manager = AsyncUserAgentManager(user_agents, max_agents_num=args.agents,
+                                    max_concurrent_requests=args.concurrency, shared_session=shared_session,
+                                    pool_size=args.concurrency)
+    latencies: List[float] = []
+    url = f"http://127.0.0.1:{args.port}/"
+
+    async def fetch(i: int):
+        session = await manager.get_client_session()
+        async with manager.request_limiter:
+            s0 = time.perf_counter()
+            async with session.get(url + str(i)) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - s0)
+
+    s0 = time.perf_counter()
+    await asyncio.gather(*(fetch(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - s0
+    await manager.shutdown()
+    connections = len(runner.app['connections'])
+    await runner.cleanup()
+    latencies.sort()
+    return {
+        'mode': 'shared pool' if shared_session else 'session per agent',
+        'connections': connections,
+        'p50_ms': 1000 * statistics.median(latencies),
+        'p95_ms': 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        'requests_per_sec': args.requests / elapsed,
+    }
+
+
+async def main(args: argparse.Namespace):
+    for shared_session in (False, True):
+        result = await run_mode(shared_session, args)
+        print(f"{result['mode']:>18}: connections={result['connections']:>5}  p50={result['p50_ms']:.1f} ms  "
+              f"p95={result['p95_ms']:.1f} ms  {result['requests_per_sec']:.0f} req/sec")
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--requests', type=int, default=2000)
+    arg_parser.add_argument('--concurrency', type=int, default=50)
+    arg_parser.add_argument('--agents', type=int, default=110)
+    arg_parser.add_argument('--handshake-ms', type=float, default=30., help="emulated connection setup time")
+    arg_parser.add_argument('--latency-ms', type=float, default=5., help="server processing time")
+    arg_parser.add_argument('--port', type=int, default=8799)
+    asyncio.run(main(arg_parser.parse_args()))
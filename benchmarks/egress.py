@@ -0,0 +1,117 @@
+"""
+Egress routing against the local mock server limiting the rate per client address (like pubmed does per IP):
+
+    python -m benchmarks.egress --proxies 4 --rate-per-client 20 --num-pages 10 --dead-proxies 1
+
+Runs the pipeline once straight to the server and once through `--proxies` mock proxies, each one connecting
+from its own loopback address (127.0.0.2, 127.0.0.3, ... - linux routes the whole 127.0.0.0/8 to loopback)
+with a `--route-rate` budget, plus `--dead-proxies` answering 502 to everything, which must end up quarantined.
+Reports articles/sec, throttled (429) responses and the state of every route.
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from benchmarks.mock_server import start_mock_server_process, add_mock_arguments, mock_kwargs_from_args
+from benchmarks.mock_proxy import start_mock_proxy_process
+
+from typing import Dict, Any, List, Optional
+
+
+async def _run_client(settings: Dict[str, Any]) -> Dict[str, Any]:
+    from main import iter_articles
+    from scraping.aio import AsyncUserAgentManager
+    from scraping.egress import EgressPool, EgressRoute
+
+    pool: Optional[EgressPool] = None
+    if settings['routes']:
+        pool = EgressPool([EgressRoute(**route) for route in settings['routes']], min_samples=5,
+                          quarantine_seconds=settings['quarantine_seconds'])
+    manager = AsyncUserAgentManager([f"benchmark-agent/{i}" for i in range(10)], max_agents_num=10,
+                                    max_concurrent_requests=settings['concurrency'], egress_pool=pool)
+    stats: Dict[str, Dict[str, int]] = {}
+    num_records = 0
+    s0 = time.perf_counter()
+    try:
+        async for _ in iter_articles(manager, 'benchmark', settings['num_pages'], 1, base_url=settings['base_url'],
+                                     max_retries=settings['max_retries'], backend='lxml',
+                                     retry_base_delay=settings['retry_base_delay'], stats=stats):
+            num_records += 1
+    finally:
+        await manager.shutdown()
+    elapsed = time.perf_counter() - s0
+    return {
+        'records': num_records,
+        'elapsed_sec': elapsed,
+        'articles_per_sec': num_records / elapsed,
+        'retries': sum(phase.get('retries', 0) for phase in stats.values()),
+        'failed': sum(phase.get('failed', 0) for phase in stats.values()),
+        'routes': pool.snapshot() if pool is not None else [],
+    }
+
+
+def run_client(settings: Dict[str, Any]) -> Dict[str, Any]:
+    import logging
+    logging.disable(logging.CRITICAL)
+    return asyncio.run(_run_client(settings))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--proxies', type=int, default=4, help="healthy mock proxies")
+    arg_parser.add_argument('--dead-proxies', type=int, default=1, help="mock proxies failing every request")
+    arg_parser.add_argument('--route-rate', type=float, default=None,
+                            help="requests per second budget of every route, `--rate-per-client` by default")
+    arg_parser.add_argument('--proxy-latency', default='const:2', help="latency added by the proxies, milliseconds")
+    arg_parser.add_argument('--quarantine-seconds', type=float, default=30.)
+    arg_parser.add_argument('--concurrency', type=int, default=40)
+    arg_parser.add_argument('--num-pages', type=int, default=10)
+    arg_parser.add_argument('--max-retries', type=int, default=30)
+    arg_parser.add_argument('--retry-base-delay', type=float, default=0.1)
+    arg_parser.add_argument('--port', type=int, default=8780)
+    arg_parser.add_argument('--proxy-port', type=int, default=8881, help="port of the first proxy")
+    arg_parser.add_argument('--output', type=Path, default=None, help="json file to save the results to")
+    add_mock_arguments(arg_parser)
+    arg_parser.set_defaults(rate_per_client=20.)
+    args = arg_parser.parse_args()
+
+    route_rate = args.route_rate or args.rate_per_client
+    processes = [start_mock_server_process(mock_kwargs_from_args(args), port=args.port)]
+    routes: List[Dict[str, Any]] = []
+    try:
+        for i in range(args.proxies + args.dead_proxies):
+            port = args.proxy_port + i
+            dead = i >= args.proxies
+            processes.append(start_mock_proxy_process(
+                {'local_address': f"127.0.0.{i + 2}", 'latency': args.proxy_latency, 'rate_5xx': 1. if dead else 0.},
+                port=port))
+            routes.append({'proxy': f"http://127.0.0.1:{port}", 'max_rate': route_rate,
+                           'name': f"{'dead' if dead else 'proxy'}-{i}"})
+        results = {}
+        for scenario, scenario_routes in (('direct', []), ('routed', routes)):
+            settings = {'routes': scenario_routes, 'concurrency': args.concurrency, 'num_pages': args.num_pages,
+                        'base_url': f"http://127.0.0.1:{args.port}", 'max_retries': args.max_retries,
+                        'retry_base_delay': args.retry_base_delay, 'quarantine_seconds': args.quarantine_seconds}
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = results[scenario] = executor.submit(run_client, settings).result()
+            print(f"{scenario:>7}: {result['records']} articles, {result['articles_per_sec']:.1f} articles/sec, "
+                  f"retries={result['retries']}, failed={result['failed']}")
+            for route in result['routes']:
+                print(f"    {route['name']}: {route['state']}, {route['requests']} requests, "
+                      f"{route['errors']} errors, score={route['score']}, strikes={route['strikes']}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump({'args': vars(args), 'results': results}, file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
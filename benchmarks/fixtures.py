@@ -0,0 +1,172 @@
+"""
+Synthetic pubmed pages mimicking the markup the parsers rely on
+"""
+import random
+from functools import lru_cache
+
+from typing import Optional, List, Dict, Iterable
+from xml.sax.saxutils import escape
+
+
+__all__ = ['article_page', 'search_page', 'article_page_variants', 'esearch_xml', 'efetch_xml', 'pubmed_article_xml']
+
+
+_WORDS = ("allergy", "asthma", "immune", "response", "children", "peanut", "clinical", "trial", "cohort", "risk",
+          "exposure", "tolerance", "sensitization", "dermatitis", "milk", "egg", "prevalence", "therapy")
+
+
+def _sentence(rng: random.Random, num_words: int = 12) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(num_words)).capitalize() + "."
+
+
+@lru_cache(maxsize=16)
+def _padding(size: int) -> str:
+    # navigation, references and other markup a real page is full of; the same for all pages of a size
+    rng = random.Random(size)
+    chunks = []
+    total = 0
+    while total < size:
+        chunk = (f'<li class="skip-numbering"><a class="reference-link" href="/{rng.randint(1, 10 ** 8)}/">'
+                 f'{_sentence(rng, 20)}</a> <span class="docsum-pmid">{rng.randint(1, 10 ** 8)}</span></li>\n')
+        chunks.append(chunk)
+        total += len(chunk)
+    return '<div class="references-list"><ol>' + "".join(chunks) + '</ol></div>'
+
+
+def article_page(pmid: int, size: int = 0, abstract_class: str = "abstract-content selected",
+                 keywords: Optional[str] = "allergy; asthma; children.", cit: Optional[str] = None,
+                 with_pmid: bool = True, with_doi: bool = True, seed: Optional[int] = None) -> str:
+    """
+    :param pmid:
+    :param size: approximate number of bytes of additional markup
+    :param abstract_class: class of the abstract div, no abstract if empty
+    :param keywords: keywords text, no keywords block if None
+    :param cit: citation text; derived from `pmid` if None
+    :param with_pmid: whether to render the identifier block
+    :param with_doi:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(pmid if seed is None else seed)
+    if cit is None:
+        month = ('Jan', 'Sep', 'Dec')[pmid % 3]
+        cit = f"{2000 + pmid % 24} {month};{pmid % 90}({pmid % 12}):{pmid % 500}-{pmid % 500 + 12}."
+    abstract = "".join(f"<p>{_sentence(rng, 30)}</p>\n" for _ in range(4))
+    keywords_block = (f'<p><strong class="sub-title">\n Keywords:\n </strong>\n {keywords}\n</p>'
+                      if keywords is not None else "")
+    abstract_block = (f'<div class="{abstract_class}" id="eng-abstract">{abstract}</div>'
+                      if abstract_class else "")
+    pmid_block = (f'<span class="identifier pubmed"><span class="id-label">PMID:</span>\n'
+                  f'<strong class="current-id" title="PubMed ID">{pmid}</strong></span>' if with_pmid else "")
+    doi_block = f'<span class="citation-doi">\n doi: 10.{1000 + pmid % 9000}/jaci.{pmid}.\n</span>' if with_doi else ""
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>{_sentence(rng, 6)} - PubMed</title></head>
+<body><main class="article-details" id="article-details">
+<header class="heading"><div class="article-citation"><div class="article-source">
+<div class="journal-actions dropdown-block"><button class="journal-actions-trigger trigger" title="Journal">
+J Allergy Clin Immunol</button></div>
+<span class="cit">{cit}</span>
+</div>{doi_block}</div>
+<h1 class="heading-title">{_sentence(rng, 10)}</h1>
+<ul class="identifiers" id="full-view-identifiers"><li>{pmid_block}</li></ul></header>
+<div class="abstract" id="abstract"><h2 class="title">Abstract</h2>
+{abstract_block}
+{keywords_block}
+</div>
+{_padding(size)}
+</main></body></html>"""
+
+
+def search_page(page: int, per_page: int = 10, size: int = 0, first_pmid: Optional[int] = None,
+                total: int = 12345) -> str:
+    """
+    :param page:
+    :param per_page:
+    :param size: approximate number of bytes of additional markup
+    :param first_pmid: pmid of the first result; results go in descending pmid order (newest first)
+    :param total: value of the results counter
+    :return:
+    """
+    rng = random.Random(page)
+    first_pmid = first_pmid if first_pmid is not None else 40_000_000 - (page - 1) * per_page
+    items = []
+    for i in range(per_page):
+        pmid = first_pmid - i
+        items.append(
+            f'<article class="full-docsum" data-rel-pos="{i + 1}"><div class="item-selector-wrap"></div>'
+            f'<div class="docsum-wrap"><div class="docsum-content">'
+            f'<a class="docsum-title" href="/{pmid}/" data-article-id="{pmid}">{_sentence(rng, 10)}</a>'
+            f'<div class="docsum-citation full-citation">'
+            f'<span class="docsum-authors full-authors">Doe J, Roe R, Smith A.</span>'
+            f'<span class="docsum-journal-citation full-journal-citation">J Allergy Clin Immunol. '
+            f'{2000 + pmid % 24} Sep;{pmid % 90}({pmid % 12}):1-12. doi: 10.1000/{pmid}.</span>'
+            f'<span class="citation-part">PMID: <span class="docsum-pmid">{pmid}</span></span></div>'
+            f'</div></div></article>\n')
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="utf-8"><title>Search - PubMed</title></head><body>
+<div class="results-amount"><span class="value">{total:,}</span> results</div>
+<section class="search-results-list">{"".join(items)}</section>
+{_padding(size)}
+</body></html>"""
+
+
+def article_page_variants(pmid: int = 30_000_000, size: int = 0) -> Dict[str, str]:
+    """
+    Pages covering the branches of the article parsers
+    """
+    return {
+        'regular': article_page(pmid, size),
+        'abstract_content_only': article_page(pmid + 1, size, abstract_class="abstract-content"),
+        'no_abstract': article_page(pmid + 2, size, abstract_class=""),
+        'no_keywords': article_page(pmid + 3, size, keywords=None),
+        'no_doi': article_page(pmid + 4, size, with_doi=False),
+        'no_issue': article_page(pmid + 5, size, cit="2021 Mar;17:e123."),
+        'semicolon_in_pages': article_page(pmid + 6, size, cit="2019;12(4):1-5;6-9."),
+        'malformed_cit': article_page(pmid + 7, size, cit="2020 Epub ahead of print"),
+        'no_pmid': article_page(pmid + 8, size, with_pmid=False),
+        'unicode': article_page(pmid + 9, size, keywords="Ménière’s disease; β-lactam."),
+    }
+
+
+def esearch_xml(count: int, webenv: str = "MCID_stand_in", query_key: str = "1", ids: Iterable[int] = ()) -> str:
+    ids = list(ids)
+    id_list = "".join(f"<Id>{pmid}</Id>" for pmid in ids)
+    return f"""<?xml version="1.0" encoding="UTF-8" ?>
+<!DOCTYPE eSearchResult PUBLIC "-//NLM//DTD esearch 20060628//EN"
+ "https://eutils.ncbi.nlm.nih.gov/eutils/dtd/20060628/esearch.dtd">
+<eSearchResult><Count>{count}</Count><RetMax>{len(ids)}</RetMax><RetStart>0</RetStart>
+<QueryKey>{query_key}</QueryKey><WebEnv>{webenv}</WebEnv><IdList>{id_list}</IdList></eSearchResult>"""
+
+
+def pubmed_article_xml(pmid: int, structured: bool = False, keywords: Optional[List[str]] = None) -> str:
+    rng = random.Random(pmid)
+    if structured:
+        abstract = "".join(f'<AbstractText Label="{label}" NlmCategory="{label}">'
+                           f'{escape(_sentence(rng, 20))}</AbstractText>'
+                           for label in ("BACKGROUND", "METHODS", "RESULTS"))
+    else:
+        abstract = f"<AbstractText>{escape(_sentence(rng, 60))} <i>in vitro</i>.</AbstractText>"
+    keywords = keywords if keywords is not None else ["allergy", "asthma"]
+    keyword_list = "".join(f'<Keyword MajorTopicYN="N">{escape(keyword)}</Keyword>' for keyword in keywords)
+    return f"""<PubmedArticle><MedlineCitation Status="MEDLINE" Owner="NLM"><PMID Version="1">{pmid}</PMID>
+<Article PubModel="Print-Electronic"><Journal><ISSN IssnType="Electronic">1097-6825</ISSN>
+<JournalIssue CitedMedium="Internet"><Volume>{pmid % 90}</Volume><Issue>{pmid % 12}</Issue>
+<PubDate><Year>{2000 + pmid % 24}</Year><Month>Sep</Month></PubDate></JournalIssue>
+<Title>The Journal of allergy and clinical immunology</Title>
+<ISOAbbreviation>J Allergy Clin Immunol</ISOAbbreviation></Journal>
+<ArticleTitle>{escape(_sentence(rng, 10))}</ArticleTitle>
+<Pagination><MedlinePgn>{pmid % 500}-{pmid % 500 + 12}</MedlinePgn></Pagination>
+<ELocationID EIdType="doi" ValidYN="Y">10.{1000 + pmid % 9000}/jaci.{pmid}</ELocationID>
+<Abstract>{abstract}</Abstract></Article>
+<MedlineJournalInfo><Country>United States</Country><MedlineTA>J Allergy Clin Immunol</MedlineTA></MedlineJournalInfo>
+{f'<KeywordList Owner="NOTNLM">{keyword_list}</KeywordList>' if keywords else ''}</MedlineCitation>
+<PubmedData><ArticleIdList><ArticleId IdType="pubmed">{pmid}</ArticleId></ArticleIdList></PubmedData></PubmedArticle>
+"""
+
+
+def efetch_xml(pmids: Iterable[int]) -> str:
+    articles = "".join(pubmed_article_xml(pmid, structured=pmid % 3 == 0) for pmid in pmids)
+    return f"""<?xml version="1.0" ?>
+<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN"
+ "https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">
+<PubmedArticleSet>{articles}</PubmedArticleSet>"""
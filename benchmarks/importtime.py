@@ -0,0 +1,90 @@
+"""
+Cold start cost of the scraper: import time of the modules and wall time of the short commands.
+
+    python -m benchmarks.importtime --repeat 7 --output importtime.json
+
+Every measurement runs in a fresh interpreter: imports are timed by `python -X importtime -c "import X"`
+(its cumulative time of the module), commands like `main.py --help` by the wall time of the whole process.
+Reports the medians over `--repeat` runs and the heaviest modules imported by `main`,
+and saves them as json together with the current git commit to compare across commits.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.throughput import git_commit
+
+from typing import Dict, Any, List, Tuple
+
+
+ROOT = Path(__file__).resolve().parents[1]
+MODULES = ('main', 'scraping', 'scraping.common', 'scraping.parsers', 'scraping.executors')
+COMMANDS = {
+    'help': ['main.py', '--help'],
+    'print_config': ['main.py', '--print-config', '--config', 'configs/main.example.yaml'],
+}
+HEAVY = ('aiohttp', 'pyarrow', 'pandas', 'bs4', 'lxml', 'yaml', 'pydantic')
+
+
+def import_times(module: str) -> Dict[str, Tuple[int, int]]:
+    """
+    :return: self and cumulative microseconds of every module imported by `import module` in a fresh interpreter
+    """
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def command_seconds(command: List[str]) -> float:
+    s0 = time.perf_counter()
+    subprocess.run([sys.executable] + command, cwd=ROOT, capture_output=True, check=True)
+    return time.perf_counter() - s0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    arg_parser.add_argument('--repeat', type=int, default=5, help="runs per measurement, the median is reported")
+    arg_parser.add_argument('--top', type=int, default=10, help="heaviest modules of `main` to report")
+    arg_parser.add_argument('--output', type=Path, default=None, help="json file to save the results to")
+    args = arg_parser.parse_args()
+
+    results: Dict[str, Any] = {'imports_ms': {}, 'heavy_dependencies': {}, 'commands_ms': {}}
+    main_runs: List[Dict[str, Tuple[int, int]]] = []
+    for module in args.modules:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        if module == 'main':
+            main_runs = runs
+        results['imports_ms'][module] = statistics.median(run[module][1] for run in runs) / 1000
+        results['heavy_dependencies'][module] = [name for name in HEAVY if name in runs[0]]
+        print(f"import {module:<20} {results['imports_ms'][module]:8.1f} ms, "
+              f"heavy dependencies: {results['heavy_dependencies'][module] or 'none'}")
+    for name, command in COMMANDS.items():
+        results['commands_ms'][name] = statistics.median(command_seconds(command) for _ in range(args.repeat)) * 1000
+        print(f"{' '.join(command):<60} {results['commands_ms'][name]:8.1f} ms")
+    if main_runs:
+        heaviest = sorted(((statistics.median(run[name][0] for run in main_runs if name in run) / 1000, name)
+                           for name in main_runs[0]), reverse=True)[:args.top]
+        results['heaviest_modules_ms'] = {name: ms for ms, name in heaviest}
+        print("heaviest modules of `import main` by self time:")
+        for ms, name in heaviest:
+            print(f"    {name:<40} {ms:8.1f} ms")
+
+    if args.output is not None:
+        report = {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'python': sys.version.split()[0], 'repeat': args.repeat, 'results': results}
+        args.output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Local stand-in for an http forward proxy, to check the egress routing without real proxies:
+
+    python -m benchmarks.mock_proxy --port 8881 --local-address 127.0.0.2 --latency const:5 --rate-5xx 0.1
+
+Forwards the absolute-form `GET http://host/...` requests it gets, connecting to the server from `--local-address`
+(any 127.x.y.z works on linux), so that a server limiting the rate per client address sees every proxy
+as another client. `--rate-5xx 1` makes a dead proxy answering 502 to everything.
+Requests to the proxy itself (`GET /stats`) return its counters as json.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import socket
+import time
+from collections import Counter
+
+import aiohttp
+from aiohttp import web
+
+from benchmarks.mock_server import make_latency_sampler
+
+from typing import Optional, Dict, Any
+
+
+class MockProxy:
+    """
+        Forward proxy delaying every request by a sample of `latency` and failing the given share with 502
+    """
+
+    def __init__(self, local_address: Optional[str] = None, latency: str = 'const:0', rate_5xx: float = 0.,
+                 seed: Optional[int] = None):
+        self.local_address = local_address
+        self.rate_5xx = rate_5xx
+        self._latency = make_latency_sampler(latency, seed)
+        self._rng = random.Random(seed)
+        self.counters: Counter = Counter()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def forward(self, request: web.Request) -> web.Response:
+        if not request.raw_path.startswith('http://'):  # origin-form: a request to the proxy itself
+            return web.json_response(dict(self.counters))
+        self.counters['requests'] += 1
+        delay = self._latency()
+        if delay:
+            await asyncio.sleep(delay)
+        if self._rng.random() < self.rate_5xx:
+            self.counters['5xx'] += 1
+            return web.Response(status=502)
+        if self._session is None:
+            connector = aiohttp.TCPConnector(local_addr=(self.local_address, 0) if self.local_address else None)
+            self._session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+        headers = {key: value for key, value in request.headers.items()
+                   if key.lower() not in ('host', 'proxy-connection', 'proxy-authorization', 'connection')}
+        try:
+            async with self._session.get(request.raw_path, headers=headers) as response:
+                body = await response.read()
+                self.counters[str(response.status)] += 1
+                return web.Response(status=response.status, body=body, headers={
+                    key: value for key, value in response.headers.items()
+                    if key.lower() in ('content-type', 'content-encoding', 'retry-after')})
+        except aiohttp.ClientError:
+            self.counters['unreachable'] += 1
+            return web.Response(status=502)
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8881) -> None:
+        # the low-level server: the router of `web.Application` rejects absolute urls without a path
+        runner = web.ServerRunner(web.Server(self.forward))
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+
+def _serve_forever(proxy_kwargs: Dict[str, Any], host: str, port: int) -> None:
+    asyncio.run(MockProxy(**proxy_kwargs).serve_forever(host, port))
+
+
+def start_mock_proxy_process(proxy_kwargs: Dict[str, Any], host: str = '127.0.0.1', port: int = 8881,
+                             timeout: float = 10.) -> multiprocessing.Process:
+    """
+    Starts the proxy in a separate process, see `benchmarks.mock_server.start_mock_server_process`
+    :param proxy_kwargs: `MockProxy` parameters
+    :return: the process, `terminate` it once done
+    """
+    process = multiprocessing.Process(target=_serve_forever, args=(proxy_kwargs, host, port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                return process
+        except OSError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError(f"mock proxy didn't start on {host}:{port}")
+            time.sleep(0.05)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8881)
+    arg_parser.add_argument('--local-address', default=None, help="source address of the forwarded requests")
+    arg_parser.add_argument('--latency', default='const:0', help="latency distribution spec, milliseconds")
+    arg_parser.add_argument('--rate-5xx', type=float, default=0., help="share of requests failed with 502")
+    arg_parser.add_argument('--seed', type=int, default=None)
+    args = arg_parser.parse_args()
+    proxy = MockProxy(args.local_address, args.latency, args.rate_5xx, args.seed)
+    asyncio.run(proxy.serve_forever(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
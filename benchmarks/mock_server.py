@@ -0,0 +1,249 @@
+"""
+Local stand-in for pubmed serving synthetic responses:
+
+    python -m benchmarks.mock_server --port 8780 --latency lognormal:2.3:0.5 --rate-429 0.02
+
+Html: `/?term=...&page=N` search pages (`docsum-content` blocks) and `/{pmid}/` article pages;
+E-utilities: `/entrez/eutils/esearch.fcgi` and `/entrez/eutils/efetch.fcgi` (with `WebEnv` history paging);
+`/stats` returns the served requests counters as json.
+
+Latency specs (milliseconds): `const:5`, `uniform:2:20`, `exp:10` (mean), `lognormal:2.3:0.5` (mu, sigma of ln ms)
+"""
+import argparse
+import asyncio
+import multiprocessing
+import random
+import re
+import socket
+import time
+from collections import Counter
+from datetime import date
+
+from aiohttp import web
+
+from benchmarks.fixtures import article_page, search_page, esearch_xml, efetch_xml
+
+from typing import Optional, Callable, Dict, Any, Tuple
+
+
+EUTILS_PATH: str = '/entrez/eutils'
+MAX_SEARCH_PAGES: int = 1000
+# `"2020/01/01"[dp] : "2020/12/31"[dp]` with spaces or `+`
+_DATE_RANGE = re.compile(r'"(\d{4})/(\d{2})/(\d{2})"\[dp\][+\s]*:[+\s]*"(\d{4})/(\d{2})/(\d{2})"\[dp\]')
+
+
+def make_latency_sampler(spec: str, seed: Optional[int] = None) -> Callable[[], float]:
+    """
+    :param spec: distribution spec, see the module docstring
+    :param seed:
+    :return: function returning the latency in seconds
+    """
+    rng = random.Random(seed)
+    kind, *values = spec.split(':')
+    values = [float(value) for value in values]
+    if kind == 'const':
+        return lambda: values[0] / 1000
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if kind == 'exp':
+        return lambda: rng.expovariate(1 / values[0]) / 1000 if values[0] > 0 else 0.
+    if kind == 'lognormal':
+        return lambda: rng.lognormvariate(values[0], values[1]) / 1000
+    raise ValueError(f"unknown latency distribution={spec}")
+
+
+class MockPubmed:
+    """
+        Serves a query with `num_results` results, pmids go in descending order starting from `first_pmid`;
+            `results_per_day` results are published every day back from `newest_date`, so that `[dp]` date ranges
+            of the term select a part of them. Like pubmed, only the first 1000 search pages are served.
+        Every request is delayed by a sample of `latency` and fails with 429 / 5xx with the given rates;
+            with `rate_per_client` every client address gets that many requests per second, 429 beyond that
+    """
+
+    def __init__(self, num_results: int = 1000, first_pmid: int = 40_000_000, per_page: int = 10,
+                 latency: str = 'const:0', rate_429: float = 0., rate_5xx: float = 0.,
+                 retry_after: Optional[float] = None, search_page_size: int = 0, article_page_size: int = 0,
+                 seed: Optional[int] = None, results_per_day: int = 5, newest_date: date = date(2024, 12, 31),
+                 rate_per_client: Optional[float] = None):
+        self.num_results = num_results
+        self.first_pmid = first_pmid
+        self.per_page = per_page
+        self.results_per_day = results_per_day
+        self.newest_date = newest_date
+        self.sample_latency = make_latency_sampler(latency, seed)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.search_page_size = search_page_size
+        self.article_page_size = article_page_size
+        self.rate_per_client = rate_per_client
+        self.counters: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._client_buckets: Dict[str, Tuple[float, float]] = {}  # address -> (tokens, last update)
+
+    def pmid(self, index: int) -> int:
+        return self.first_pmid - index
+
+    def results_range(self, term: str) -> Tuple[int, int]:
+        """
+        :return: first and stop indices of the results matching the term's publication date range if any
+        """
+        match = _DATE_RANGE.search(term)
+        if match is None:
+            return 0, self.num_results
+        values = [int(value) for value in match.groups()]
+        start, end = date(*values[:3]), date(*values[3:])
+        first = max((self.newest_date - end).days, 0) * self.results_per_day
+        stop = max((self.newest_date - start).days + 1, 0) * self.results_per_day
+        return min(first, self.num_results), min(stop, self.num_results)
+
+    def _throttled(self, client: Optional[str]) -> bool:
+        if self.rate_per_client is None:
+            return False
+        now = time.monotonic()
+        burst = max(self.rate_per_client, 1.)
+        tokens, updated = self._client_buckets.get(client, (burst, now))
+        tokens = min(tokens + (now - updated) * self.rate_per_client, burst)
+        throttled = tokens < 1.
+        self._client_buckets[client] = (tokens if throttled else tokens - 1., now)
+        return throttled
+
+    async def _serve(self, kind: str, render: Callable[[], str], content_type: str = 'text/html',
+                     request: Optional[web.Request] = None) -> web.Response:
+        self.counters[kind] += 1
+        client = request.remote if request is not None else None
+        self.counters[f"client:{client}"] += 1
+        await asyncio.sleep(self.sample_latency())
+        if self._throttled(client):
+            self.counters['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': '1'})
+        roll = self._rng.random()
+        if roll < self.rate_429:
+            self.counters['429'] += 1
+            headers = {'Retry-After': str(int(self.retry_after))} if self.retry_after is not None else None
+            return web.Response(status=429, headers=headers)
+        if roll < self.rate_429 + self.rate_5xx:
+            self.counters['5xx'] += 1
+            return web.Response(status=503)
+        return web.Response(text=render(), content_type=content_type)
+
+    async def search(self, request: web.Request) -> web.Response:
+        page = int(request.query.get('page', 1))
+        first, stop = self.results_range(request.query.get('term', ''))
+        first_index = first + (page - 1) * self.per_page
+        per_page = max(min(self.per_page, stop - first_index), 0) if page <= MAX_SEARCH_PAGES else 0
+        return await self._serve('search', lambda: search_page(page, per_page, self.search_page_size,
+                                                               self.pmid(first_index), stop - first),
+                                 request=request)
+
+    async def article(self, request: web.Request) -> web.Response:
+        pmid = int(request.match_info['pmid'])
+        return await self._serve('article', lambda: article_page(pmid, self.article_page_size), request=request)
+
+    async def esearch(self, request: web.Request) -> web.Response:
+        first, stop = self.results_range(request.query.get('term', ''))
+        retstart = int(request.query.get('retstart', 0))
+        retmax = int(request.query.get('retmax', 20))
+        ids = [self.pmid(i) for i in range(first + retstart, min(first + retstart + retmax, stop))]
+        webenv = f"MCID_{first}_{stop}"  # the results range is stored in the history "session"
+        return await self._serve('esearch', lambda: esearch_xml(stop - first, webenv=webenv, ids=ids), 'text/xml',
+                                 request)
+
+    async def efetch(self, request: web.Request) -> web.Response:
+        if 'WebEnv' in request.query:
+            _, first, stop = request.query['WebEnv'].split('_')
+            first, stop = int(first), int(stop)
+            retstart = int(request.query.get('retstart', 0))
+            retmax = int(request.query.get('retmax', 20))
+            pmids = [self.pmid(i) for i in range(first + retstart, min(first + retstart + retmax, stop))]
+        else:
+            pmids = [int(pmid) for pmid in request.query.get('id', '').split(',') if pmid]
+        return await self._serve('efetch', lambda: efetch_xml(pmids), 'text/xml', request)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.counters))
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/', self.search)
+        app.router.add_get(r'/{pmid:\d+}/', self.article)
+        app.router.add_get(EUTILS_PATH + '/esearch.fcgi', self.esearch)
+        app.router.add_get(EUTILS_PATH + '/efetch.fcgi', self.efetch)
+        app.router.add_get('/stats', self.stats)
+        return app
+
+
+async def start_mock_server(mock: MockPubmed, host: str = '127.0.0.1', port: int = 8780) -> web.AppRunner:
+    """
+    Starts the server within the running event loop
+    """
+    runner = web.AppRunner(mock.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def _serve_forever(mock_kwargs: Dict[str, Any], host: str, port: int) -> None:
+    web.run_app(MockPubmed(**mock_kwargs).make_app(), host=host, port=port, print=None, access_log=None)
+
+
+def start_mock_server_process(mock_kwargs: Dict[str, Any], host: str = '127.0.0.1', port: int = 8780,
+                              timeout: float = 10.) -> multiprocessing.Process:
+    """
+    Starts the server in a separate process, so that it doesn't compete with the measured client for the cpu
+    :param mock_kwargs: `MockPubmed` parameters
+    :param host:
+    :param port:
+    :param timeout: seconds to wait for the server to accept connections
+    :return: the process, `terminate` it once done
+    """
+    process = multiprocessing.Process(target=_serve_forever, args=(mock_kwargs, host, port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=0.1):
+                return process
+        except OSError:
+            if time.monotonic() > deadline or not process.is_alive():
+                process.terminate()
+                raise RuntimeError(f"mock server didn't start on {host}:{port}")
+            time.sleep(0.05)
+
+
+def add_mock_arguments(arg_parser: argparse.ArgumentParser) -> None:
+    arg_parser.add_argument('--num-results', type=int, default=1000)
+    arg_parser.add_argument('--first-pmid', type=int, default=40_000_000,
+                            help="pmid of the newest result; raise it with --num-results to simulate new articles")
+    arg_parser.add_argument('--latency', default='const:0', help="latency distribution spec, milliseconds")
+    arg_parser.add_argument('--rate-429', type=float, default=0., help="share of responses failed with 429")
+    arg_parser.add_argument('--rate-5xx', type=float, default=0., help="share of responses failed with 503")
+    arg_parser.add_argument('--retry-after', type=float, default=None, help="`Retry-After` seconds sent with 429")
+    arg_parser.add_argument('--search-page-size', type=int, default=0, help="extra bytes of every search page")
+    arg_parser.add_argument('--article-page-size', type=int, default=0, help="extra bytes of every article page")
+    arg_parser.add_argument('--results-per-day', type=int, default=5,
+                            help="results published per day, defines what `[dp]` date ranges select")
+    arg_parser.add_argument('--rate-per-client', type=float, default=None,
+                            help="requests per second per client address, 429 beyond that")
+    arg_parser.add_argument('--seed', type=int, default=None)
+
+
+def mock_kwargs_from_args(args: argparse.Namespace) -> Dict[str, Any]:
+    return {'num_results': args.num_results, 'first_pmid': args.first_pmid, 'latency': args.latency,
+            'rate_429': args.rate_429, 'rate_5xx': args.rate_5xx, 'retry_after': args.retry_after,
+            'search_page_size': args.search_page_size, 'article_page_size': args.article_page_size, 'seed': args.seed,
+            'results_per_day': args.results_per_day, 'rate_per_client': args.rate_per_client}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8780)
+    add_mock_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    web.run_app(MockPubmed(**mock_kwargs_from_args(args)).make_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Normalization of the parsed records (citation split, publication date, keywords, pmid), record by record
+versus column-wise over the batches the sinks write:
+
+    python -m benchmarks.normalize --records 10000 100000 --batch-size 1000 --malformed 0.05
+
+`per_record`: `normalize_record` for every record, then the typed batches (the sinks as they used to be),
+`batch`: the parsed strings collected column by column, then `normalize_table` per batch.
+Both give the same rows, which is checked, `--malformed` is the share of citations the split can't handle.
+"""
+import argparse
+import json
+import random
+import time
+
+from scraping.common import PUBMED_BASE_URL, ArticleRecord
+from scraping.normalize import normalize_table, raw_schema
+from scraping.schema import ARTICLE_SCHEMA, normalize_record
+from scraping.sinks import ColumnarAccumulator
+
+from typing import Dict, Any, List
+
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+MALFORMED = ("{year} Epub ahead of print", "{year};{volume}(1)(2):3", "{year} {month};{volume}:e1:e2", "")
+
+
+def make_records(num_records: int, malformed: float = 0., seed: int = 0) -> List[ArticleRecord]:
+    rng = random.Random(seed)
+    records = []
+    for i in range(num_records):
+        pmid = str(30_000_000 + i)
+        parts = dict(year=1990 + i % 34, month=MONTHS[i % 12], day=i % 28 + 1, volume=i % 90, issue=i % 12,
+                     page=i % 500)
+        if rng.random() < malformed:
+            cit = rng.choice(MALFORMED).format(**parts)
+        else:
+            cit = rng.choice(("{year} {month} {day};{volume}({issue}):{page}-{page}9.",
+                              "{year} {month};{volume}:e{page}.",
+                              "{year} Winter;{volume}({issue}):{page}-{page}1.")).format(**parts)
+        records.append(ArticleRecord(
+            url=f"{PUBMED_BASE_URL}/{pmid}/", pmid=pmid, abstract=f"{pmid} abstract",
+            keywords="; ".join(rng.sample(("allergy", "asthma", "children", "peanut", "milk"), k=i % 4)) + ".",
+            citation_doi=f"doi: 10.1000/{pmid}.", journal=f"J Allergy {i % 50}", cit=cit, query='food allergies'))
+    return records
+
+
+def run_per_record(records: List[ArticleRecord], batch_size: int) -> list:
+    accumulator = ColumnarAccumulator(ARTICLE_SCHEMA, chunk_size=batch_size)
+    for record in records:
+        accumulator.append(normalize_record(record))
+    return accumulator.to_table().to_batches()
+
+
+def run_batch(records: List[ArticleRecord], batch_size: int) -> list:
+    accumulator = ColumnarAccumulator(raw_schema(ARTICLE_SCHEMA), chunk_size=batch_size)
+    accumulator.extend(records)
+    return [normalize_table(table, ARTICLE_SCHEMA) for table in
+            (accumulator.to_table().slice(i, batch_size) for i in range(0, len(accumulator), batch_size))]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--records', type=int, nargs='+', default=[10_000, 100_000])
+    arg_parser.add_argument('--batch-size', type=int, default=1000, help="rows per batch, `batch_size` of the config")
+    arg_parser.add_argument('--malformed', type=float, default=0.05, help="share of malformed citations")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="runs per path, the best one is reported")
+    arg_parser.add_argument('--output', default=None, help="json file to save the results to")
+    args = arg_parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)  # the malformed citations are reported, once per record by `split_citation`
+    results: List[Dict[str, Any]] = []
+    for num_records in args.records:
+        records = make_records(num_records, args.malformed)
+        timings, outputs = {}, {}
+        for name, run in (('per_record', run_per_record), ('batch', run_batch)):
+            seconds = []
+            for _ in range(args.repeat):
+                s0 = time.perf_counter()
+                outputs[name] = run(records, args.batch_size)
+                seconds.append(time.perf_counter() - s0)
+            timings[name] = min(seconds)
+        expected = [row for batch in outputs['per_record'] for row in batch.to_pylist()]
+        actual = [row for table in outputs['batch'] for row in table.to_pylist()]
+        if expected != actual:
+            raise AssertionError("column-wise normalization differs from the record by record one")
+        result = {'records': num_records, 'malformed': args.malformed,
+                  **{f"{name}_records_per_sec": num_records / value for name, value in timings.items()},
+                  'speedup': timings['per_record'] / timings['batch']}
+        results.append(result)
+        print(f"{num_records} records: per record {result['per_record_records_per_sec']:,.0f} records/sec, "
+              f"batch {result['batch_records_per_sec']:,.0f} records/sec, x{result['speedup']:.1f}, same output")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Measures pages/sec per parser backend (their output is checked against the reference BeautifulSoup one
+    by `tests/test_parsers.py`):
+
+    python -m benchmarks.parsers --pages 200 --size 150000
+"""
+import argparse
+import time
+
+from scraping.common import PUBMED_BASE_URL
+from scraping.parsers import PARSER_BACKENDS, get_parser
+
+from benchmarks.fixtures import article_page
+
+from typing import List, Dict
+
+
+def measure(backends: List[str], num_pages: int, size: int) -> Dict[str, float]:
+    pages = [article_page(30_000_000 + i, size) for i in range(num_pages)]
+    results = {}
+    for backend in backends:
+        parser = get_parser(backend)
+        s0 = time.perf_counter()
+        for i, text in enumerate(pages):
+            parser.parse_article(text, f"{PUBMED_BASE_URL}/{i}/")
+        elapsed = time.perf_counter() - s0
+        results[backend] = num_pages / elapsed
+        print(f"{backend}: {results[backend]:.1f} pages/sec ({num_pages} pages of ~{len(pages[0]) / 1024:.0f} KiB)")
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--backends', nargs='+', default=list(PARSER_BACKENDS))
+    arg_parser.add_argument('--pages', type=int, default=200, help="number of article pages to parse")
+    arg_parser.add_argument('--size', type=int, default=150_000, help="approximate page size in bytes")
+    args = arg_parser.parse_args()
+    measure(args.backends, args.pages, args.size)
+
+
+if __name__ == '__main__':
+    main()
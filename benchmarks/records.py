@@ -0,0 +1,107 @@
+"""
+Memory held by the scraped records before they are written, per record representation:
+
+    python -m benchmarks.records --records 10000 100000 --abstract-size 1500
+
+`ordereddict`: a list of `OrderedDict`s (the records as they used to be), `slots`: a list of `ArticleRecord`s,
+`columnar`: a `ColumnarAccumulator` building arrow batches of `--chunk-size` rows.
+Memory is measured with `tracemalloc` (python objects) plus the arrow memory pool, so every representation
+runs in a fresh process. The overhead is what is held on top of the text of the records themselves.
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pyarrow as pa
+
+from scraping.common import PUBMED_BASE_URL, ArticleRecord
+from scraping.schema import RAW_ARTICLE_SCHEMA
+from scraping.sinks import ColumnarAccumulator
+
+from typing import Dict, Any, List, Iterator
+
+
+KINDS = ('ordereddict', 'slots', 'columnar')
+
+
+def iter_fields(num_records: int, abstract_size: int) -> Iterator[Dict[str, Any]]:
+    words = "allergy peanut milk egg children cohort tolerance exposure".split()
+    text = " ".join(words[j % len(words)] for j in range(abstract_size // 7 + 1))
+    for i in range(num_records):
+        pmid = str(30_000_000 + i)
+        # a new string per record as the parsers give, nothing shared between the records
+        abstract = f"{pmid} {text}"[:abstract_size]
+        yield {
+            "url": f"{PUBMED_BASE_URL}/{pmid}/", "pmid": pmid, "abstract": abstract,
+            "keywords": f"{words[i % len(words)]}; {words[(i + 3) % len(words)]}.",
+            "published_date": f"20{i % 24:02d} Sep {i % 28 + 1}", "citation_doi": f"doi: 10.1000/{pmid}.",
+            "journal": f"J Allergy {i % 50}", "volume": str(i % 90), "issue": str(i % 12), "pages": f"{i % 500}-510.",
+        }
+
+
+def text_bytes(num_records: int, abstract_size: int) -> int:
+    # what the strings themselves take, the same for every representation
+    tracemalloc.start()
+    values = [value for fields in iter_fields(num_records, abstract_size) for value in fields.values()]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return held - values.__sizeof__()
+
+
+def measure(kind: str, num_records: int, abstract_size: int, chunk_size: int = 1000) -> Dict[str, Any]:
+    ColumnarAccumulator(RAW_ARTICLE_SCHEMA).to_table()  # the lazy imports of pyarrow are not the records
+    gc.collect()
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    if kind == 'ordereddict':
+        held = [OrderedDict(**fields) for fields in iter_fields(num_records, abstract_size)]
+    elif kind == 'slots':
+        held = [ArticleRecord(**fields) for fields in iter_fields(num_records, abstract_size)]
+    else:
+        accumulator = ColumnarAccumulator(RAW_ARTICLE_SCHEMA, chunk_size=chunk_size)
+        for fields in iter_fields(num_records, abstract_size):
+            accumulator.append(ArticleRecord(**fields))
+        held = accumulator.to_table()
+        del accumulator
+    gc.collect()
+    python_bytes, python_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow_bytes = pa.total_allocated_bytes() - arrow_before
+    assert len(held) == num_records
+    return {'kind': kind, 'records': num_records, 'python_bytes': python_bytes, 'arrow_bytes': arrow_bytes,
+            'held_bytes': python_bytes + arrow_bytes, 'peak_bytes': python_peak + arrow_bytes}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--records', type=int, nargs='+', default=[10_000, 100_000])
+    arg_parser.add_argument('--abstract-size', type=int, default=1500, help="abstract length in characters")
+    arg_parser.add_argument('--kinds', nargs='+', choices=KINDS, default=list(KINDS))
+    arg_parser.add_argument('--chunk-size', type=int, default=1000, help="rows per arrow batch of `columnar`")
+    arg_parser.add_argument('--output', default=None, help="json file to save the results to")
+    args = arg_parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    for num_records in args.records:
+        with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+            text = pool.submit(text_bytes, num_records, args.abstract_size).result()
+        for kind in args.kinds:
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                result = pool.submit(measure, kind, num_records, args.abstract_size, args.chunk_size).result()
+            result['overhead_bytes_per_record'] = (result['held_bytes'] - text) / num_records
+            results.append(result)
+            print(f"{kind:>12} x {num_records}: held={result['held_bytes'] / 1024 ** 2:.1f} MiB "
+                  f"(python {result['python_bytes'] / 1024 ** 2:.1f}, arrow {result['arrow_bytes'] / 1024 ** 2:.1f}), "
+                  f"peak={result['peak_bytes'] / 1024 ** 2:.1f} MiB, "
+                  f"overhead={result['overhead_bytes_per_record']:.0f} bytes/record")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+End-to-end throughput benchmark of the html scraping pipeline against the local mock server:
+
+    python -m benchmarks.throughput --concurrency 10 50 --agents 10 110 --num-pages 20 \
+        --latency lognormal:2.3:0.5 --rate-429 0.02 --output bench_results.json
+
+Every (concurrency, agents) pair runs in a fresh process, so that the peak RSS is measured per run.
+Reports articles/sec, time to the first record, p50/p95/p99 request latency, retries and peak RSS,
+and saves them as json together with the current git commit to compare across commits.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import aiohttp
+
+from benchmarks.mock_server import start_mock_server_process, add_mock_arguments, mock_kwargs_from_args
+
+from typing import Dict, Any, List, Optional
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def peak_rss_mib() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024  # bytes on macos, KiB on linux
+
+
+def make_latency_trace(latencies: List[float]) -> aiohttp.TraceConfig:
+    async def on_request_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        latencies.append(time.perf_counter() - context.start)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+
+async def _run_client(settings: Dict[str, Any]) -> Dict[str, Any]:
+    from main import iter_articles
+    from scraping.aio import AsyncUserAgentManager
+    from scraping.executors import ParseExecutor
+
+    latencies: List[float] = []
+    manager = AsyncUserAgentManager([f"benchmark-agent/{i}" for i in range(settings['agents'])],
+                                    max_agents_num=settings['agents'],
+                                    max_concurrent_requests=settings['concurrency'],
+                                    shared_session=settings['shared_session'],
+                                    trace_configs=[make_latency_trace(latencies)])
+    parse_executor = ParseExecutor(settings['parse_mode'], backend=settings['parser_backend'])
+    stats: Dict[str, Dict[str, int]] = {}
+    num_records, first_record_time = 0, None
+    s0 = time.perf_counter()
+    try:
+        async for _ in iter_articles(manager, settings['query'], settings['num_pages'], 1,
+                                     base_url=settings['base_url'], max_retries=settings['max_retries'],
+                                     parse_executor=parse_executor, backend=settings['parser_backend'],
+                                     retry_base_delay=settings['retry_base_delay'], stats=stats):
+            num_records += 1
+            if first_record_time is None:
+                first_record_time = time.perf_counter() - s0
+    finally:
+        await manager.shutdown()
+        parse_executor.shutdown()
+    elapsed = time.perf_counter() - s0
+    latencies.sort()
+    return {
+        'concurrency': settings['concurrency'],
+        'agents': settings['agents'],
+        'records': num_records,
+        'elapsed_sec': elapsed,
+        'articles_per_sec': num_records / elapsed,
+        'time_to_first_record_sec': first_record_time,
+        'requests': len(latencies),
+        'latency_p50_ms': 1000 * percentile(latencies, 0.50) if latencies else None,
+        'latency_p95_ms': 1000 * percentile(latencies, 0.95) if latencies else None,
+        'latency_p99_ms': 1000 * percentile(latencies, 0.99) if latencies else None,
+        'retries': sum(phase.get('retries', 0) for phase in stats.values()),
+        'failed': sum(phase.get('failed', 0) for phase in stats.values()),
+        'peak_rss_mib': peak_rss_mib(),
+    }
+
+
+def run_client(settings: Dict[str, Any]) -> Dict[str, Any]:
+    import logging
+    logging.disable(logging.CRITICAL)  # retried requests would flood the output with tracebacks
+    return asyncio.run(_run_client(settings))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50],
+                            help="`max_concurrent_requests` values")
+    arg_parser.add_argument('--agents', type=int, nargs='+', default=[10, 110], help="`max_agents_num` values")
+    arg_parser.add_argument('--num-pages', type=int, default=20)
+    arg_parser.add_argument('--max-retries', type=int, default=10)
+    arg_parser.add_argument('--retry-base-delay', type=float, default=0.05)
+    arg_parser.add_argument('--parser-backend', default='bs4')
+    arg_parser.add_argument('--parse-mode', default='inline')
+    arg_parser.add_argument('--per-agent-sessions', action='store_true', help="disable the shared connection pool")
+    arg_parser.add_argument('--port', type=int, default=8780)
+    arg_parser.add_argument('--output', type=Path, default=None, help="json file to save the results to")
+    add_mock_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    mock_kwargs = mock_kwargs_from_args(args)
+    server = start_mock_server_process(mock_kwargs, port=args.port)
+    results = []
+    try:
+        for concurrency, agents in itertools.product(args.concurrency, args.agents):
+            settings = {
+                'concurrency': concurrency, 'agents': agents, 'num_pages': args.num_pages, 'query': 'benchmark',
+                'base_url': f"http://127.0.0.1:{args.port}", 'max_retries': args.max_retries,
+                'retry_base_delay': args.retry_base_delay, 'parser_backend': args.parser_backend,
+                'parse_mode': args.parse_mode, 'shared_session': not args.per_agent_sessions,
+            }
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                result = executor.submit(run_client, settings).result()
+            results.append(result)
+            print(f"concurrency={concurrency:>4} agents={agents:>4}: {result['articles_per_sec']:8.1f} articles/sec  "
+                  f"first record {result['time_to_first_record_sec'] or 0:.3f} s  "
+                  f"p50/p95/p99 {result['latency_p50_ms'] or 0:.1f}/{result['latency_p95_ms'] or 0:.1f}/"
+                  f"{result['latency_p99_ms'] or 0:.1f} ms  retries={result['retries']}  "
+                  f"peak rss={result['peak_rss_mib'] or 0:.0f} MiB")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.output is not None:
+        report = {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'mock': mock_kwargs,
+                  'pipeline': {key: value for key, value in vars(args).items()
+                               if key in ('num_pages', 'max_retries', 'retry_base_delay', 'parser_backend',
+                                          'parse_mode', 'per_agent_sessions')},
+                  'results': results}
+        args.output.write_text(json.dumps(report, indent=2), encoding='utf-8')
+        print(f"saved results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
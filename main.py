@@ -1,24 +1,52 @@
+from __future__ import annotations
+
 from pathlib import Path
-import random
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import socket
 import time
 import sys
 import asyncio
+import typing
 
-from collections import OrderedDict
+from collections import Counter
 
-import aiohttp
-import pandas as pd
 import pydantic
 
-from bs4 import BeautifulSoup
-
 from scraping.common import *
-from scraping.aio import AsyncUserAgentManager
-from utils.common import load_yaml
+from scraping.egress import EgressPool, EgressRoute
+from scraping.executors import ParseExecutor
+from scraping.parsers import BeautifulSoupParser, get_parser
+from scraping.cache import ResponseCache, DEFAULT_TTLS
+from scraping.ratelimit import AdaptiveRateLimiter, RateLimitedError, parse_retry_after
+from scraping.scheduler import RetryScheduler
+from scraping.journal import CrawlJournal
+from scraping.index import PmidIndex
+from scraping.sharding import QueryShard, as_query_shards, plan_shards
+from scraping.workqueue import WorkQueue, Lease, get_work_queue
+from scraping.metrics import METRICS, ATTEMPT_BUCKETS, MetricsRegistry, MetricsServer, events
+from scraping.eutils import EUTILS_BASE_URL, EUTILS_MAX_RECORDS, eutils_params, parse_esearch_xml, \
+    iter_efetch_records
+from utils.common import load_yaml, save_jsonl
+
+# aiohttp and pyarrow take most of the startup, they are imported by the code paths using them,
+# so that `--help`, `--print-config` and the parse worker processes (re-importing this module) don't pay for them
+if typing.TYPE_CHECKING:
+    import aiohttp
+    import pyarrow as pa
+    from scraping.aio import AsyncUserAgentManager
+    from scraping.sinks import ParquetSink, PartitionedParquetSink
 
 import logging
 
-from typing import Optional, Dict, List, Iterable, Coroutine, Awaitable, Any, Callable, Tuple
+from typing import Optional, Dict, List, Iterable, Awaitable, Any, Callable, Tuple, AsyncIterator, Literal, \
+    Container, Set, Sequence, Union
+
+
+_SENTINEL = object()
 
 
 def flatten_container(container: Iterable[Any], exclude_none: bool = True) -> List[Any]:
@@ -36,110 +64,859 @@ def flatten_container(container: Iterable[Any], exclude_none: bool = True) -> Li
     return result
 
 
-async def async_scrape_article_with_semaphore(
-        semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, url: str, verbose: bool = False,
-        error_on_null_id: bool = True) -> OrderedDict:
+async def fetch_text(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, url: str,
+                     params: Optional[Dict[str, str]] = None, verbose: bool = False,
+                     response_cache: Optional[ResponseCache] = None, kind: str = 'article') -> str:
+    """
+    Fetches the page text under the semaphore, going to the response cache first if any
+    :param semaphore:
+    :param client_session:
+    :param url:
+    :param params: query parameters
+    :param verbose:
+    :param response_cache:
+    :param kind: resource kind defining the cache time to live, `search` or `article`
+    :return:
+    """
+    import aiohttp  # already loaded with the session
 
-    if verbose:
-        print(f"waiting semaphore={semaphore} to access {url} ...")
+    if response_cache is not None:
+        text = response_cache.get(url, params, kind)
+        if text is not None:
+            METRICS.inc('cache_hits_total', kind=kind)
+            return text
+
+    wait_start = time.monotonic()
     async with semaphore:
-        if verbose:
-            print(f"semaphore intercepted, accessing {url} ...")
+        s0 = time.monotonic()
+        METRICS.observe('semaphore_wait_seconds', s0 - wait_start, kind=kind)
+        rate_limiter = semaphore if isinstance(semaphore, AdaptiveRateLimiter) else None
+        try:
+            async with client_session.get(url, params=params) as response:
+                METRICS.inc('responses_total', kind=kind, status=response.status)
+                if rate_limiter is not None:
+                    rate_limiter.record_response(response.status, time.monotonic() - s0,
+                                                 response.headers.get('Retry-After'))
+                if response.status in (429, 503):
+                    raise RateLimitedError(response.status, parse_retry_after(response.headers.get('Retry-After')))
+                if response.status != 200:  # raise error so that the retry loop will catch it and process again
+                    raise ConnectionError(f"response={response.status}")
+                text = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            METRICS.inc('responses_total', kind=kind, status=type(exc).__name__)
+            if rate_limiter is not None:
+                rate_limiter.record_error()
+            raise
+        finally:
+            METRICS.observe('request_seconds', time.monotonic() - s0, kind=kind)
+    if verbose:
+        events.debug('fetched', kind=kind, url=url, params=params, wait=round(s0 - wait_start, 4),
+                     seconds=round(time.monotonic() - s0, 4))
+
+    if response_cache is not None:
+        response_cache.put(url, params, kind, text)
+    return text
+
+
+async def async_scrape_article_with_semaphore(
+        semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, url: str, verbose: bool = False,
+        error_on_null_id: bool = True, parse_executor: Optional[ParseExecutor] = None,
+        response_cache: Optional[ResponseCache] = None) -> ArticleRecord:
 
-        async with client_session.get(url) as response:
-            text = await response.text()
-            if verbose and text is None:
-                print(f"text={text} at url={url}")
-                raise AssertionError(f"got text={text}")
+    text = await fetch_text(semaphore, client_session, url, verbose=verbose, response_cache=response_cache,
+                            kind='article')
+    # parse after the semaphore is released - the request slot isn't held while the page is being parsed
+    if parse_executor is None:
+        s0 = time.perf_counter()
+        try:
             return process_pubmed_page_text(text, url, verbose, error_on_null_id)
+        finally:
+            METRICS.observe('parse_seconds', time.perf_counter() - s0, kind='article')
+    return await parse_executor.parse(text, url, verbose, error_on_null_id)
 
 
 async def extract_urls_from_page(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, base_url: str,
-                                 params, verbose: bool = True, parser: str = "html.parser") -> List[str]:
+                                 params, verbose: bool = True, parser: str = "html.parser",
+                                 backend: str = 'bs4', response_cache: Optional[ResponseCache] = None) -> List[str]:
 
-    if verbose:
-        print(f"waiting semaphore={semaphore} to access {base_url}")
+    page_text = await fetch_text(semaphore, client_session, base_url, params, verbose=verbose,
+                                 response_cache=response_cache, kind='search')
+    page_parser = get_parser(backend, features=parser) if backend == BeautifulSoupParser.name else get_parser(backend)
+    s0 = time.perf_counter()
+    try:
+        return page_parser.parse_search_page(page_text, base_url)  # identifier, urls
+    finally:
+        METRICS.observe('parse_seconds', time.perf_counter() - s0, kind='search')
+
+
+async def extract_results_from_page(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession,
+                                    base_url: str, params, verbose: bool = True, parser: str = "html.parser",
+                                    backend: str = 'bs4',
+                                    response_cache: Optional[ResponseCache] = None) -> List[ArticleRecord]:
+    """
+    Same as `extract_urls_from_page` but gives the `SEARCH_RESULT_COLUMNS` of every article instead of its url
+    """
+    page_text = await fetch_text(semaphore, client_session, base_url, params, verbose=verbose,
+                                 response_cache=response_cache, kind='search')
+    page_parser = get_parser(backend, features=parser) if backend == BeautifulSoupParser.name else get_parser(backend)
+    s0 = time.perf_counter()
+    try:
+        return page_parser.parse_search_results(page_text, base_url)
+    finally:
+        METRICS.observe('parse_seconds', time.perf_counter() - s0, kind='search')
+
+
+def split_fields(fields: Optional[Sequence[str]]) -> Tuple[bool, List[str]]:
+    """
+    :param fields: output columns, all if None
+    :return: whether the search results cover all of them (no article page is needed),
+        the columns to be taken from the search results of the articles fetched (title, authors, citation)
+    """
+    if fields is None:
+        return False, []
+    search_only = set(fields) <= {*SEARCH_RESULT_COLUMNS, 'query'}
+    return search_only, [field for field in fields if field in SEARCH_RESULT_COLUMNS and field not in ARTICLE_COLUMNS]
+
+
+async def esearch_history(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, base_url: str,
+                          params: Dict[str, str], verbose: bool = False) -> Tuple[int, str, str]:
+    """
+    Runs esearch storing the results on the history server
+    :return: count, WebEnv, query_key
+    """
+    text = await fetch_text(semaphore, client_session, f"{base_url}/esearch.fcgi", params, verbose=verbose,
+                            kind='eutils')
+    count, webenv, query_key, _ = parse_esearch_xml(text)
+    if count and (webenv is None or query_key is None):
+        raise ConnectionError(f"esearch returned no history for params={params}")
+    return count, webenv, query_key
+
+
+async def count_search_results(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, base_url: str,
+                               term: str, verbose: bool = False, backend: str = 'bs4',
+                               response_cache: Optional[ResponseCache] = None) -> int:
+    """
+    Reads the number of results of the search term from its first search page
+    """
+    page_text = await fetch_text(semaphore, client_session, base_url, {'term': term.replace(" ", "+")},
+                                 verbose=verbose, response_cache=response_cache, kind='search')
+    count = get_parser(backend).parse_results_count(page_text)
+    if count is None:  # no results, or pubmed has redirected to the only article found
+        return 1 if 'current-id' in page_text else 0
+    return count
+
+
+async def esearch_count(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, base_url: str,
+                        params: Dict[str, str], verbose: bool = False) -> int:
+    text = await fetch_text(semaphore, client_session, f"{base_url}/esearch.fcgi", dict(params, rettype='count'),
+                            verbose=verbose, kind='eutils')
+    return parse_esearch_xml(text)[0]
+
+
+async def efetch_articles(semaphore: asyncio.Semaphore, client_session: aiohttp.ClientSession, base_url: str,
+                          params: Dict[str, str], verbose: bool = False,
+                          pubmed_url: str = PUBMED_BASE_URL) -> List[ArticleRecord]:
+    text = await fetch_text(semaphore, client_session, f"{base_url}/efetch.fcgi", params, verbose=verbose,
+                            kind='eutils')
+    return list(iter_efetch_records(text, pubmed_url))
 
-    async with semaphore:
-        if verbose:
-            print(f"semaphore intercepted, accessing {base_url} ...")
-        async with client_session.get(base_url, params=params) as response:
-            if response.status == 200:
-                page_text = await response.text()
-                soup = BeautifulSoup(page_text, parser)
-                search_results = soup.find_all("div", class_="docsum-content")
-                urls = []
 
-                for result in search_results:
-                    title_element = result.find("a", class_="docsum-title")
-                    url = base_url + title_element["href"]
-                    urls.append(url)
+async def plan_query_shards(session_manager: AsyncUserAgentManager, queries: Sequence[str],
+                            fetch_backend: str = 'html', base_url: Optional[str] = None, backend: str = 'bs4',
+                            api_key: Optional[str] = None, email: Optional[str] = None,
+                            response_cache: Optional[ResponseCache] = None, max_retries: int = 10,
+                            verbose: bool = False) -> List[QueryShard]:
+    """
+    Splits every query into publication date shards small enough to get all their results (see `plan_shards`);
+        the results are counted with the first search page or with esearch for the `eutils` backend
+    :param session_manager:
+    :param queries:
+    :param fetch_backend: `html` or `eutils`
+    :param base_url: pubmed or E-utilities base url
+    :param backend: parser backend for the search pages
+    :param api_key: NCBI api key
+    :param email:
+    :param response_cache:
+    :param max_retries:
+    :param verbose:
+    :return: shards of all the queries
+    """
+    if fetch_backend == 'eutils':
+        base_url = (base_url or EUTILS_BASE_URL).rstrip('/')
+        common_params = eutils_params(api_key, email)
+        count_task = esearch_count
 
-                return urls  # identifier, urls
-            else:  # raise error so that the loop above will catch it and process again
-                raise ConnectionError(f"response={response.status}")
+        def make_params(term):
+            return base_url, dict(common_params, term=term), verbose
+    else:
+        base_url = base_url or PUBMED_BASE_URL
+        count_task = count_search_results
 
+        def make_params(term):
+            return base_url, term, verbose, backend, response_cache
 
-async def process_tasks_with_retry(task_executor: Callable, task_params: Dict[int, Any], max_retries,
-                                   session_manager: AsyncUserAgentManager, verbose: bool = True):
-    task_map = {}
-    errors_map = {}
+    async def count_results(terms: Sequence[str]) -> Dict[str, int]:
+        counts = await process_tasks_with_retry(count_task, {term: make_params(term) for term in terms},
+                                                max_retries, session_manager, verbose=verbose)
+        missing = [term for term in terms if term not in counts]
+        if missing:
+            raise ConnectionError(f"failed to count the results of {missing}")
+        return counts
 
+    shards = await asyncio.gather(*(plan_shards(query, count_results, verbose=verbose) for query in queries))
+    return [shard for query_shards in shards for shard in query_shards]
+
+
+def collect_run_metrics(registry: MetricsRegistry, rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                        work_queue: Optional[WorkQueue] = None) -> None:
+    """
+    Refreshes the gauges of the long-living objects of a run before the metrics are exported
+    """
+    if rate_limiter is not None:
+        snapshot = rate_limiter.snapshot()
+        for name in ('concurrency', 'rate', 'in_flight'):
+            registry.set(f"rate_limiter_{name}", snapshot[name])
+    if work_queue is not None:
+        for status, count in work_queue.counts().items():
+            registry.set('work_queue_tasks', count, status=status)
+
+
+def make_task_handler(task_executor: Callable, session_manager: AsyncUserAgentManager) -> Callable:
+    """
+    Binds `task_executor(semaphore, client_session, *params)` to the session manager:
+        every attempt gets the next client session
+    :param task_executor:
+    :param session_manager:
+    :return: coroutine function accepting `*params`
+    """
+    async def handler(*other_params):
+        client_session = await session_manager.get_client_session()
+        return await task_executor(session_manager.request_limiter, client_session, *other_params)
+
+    handler.__name__ = task_executor.__name__
+    return handler
+
+
+async def process_tasks_with_retry(task_executor: Callable, task_params: Dict[Any, Any], max_retries,
+                                   session_manager: AsyncUserAgentManager, verbose: bool = True,
+                                   num_workers: Optional[int] = None,
+                                   dead_letters: Optional[List[Dict[str, Any]]] = None) -> Dict[Any, Any]:
+    """
+    Runs the executor for every item of `task_params` on a bounded pool of workers with retries
+    :param task_executor: coroutine function with the (semaphore, client_session, *params) signature
+    :param task_params: identifier -> parameters passed after the semaphore and the session
+    :param max_retries:
+    :param session_manager:
+    :param verbose:
+    :param num_workers: defaults to the `max_concurrent_requests` of the session manager
+    :param dead_letters: list to be extended with the items failed after all the retries
+    :return: identifier -> result of the succeeded items
+    """
+    results = {}
+
+    async def on_result(ident, result):
+        results[ident] = result
+
+    scheduler = RetryScheduler(make_task_handler(task_executor, session_manager),
+                               max(min(num_workers or session_manager.max_concurrent_requests, len(task_params)), 1),
+                               max_retries=max_retries,
+                               on_result=on_result, name=task_executor.__name__, verbose=verbose).start()
     for ident, other_params in task_params.items():
+        await scheduler.put(ident, other_params)
+    await scheduler.join()
+    if dead_letters is not None:
+        dead_letters.extend(scheduler.dead_letters)
+    return results
+
+
+def list_search_pages(query: Union[str, Sequence[Union[str, QueryShard]]], num_pages: int = 2,
+                      start_page: int = 1) -> List[Tuple[Any, QueryShard, int]]:
+    """
+    :param query: query, queries or shards, see `iter_articles`
+    :param num_pages: number of pages of every query with an unknown number of results
+    :param start_page:
+    :return: (page key, shard, page number) of every search page to harvest;
+        a single query keeps plain page numbers as the keys
+    """
+    pages: List[Tuple[Any, QueryShard, int]] = []
+    for shard in as_query_shards(query):
+        shard_pages = range(start_page, start_page + num_pages + 1) if shard.num_pages is None \
+            else range(1, shard.num_pages + 1)
+        pages.extend((page if isinstance(query, str) else f"{shard.term} page={page}", shard, page)
+                     for page in shard_pages)
+    return pages
+
+
+async def drain_records(record_queue: asyncio.Queue, drive: Callable[[], Awaitable[None]],
+                        schedulers: Iterable[RetryScheduler], dead_letters: Optional[List[Dict[str, Any]]] = None,
+                        verbose: bool = False, stats: Optional[Dict[str, Dict[str, int]]] = None) -> AsyncIterator[Any]:
+    """
+    Runs `drive()` in the background and yields the records its schedulers put into `record_queue`
+        until it's done; the schedulers are stopped when the consumer stops iterating
+    :param record_queue:
+    :param drive: coroutine function submitting the work and joining the schedulers
+    :param schedulers:
+    :param dead_letters: list to be extended with the dead letters of the schedulers
+    :param verbose:
+    :param stats: dict to be updated with attempts / retries / failures counters of every scheduler
+    :return:
+    """
+    failures: List[BaseException] = []
+
+    async def run():
+        try:
+            await drive()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            failures.append(exc)
+        await record_queue.put(_SENTINEL)
+
+    driver = asyncio.create_task(run())
+    try:
+        while True:
+            record = await record_queue.get()
+            if record is _SENTINEL:
+                break
+            METRICS.set('queue_depth', record_queue.qsize(), queue='records')
+            yield record
+        if failures:
+            raise failures[0]
+    finally:  # the consumer may stop early - don't leave workers behind
+        driver.cancel()
+        await asyncio.gather(driver, return_exceptions=True)
+        for scheduler in schedulers:
+            await scheduler.stop()
+            if dead_letters is not None:
+                dead_letters.extend(scheduler.dead_letters)
+            if stats is not None:
+                stats[scheduler.name] = dict(scheduler.stats)
+            if verbose:
+                print(f"{scheduler.name}: {dict(scheduler.stats)}")
+
+
+async def iter_articles(session_manager: AsyncUserAgentManager,
+                        query: Union[str, Sequence[Union[str, QueryShard]]],
+                        num_pages: int = 2,
+                        start_page: int = 1,
+                        base_url: Optional[str] = None,
+                        verbose: bool = False,
+                        max_retries: int = 10,
+                        max_queued_urls: int = 1000,
+                        num_workers: Optional[int] = None,
+                        parse_executor: Optional[ParseExecutor] = None,
+                        backend: str = 'bs4',
+                        response_cache: Optional[ResponseCache] = None,
+                        dead_letters: Optional[List[Dict[str, Any]]] = None,
+                        retry_base_delay: float = 0.5,
+                        retry_max_delay: float = 30.,
+                        stats: Optional[Dict[str, Dict[str, int]]] = None,
+                        journal: Optional[CrawlJournal] = None,
+                        known_pmids: Optional[Container[str]] = None,
+                        sort: Optional[str] = None,
+                        fields: Optional[Sequence[str]] = None,
+                        ) -> AsyncIterator[ArticleRecord]:
+    """
+    Yields parsed articles as soon as they are ready: search pages are harvested by page workers
+        which hand urls over to article workers right away (no barrier between the search and the article phases).
+        Both phases run on `RetryScheduler`s with a fixed number of workers and backoff on retries
+    :param session_manager:
+    :param query: pubmed search query, or several queries / shards planned by `plan_shards` harvested at once
+        on the same schedulers; the `query` column tells which query an article has been found by
+    :param num_pages: number of pages of every query (shards with a known number of results are harvested fully)
+    :param start_page:
+    :param base_url:
+    :param verbose:
+    :param max_retries: maximum number of retries per search page / article
+    :param max_queued_urls: maximum number of urls waiting for the article workers;
+        page workers wait once it's reached
+    :param num_workers: number of article workers, defaults to the `max_concurrent_requests` of the session manager
+    :param parse_executor: executor parsing article pages off the event loop; pages are parsed inline if None
+    :param backend: parser backend for the search pages (article pages are parsed by the `parse_executor` backend)
+    :param response_cache: on-disk cache of the search and article pages
+    :param dead_letters: list to be extended with the pages / urls failed after all the retries
+    :param retry_base_delay: backoff delay after the first failure, doubled on every next one
+    :param retry_max_delay: upper bound of the backoff delay
+    :param stats: dict to be updated with attempts / retries / failures counters per phase
+    :param journal: crawl journal - harvested pages are skipped, urls harvested but not written yet are fetched first
+    :param known_pmids: refresh mode - pmids scraped before (e.g. `PmidIndex`): search pages sorted newest first
+        are harvested one by one until a page has no new pmids, and only the new articles are fetched
+    :param sort: search results order, `date` (most recent first) by default in the refresh mode
+    :param fields: output columns, all if None: if the search results cover them (`SEARCH_RESULT_COLUMNS`)
+        the article phase is skipped, the search result columns of the fetched articles are added otherwise;
+        the article columns to extract are set by `parse_executor`
+    :return:
+    """
+    base_url = base_url or PUBMED_BASE_URL
+    search_only, summary_fields = split_fields(fields)
+    searches = as_query_shards(query)
+    if known_pmids is not None and len(searches) > 1:
+        raise ValueError("refresh mode takes a single query")
+    if known_pmids is not None and sort is None:
+        sort = 'date'
+    num_workers = num_workers or session_manager.max_concurrent_requests
+    error_on_null_id: bool = True
+    pages = list_search_pages(query, num_pages, start_page)
+    page_queries: Dict[Any, str] = {key: shard.query for key, shard, _ in pages}
+    default_query: Optional[str] = query if isinstance(query, str) else None
+    pending_urls: List[str] = []
+    record_queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued_urls)
+    url_extras: Dict[str, Dict[str, Any]] = {}  # query and search result columns of the urls being fetched
+    if journal is not None:
+        harvested_pages = journal.harvested_pages()
+        pending_extras = journal.pending_extras()
+        pending_urls = list(pending_extras)
+        if search_only:  # the search results aren't journaled - the pages with unwritten articles are harvested again
+            harvested_pages -= journal.pending_pages()
+        else:
+            url_extras.update(pending_extras)
+        pages = [item for item in pages if item[0] not in harvested_pages]
+    resumed_urls: Set[str] = set(pending_urls) if search_only else set()
+
+    async def on_record(url, record):
+        if record is not None:
+            record.update(url_extras.pop(url, None) or {'query': default_query})
+            await record_queue.put(record)
+
+    article_scheduler = RetryScheduler(
+        make_task_handler(async_scrape_article_with_semaphore, session_manager), num_workers,
+        max_retries=max_retries, on_result=on_record, capacity=max_queued_urls, base_delay=retry_base_delay,
+        max_delay=retry_max_delay, name='article', verbose=verbose)
+
+    async def put_urls(urls):
+        for url in urls:
+            await article_scheduler.put(url, (url, verbose, error_on_null_id, parse_executor, response_cache))
+
+    # shards may overlap (an article has both print and electronic publication dates), results shift while paging
+    harvested_pmids: Set[str] = set()
+    paging_done = asyncio.Event()
+
+    async def on_urls(page_key, results):
+        # urls of the page, or its search results if their columns are needed
+        summaries = {result['url']: result for result in results} if results and not isinstance(results[0], str) \
+            else {}
+        urls = list(summaries) if summaries else results
+        urls = [url for url in urls if pmid_from_url(url) not in harvested_pmids
+                and (known_pmids is None or pmid_from_url(url) not in known_pmids)]
+        harvested_pmids.update(map(pmid_from_url, urls))
+        if known_pmids is not None and not urls:  # newest first - everything further is known as well
+            paging_done.set()
+            if verbose:
+                print(f"no new articles on page {page_key}, {len(harvested_pmids)} new ones in total")
+        extras = {url: {'query': page_queries[page_key], **{field: summaries[url][field] for field in summary_fields}}
+                  for url in urls}
+        if journal is not None:
+            new_urls = set(journal.record_page(page_key, urls, extras))
+            urls = [url for url in urls if url in new_urls or url in resumed_urls]
+            resumed_urls.difference_update(urls)
+        if search_only:
+            for url in urls:
+                summaries[url]['query'] = page_queries[page_key]
+                await record_queue.put(summaries[url])
+            return
+        url_extras.update((url, extras[url]) for url in urls)
+        await put_urls(urls)
+
+    num_page_workers = 1 if known_pmids is not None else max(min(num_workers, len(pages)), 1)
+    page_scheduler = RetryScheduler(
+        make_task_handler(extract_results_from_page if search_only or summary_fields else extract_urls_from_page,
+                          session_manager), num_page_workers,
+        max_retries=max_retries, on_result=on_urls, base_delay=retry_base_delay, max_delay=retry_max_delay,
+        name='search', verbose=verbose)
+
+    async def drive():
+        article_scheduler.start()
+        page_scheduler.start()
+        if not search_only:
+            await put_urls(pending_urls)
+        for page_key, shard, page in pages:
+            params: Dict[str, str] = {'term': shard.term.replace(" ", "+"), 'page': str(page)}
+            if sort:
+                params['sort'] = sort
+            await page_scheduler.put(page_key, (base_url, params, verbose, "html.parser", backend, response_cache))
+            if known_pmids is not None:  # one page at a time - the next one is needed only if this one had new pmids
+                await page_scheduler.join()
+                if paging_done.is_set():
+                    break
+                page_scheduler.start()
+        await page_scheduler.join()
+        await article_scheduler.join()
+
+    async for record in drain_records(record_queue, drive, (page_scheduler, article_scheduler),
+                                      dead_letters=dead_letters, verbose=verbose, stats=stats):
+        yield record
+
+
+async def iter_eutils_articles(session_manager: AsyncUserAgentManager,
+                               query: Union[str, Sequence[Union[str, QueryShard]]],
+                               max_records: Optional[int] = None,
+                               start: int = 0,
+                               base_url: Optional[str] = None,
+                               pubmed_url: Optional[str] = None,
+                               batch_size: int = 200,
+                               api_key: Optional[str] = None,
+                               email: Optional[str] = None,
+                               sort: Optional[str] = None,
+                               verbose: bool = False,
+                               max_retries: int = 10,
+                               max_queued_records: int = 1000,
+                               dead_letters: Optional[List[Dict[str, Any]]] = None,
+                               retry_base_delay: float = 0.5,
+                               retry_max_delay: float = 30.,
+                               stats: Optional[Dict[str, Dict[str, int]]] = None,
+                               journal: Optional[CrawlJournal] = None,
+                               ) -> AsyncIterator[ArticleRecord]:
+    """
+    Yields articles fetched with the E-utilities: an esearch per query stores its results on the history server,
+        then efetch requests get them in batches of `batch_size` pmids and the xml is parsed with iterparse.
+        Records have the same columns as the html scraping gives
+    :param session_manager:
+    :param query: pubmed search query, or several queries / shards planned by `plan_shards` fetched at once
+    :param max_records: maximum number of records of every query, all the results (up to `EUTILS_MAX_RECORDS`)
+        if None; shards with a known number of results are fetched fully
+    :param start: index of the first record of every query
+    :param base_url: E-utilities base url
+    :param pubmed_url: base of the `url` column
+    :param batch_size: number of records per efetch request
+    :param api_key: NCBI api key
+    :param email: contact email sent along with the requests
+    :param sort: esearch sort order, e.g. `pub_date`
+    :param verbose:
+    :param max_retries:
+    :param max_queued_records: maximum number of records waiting for the consumer
+    :param dead_letters: list to be extended with the batches failed after all the retries
+    :param retry_base_delay:
+    :param retry_max_delay:
+    :param stats: dict to be updated with attempts / retries / failures counters per phase
+    :param journal: crawl journal - fetched batches (keyed by `retstart` or by the shard and `retstart`) are skipped,
+        records fetched but not written yet are fetched again by their pmids
+    :return:
+    """
+    base_url = (base_url or EUTILS_BASE_URL).rstrip('/')
+    pubmed_url = pubmed_url or PUBMED_BASE_URL
+    searches = as_query_shards(query)
+    default_query: Optional[str] = query if isinstance(query, str) else None
+    common_params = eutils_params(api_key, email)
+    search_params = dict(common_params, usehistory='y', retmax='0')
+    if sort:
+        search_params['sort'] = sort
+
+    search_tasks = {i: (base_url, dict(search_params, term=shard.term), verbose) for i, shard in enumerate(searches)}
+    histories = await process_tasks_with_retry(esearch_history, search_tasks, max_retries, session_manager,
+                                               verbose=verbose, dead_letters=dead_letters)
+    # (batch key, query, WebEnv, query_key, retstart, retmax); a single query keeps plain retstarts as the keys
+    batches: List[Tuple[Any, str, str, str, int, int]] = []
+    for i, shard in enumerate(searches):
+        if i not in histories:
+            continue
+        count, webenv, query_key = histories[i]
+        shard_start, stop = (start, min(count, EUTILS_MAX_RECORDS)) if shard.count is None \
+            else (0, min(count, EUTILS_MAX_RECORDS))
+        if count > EUTILS_MAX_RECORDS:
+            print(f"query={shard.term} has {count} results, only the first {EUTILS_MAX_RECORDS} are available")
+        if shard.count is None and max_records is not None:
+            stop = min(stop, start + max_records)
+        batches.extend((retstart if isinstance(query, str) else f"{shard.term} retstart={retstart}", shard.query,
+                        webenv, query_key, retstart, min(batch_size, stop - retstart))
+                       for retstart in range(shard_start, stop, batch_size))
+        if verbose:
+            print(f"got {count} results for query={shard.term}, fetching {max(stop - shard_start, 0)}")
+    pending_pmids: List[str] = []
+    pending_queries: Dict[str, Optional[str]] = {}  # url -> query of the records fetched but not written yet
+    if journal is not None:
+        harvested_batches = journal.harvested_pages()
+        batches = [batch for batch in batches if batch[0] not in harvested_batches]
+        pending_queries = {url: extras.get('query') for url, extras in journal.pending_extras().items()}
+        pending_pmids = [pmid_from_url(url) for url in pending_queries]
+    batch_queries: Dict[Any, str] = {batch[0]: batch[1] for batch in batches}
+    if verbose:
+        print(f"fetching {len(batches)} batches and {len(pending_pmids)} pending records")
+
+    record_queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued_records)
+    fetched_pmids: Set[str] = set()  # shards may overlap: an article has both print and electronic dates
+
+    async def on_records(batch_key, records):
+        if journal is not None and not isinstance(batch_key, tuple):  # pending pmids batches are keyed by tuples
+            journal.record_page(batch_key, [record['url'] for record in records],
+                                {record['url']: {'query': batch_queries[batch_key]} for record in records})
+        for record in records:
+            if record['pmid'] is not None:
+                if record['pmid'] in fetched_pmids:
+                    continue
+                fetched_pmids.add(record['pmid'])
+            record['query'] = batch_queries[batch_key] if batch_key in batch_queries \
+                else pending_queries.get(record['url'], default_query)
+            await record_queue.put(record)
+
+    fetch_scheduler = RetryScheduler(
+        make_task_handler(efetch_articles, session_manager),
+        max(min(session_manager.max_concurrent_requests, len(batches) + len(pending_pmids) // batch_size), 1),
+        max_retries=max_retries,
+        on_result=on_records, base_delay=retry_base_delay, max_delay=retry_max_delay, name='efetch', verbose=verbose)
+
+    async def drive():
+        fetch_scheduler.start()
+        for i in range(0, len(pending_pmids), batch_size):
+            params = dict(common_params, id=','.join(pending_pmids[i:i + batch_size]), retmode='xml')
+            await fetch_scheduler.put(('pmids', i), (base_url, params, verbose, pubmed_url))
+        for batch_key, _, webenv, query_key, retstart, retmax in batches:
+            params = dict(common_params, WebEnv=webenv, query_key=query_key, retstart=str(retstart),
+                          retmax=str(retmax), retmode='xml')
+            await fetch_scheduler.put(batch_key, (base_url, params, verbose, pubmed_url))
+        await fetch_scheduler.join()
+
+    async for record in drain_records(record_queue, drive, (fetch_scheduler,),
+                                      dead_letters=dead_letters, verbose=verbose, stats=stats):
+        yield record
+
+
+async def run_worker(work_queue: WorkQueue, session_manager: AsyncUserAgentManager, worker_id: str, filepath: Path,
+                     base_url: Optional[str] = None, verbose: bool = False,
+                     parse_executor: Optional[ParseExecutor] = None, backend: str = 'bs4',
+                     response_cache: Optional[ResponseCache] = None, batch_size: int = 1000,
+                     rows_per_file: int = 10_000, sort: Optional[str] = None, heartbeat_interval: float = 30.,
+                     poll_interval: float = 0.5, sink_kwargs: Optional[Dict[str, Any]] = None,
+                     fields: Optional[Sequence[str]] = None) -> Counter:
+    """
+    Processes the tasks of the shared work queue until all of them are done or failed: search pages put their
+        article urls to the queue, articles are parsed and written to the `{filepath stem}-part-N` files.
+        An article task is marked as processed once its record is buffered and done once its file is closed
+        and recorded in the queue, the leases are kept alive meanwhile, so the tasks of a killed worker go to
+        the other ones
+    :param work_queue:
+    :param session_manager:
+    :param worker_id: unique name of the worker
+    :param filepath: output path of the worker, the records go to its part files
+    :param base_url:
+    :param verbose:
+    :param parse_executor:
+    :param backend: parser backend for the search pages
+    :param response_cache:
+    :param batch_size: rows per row group
+    :param rows_per_file:
+    :param sort: search results order
+    :param heartbeat_interval: seconds between the lease renewals, must be well below the lease timeout
+    :param poll_interval: seconds between the queue checks while there is nothing to lease
+    :param sink_kwargs: output schema / compression options of `ParquetSink`
+    :param fields: output columns, all if None; the search result ones travel with the article tasks
+    :return: counters of the processed tasks
+    """
+    from scraping.sinks import ParquetSink
+
+    base_url = base_url or PUBMED_BASE_URL
+    _, summary_fields = split_fields(fields)
+    stats: Counter = Counter()
+    concurrency = session_manager.max_concurrent_requests
+    sink = ParquetSink(filepath, batch_size=batch_size, rows_per_file=rows_per_file,
+                       first_part=max(ParquetSink.find_parts(filepath), default=-1) + 1,
+                       on_file_closed=lambda path, urls: work_queue.complete_file(path.name, 'article', urls),
+                       **(sink_kwargs or {}))
+
+    async def handle(lease: Lease):
         client_session = await session_manager.get_client_session()
-        task = asyncio.create_task(task_executor(session_manager.semaphore, client_session, *other_params))
-        task.set_name(str(ident))
-        task_map[ident] = task
-        errors_map[ident] = 0
-
-    pending_tasks = list(task_map.values())
-    results = []
-
-    while pending_tasks:  # wait till the first exception and then handle it - it's likely to be the 429 error
-        done_tasks, pending_tasks = await asyncio.wait(pending_tasks, return_when=asyncio.FIRST_EXCEPTION)
-        for done_task in done_tasks:
-            # try to catch the one with exception
-            if done_task.exception() is None:
-                # task_id, task_result = done_task.result()
-                task_result = done_task.result()
-                results.append(task_result)
+        request_limiter = session_manager.request_limiter
+        try:
+            if lease.kind == 'search':
+                params = {'term': lease.payload['term'].replace(" ", "+"), 'page': str(lease.payload['page'])}
+                if sort:
+                    params['sort'] = sort
+                if summary_fields:
+                    results = await extract_results_from_page(request_limiter, client_session, base_url, params,
+                                                              verbose, "html.parser", backend, response_cache)
+                    payloads = [{'url': result['url'], 'query': lease.payload['query'],
+                                 **{field: result[field] for field in summary_fields}} for result in results]
+                else:
+                    urls = await extract_urls_from_page(request_limiter, client_session, base_url, params, verbose,
+                                                        "html.parser", backend, response_cache)
+                    payloads = [{'url': url, 'query': lease.payload['query']} for url in urls]
+                work_queue.put('article', [(payload['url'], payload) for payload in payloads])
+                work_queue.complete('search', [lease.key])
             else:
-                # show exception in the console
-                task_exc_info = done_task.exception()
-                logging.error(f"during processing got exception", exc_info=task_exc_info)
-                # find the exact parameters to send task again to be pended
-                done_task_name: str = done_task.get_name()
-                done_task_name.isdigit(), f"done task wasn't a digit: {done_task_name}"
-                identifier = int(done_task_name)
-                # ideally it must be in the task_map keys but for operational purposes check it there
-                if identifier in task_map:
-                    task = task_map[identifier]
-                    # cancel task
-                    task.cancel()
-                    # clean up the memory
-                    del task_map[identifier]
-                    # find parameters
-                    other_params = task_params[identifier]
-                    # check for max retries limit:
-                    if errors_map[identifier] < max_retries:
-                        client_session = await session_manager.get_client_session()
-                        new_task = asyncio.create_task(
-                            task_executor(session_manager.semaphore, client_session, *other_params))
-                        new_task.set_name(str(identifier))
-                        task_map[identifier] = new_task
-                        errors_map[identifier] += 1
-                        if isinstance(pending_tasks, list):
-                            pending_tasks.append(new_task)
-                        elif isinstance(pending_tasks, set):
-                            pending_tasks.add(new_task)
-                        else:
-                            raise NotImplementedError(f"unknown type for pending_tasks variable={type(pending_tasks)}")
-                    else:  # if it exceeds - leave any attempts to access the resource and leave the task "done"
-                        if verbose:
-                            print((f"leaving attempts to execute {task_executor.__name__} coroutine due to "
-                                   f"current retries {errors_map[identifier]} >= {max_retries},"
-                                   f"identifiers={identifier}, parameters (except session and semaphore): {other_params}"))
-    return results
+                record = await async_scrape_article_with_semaphore(request_limiter, client_session,
+                                                                   lease.payload['url'], verbose, True,
+                                                                   parse_executor, response_cache)
+                if record is None:
+                    work_queue.complete('article', [lease.key])
+                else:
+                    record.update((key, value) for key, value in lease.payload.items() if key != 'url')
+                    # the write may close a file and complete the task right away, `mark_processed` skips it then
+                    sink.write(record)
+                    METRICS.inc('records_total')
+                    work_queue.mark_processed(worker_id, 'article', [lease.key])
+        except Exception as exc:
+            retried = work_queue.fail(worker_id, lease.kind, lease.key, repr(exc))
+            events.warning('attempt_failed', worker=worker_id, kind=lease.kind, item=lease.key,
+                           attempt=lease.attempts, retried=retried, error=repr(exc))
+            if retried:
+                stats['retries'] += 1
+                METRICS.inc('retries_total', scheduler=lease.kind)
+            else:
+                stats['failed'] += 1
+                METRICS.inc('items_total', scheduler=lease.kind, outcome='failed')
+            return
+        stats[lease.kind] += 1
+        METRICS.inc('items_total', scheduler=lease.kind, outcome='succeeded')
+        METRICS.observe('item_attempts', lease.attempts, ATTEMPT_BUCKETS, scheduler=lease.kind)
+
+    async def keep_leases():
+        while True:
+            await asyncio.sleep(heartbeat_interval)
+            work_queue.heartbeat(worker_id)
+
+    heartbeat = asyncio.create_task(keep_leases())
+    in_flight: Set[asyncio.Task] = set()
+    try:
+        while True:
+            if concurrency - len(in_flight) >= max(concurrency // 4, 1) or not in_flight:
+                for lease in work_queue.lease(worker_id, concurrency - len(in_flight)):
+                    in_flight.add(asyncio.create_task(handle(lease)))
+            if in_flight:
+                _, in_flight = await asyncio.wait(in_flight, timeout=poll_interval,
+                                                  return_when=asyncio.FIRST_COMPLETED)
+                continue
+            # nothing to do now: make the buffered records durable instead of holding their tasks while waiting
+            sink.roll()
+            if work_queue.unfinished() == 0 and sum(work_queue.counts().values()):  # wait for the coordinator
+                break
+            await asyncio.sleep(poll_interval)
+    finally:
+        heartbeat.cancel()
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(heartbeat, *in_flight, return_exceptions=True)
+        sink.close()
+    print(f"worker {worker_id}: {dict(stats)}, {sink.num_rows} rows written to {len(sink.paths)} files")
+    return stats
+
+
+async def run_coordinator(work_queue: WorkQueue, query: Union[str, Sequence[Union[str, QueryShard]]],
+                          num_pages: int, start_page: int, parts_dir: Path,
+                          sink: Union[ParquetSink, PartitionedParquetSink],
+                          start_worker: Optional[Callable[[str], multiprocessing.Process]] = None,
+                          num_processes: int = 1, poll_interval: float = 1., report_interval: float = 10.,
+                          verbose: bool = False) -> int:
+    """
+    Puts the search pages into the shared work queue, starts `num_processes` local worker processes
+        (workers on other machines may join with `--role worker`), waits for all the tasks to be done or failed
+        requeueing the expired leases and restarting died workers, then merges the part files of the workers
+        into the output: the ones recorded in the queue as closed, a killed worker may leave a torn one behind
+    :param work_queue:
+    :param query: query, queries or shards, see `iter_articles`
+    :param num_pages:
+    :param start_page:
+    :param parts_dir: directory with the part files of the workers
+    :param sink: output the deduplicated rows of the part files are written to
+    :param start_worker: starts a worker process with the given id
+    :param num_processes: number of local workers
+    :param poll_interval:
+    :param report_interval: seconds between the progress messages
+    :param verbose:
+    :return: number of rows of the merged output
+    """
+    pages = list_search_pages(query, num_pages, start_page)
+    added = work_queue.put('search', [(str(key), {'term': shard.term, 'page': page, 'query': shard.query})
+                                      for key, shard, page in pages], priority=1)
+    print(f"{added} search pages queued, queue: {work_queue.counts()}")
+
+    host = socket.gethostname()
+    workers: Dict[str, multiprocessing.Process] = {}
+    if start_worker is not None:
+        workers = {f"{host}-{i}": start_worker(f"{host}-{i}") for i in range(num_processes)}
+    restarts = 0
+    last_report = time.monotonic()
+    while True:
+        requeued = work_queue.requeue_expired()
+        if requeued:
+            print(f"{requeued} tasks with expired leases requeued")
+        if work_queue.unfinished() == 0:
+            break
+        for worker_id, process in list(workers.items()):
+            if process.is_alive() or process.exitcode == 0:
+                continue
+            del workers[worker_id]
+            if restarts < 3 * num_processes:  # under a new id - its tasks are leased again once their leases expire
+                restarts += 1
+                print(f"worker {worker_id} exited with code {process.exitcode}, starting a new one")
+                new_id = f"{host}-r{restarts}"
+                workers[new_id] = start_worker(new_id)
+        if start_worker is not None and num_processes and not workers:
+            raise RuntimeError(f"all the workers have failed, queue: {work_queue.counts()}")
+        if verbose or time.monotonic() - last_report > report_interval:
+            print(f"queue: {work_queue.counts()}")
+            last_report = time.monotonic()
+        await asyncio.sleep(poll_interval)
+    for process in workers.values():
+        await asyncio.get_running_loop().run_in_executor(None, process.join)
+
+    from scraping.sinks import iter_unique_row_groups
+
+    paths = [parts_dir / name for name in work_queue.completed_files()]
+    left_out = sorted(set(parts_dir.glob("*.parquet")).difference(paths))
+    if left_out:
+        print(f"{len(left_out)} part files not closed by their workers are left out: "
+              f"{', '.join(path.name for path in left_out)}")
+    for table in iter_unique_row_groups(paths, sink.key_column, sink.schema):
+        sink.write_table(table)
+    sink.close()
+    print(f"queue: {work_queue.counts()}, {sink.num_rows} rows of {len(paths)} part files merged")
+    return sink.num_rows
+
+
+def open_output_sink(config: 'StepByStepConfig', filepath: Path, batch_size: int, **kwargs) \
+        -> Union[ParquetSink, PartitionedParquetSink]:
+    """
+    :param config:
+    :param filepath: output file, the partitioned dataset goes to the directory of the same name without the suffix
+    :param batch_size: rows per row group
+    :param kwargs: other sink parameters, e.g. `rows_per_file` and `on_file_closed`;
+        `first_part` is ignored by the dataset - every partition continues after its existing files
+    :return:
+    """
+    from scraping.sinks import ParquetSink, PartitionedParquetSink
+
+    kwargs = dict(output_options(config), **kwargs)
+    if config.output_format == 'dataset':
+        kwargs.pop('first_part', None)
+        kwargs.setdefault('rows_per_file', config.rows_per_file)
+        # the year comes from the publication date, which may not be among the output fields
+        partition_by = [column for column in config.partition_by
+                        if column != 'year' or 'published_date' in kwargs['schema'].names]
+        return PartitionedParquetSink(filepath.with_suffix(''), partition_by, batch_size=batch_size,
+                                      max_open_files=config.max_open_files, **kwargs)
+    return ParquetSink(filepath, batch_size=batch_size, **kwargs)
+
+
+def normalize_output(config: 'StepByStepConfig', filepath: Path) -> int:
+    """
+    Runs the normalization over the output files written before, e.g. after the citation rules have changed;
+        the rows keep their files (and partitions), which are replaced one by one
+    :param config:
+    :param filepath: output file, see `open_output_sink`
+    :return: number of the rows normalized
+    """
+    from scraping.normalize import normalize_parquet_file
+    from scraping.sinks import ParquetSink, find_dataset_files
+
+    paths = find_dataset_files(filepath.with_suffix('')) + ([filepath] if filepath.exists() else []) \
+        + list(ParquetSink.find_parts(filepath).values())
+    num_rows = 0
+    s0 = time.time()
+    for path in paths:
+        num_rows += normalize_parquet_file(path, compression=config.compression,
+                                           compression_level=config.compression_level)
+    print(f"normalized {num_rows} rows of {len(paths)} files in {time.time() - s0:.3f} sec")
+    return num_rows
+
+
+def output_options(config: 'StepByStepConfig') -> Dict[str, Any]:
+    """
+    :return: schema and compression parameters of the sinks
+    """
+    from scraping.schema import OUTPUT_SCHEMAS, project_schema
+
+    # the string schema goes through the normalization as well - it gives the columns split from the citation
+    return dict(schema=project_schema(OUTPUT_SCHEMAS[config.output_schema], config.fields),
+                compression=config.compression, compression_level=config.compression_level)
 
 
 async def async_search_pubmed(session_manager: AsyncUserAgentManager,
@@ -149,48 +926,109 @@ async def async_search_pubmed(session_manager: AsyncUserAgentManager,
                               base_url: Optional[str] = None,
                               verbose: bool = False,
                               max_retries: int = 10,
-                              ) -> List[OrderedDict]:
-    base_url = base_url or PUBMED_BASE_URL
-
-    term = query.replace(" ", "+")
-
-    page_task_params_map: Dict[int, Any] = {}
-    for page in range(start_page, start_page + num_pages + 1):
-        params: Dict[str, str] = {'term': term, 'page': str(page)}
-        func_params = (base_url, params)  # , verbose)
-        page_task_params_map[page] = func_params
-
-    raw_urls_to_process: List[List[str]] = await process_tasks_with_retry(
-        extract_urls_from_page, page_task_params_map, max_retries=max_retries,
-        session_manager=session_manager)
+                              known_pmids: Optional[Container[str]] = None,
+                              schema: Optional[pa.Schema] = None,
+                              ) -> pa.Table:
+    """
+    :param known_pmids: refresh mode - only the articles published after the known ones are scraped,
+        see `iter_articles`
+    :param schema: columns to give, the parsed strings with the citation split (`RAW_ARTICLE_SCHEMA`) by default
+    :return: the articles collected column by column, no object per article is kept
+    """
+    from scraping.normalize import normalize_table, raw_schema
+    from scraping.schema import RAW_ARTICLE_SCHEMA
+    from scraping.sinks import ColumnarAccumulator
 
-    urls_to_process = flatten_container(raw_urls_to_process)
-    print("*"*50)
-    print(f"got {len(urls_to_process)} urls to process for `num_pages`={num_pages}")
+    schema = schema or RAW_ARTICLE_SCHEMA
+    accumulator = ColumnarAccumulator(raw_schema(schema), chunk_size=1000)
+    async for record in iter_articles(session_manager, query, num_pages, start_page, base_url=base_url,
+                                      verbose=verbose, max_retries=max_retries, known_pmids=known_pmids):
+        accumulator.append(record)
     print("*" * 50)
-    error_on_null_id: bool = True
-    url_task_params_map: Dict[int, Any] = {}
-    for url_num, url in enumerate(urls_to_process):
-        url_task_params_map[url_num] = (url, verbose, error_on_null_id)
+    print(f"got {len(accumulator)} articles for `num_pages`={num_pages}")
+    print("*" * 50)
+    return normalize_table(accumulator.to_table(), schema)
 
-    parsed_url: List[OrderedDict[str, Any]] = await process_tasks_with_retry(
-        async_scrape_article_with_semaphore, url_task_params_map, max_retries=max_retries,
-        session_manager=session_manager)
 
-    return parsed_url
+class EgressRouteConfig(pydantic.BaseModel):
+    """
+    `EgressRoute` parameters: an http proxy, a local source address or neither (the direct connection)
+    """
+    proxy: Optional[str] = None
+    local_address: Optional[str] = None
+    max_rate: Optional[pydantic.PositiveFloat] = None
+    max_concurrency: Optional[pydantic.PositiveInt] = None
+    name: Optional[str] = None
 
 
 class StepByStepConfig(pydantic.BaseModel):
     max_agents_num: pydantic.PositiveInt
     max_concurrent_requests: pydantic.PositiveInt
-    query: str
+    query: Optional[str] = None
     num_pages: pydantic.PositiveInt
     start_page: int
     max_retries: pydantic.PositiveInt
     verbose: bool
     user_agents_list_path: str
     check_interval: pydantic.PositiveFloat
+    session_health_checks: bool = False
     output_dir: str
+    batch_size: pydantic.PositiveInt = 1000
+    parse_mode: Literal['inline', 'thread', 'process'] = 'inline'
+    parse_workers: Optional[pydantic.PositiveInt] = None
+    parse_batch_size: pydantic.PositiveInt = 8
+    parser_backend: Literal['bs4', 'lxml'] = 'bs4'
+    cache_path: Optional[str] = None
+    cache_max_bytes: pydantic.PositiveInt = 1024 ** 3
+    cache_search_ttl: float = DEFAULT_TTLS['search']
+    cache_article_ttl: float = DEFAULT_TTLS['article']
+    adaptive_rate_limit: bool = False
+    max_requests_per_second: pydantic.PositiveFloat = 10.
+    retry_base_delay: pydantic.NonNegativeFloat = 0.5
+    retry_max_delay: pydantic.NonNegativeFloat = 30.
+    shared_session: bool = True
+    connection_pool_size: pydantic.PositiveInt = 100
+    keepalive_timeout: pydantic.PositiveFloat = 30.
+    dns_cache_ttl: Optional[pydantic.NonNegativeInt] = 300
+    fetch_backend: Literal['html', 'eutils'] = 'html'
+    pubmed_base_url: str = PUBMED_BASE_URL
+    eutils_base_url: str = EUTILS_BASE_URL
+    eutils_batch_size: pydantic.PositiveInt = 200
+    eutils_api_key: Optional[str] = None
+    eutils_email: Optional[str] = None
+    checkpoint: bool = False
+    rows_per_file: pydantic.PositiveInt = 10_000
+    refresh: bool = False
+    queries: Optional[List[str]] = None
+    shard_by_date: bool = False
+    work_queue_backend: str = 'sqlite'
+    work_queue_path: Optional[str] = None
+    worker_processes: pydantic.NonNegativeInt = 2
+    lease_timeout: pydantic.PositiveFloat = 120.
+    metrics_port: Optional[pydantic.PositiveInt] = None
+    metrics_host: str = '127.0.0.1'
+    metrics_summary: bool = True
+    output_schema: Literal['typed', 'string'] = 'typed'
+    output_format: Literal['file', 'dataset'] = 'dataset'
+    partition_by: List[Literal['query', 'year']] = ['query', 'year']
+    max_open_files: pydantic.PositiveInt = 64
+    compression: Literal['zstd', 'snappy', 'gzip', 'brotli', 'lz4', 'none'] = 'zstd'
+    compression_level: Optional[int] = None
+    log_events_per_second: pydantic.PositiveFloat = 1.
+    fields: Optional[List[str]] = None
+    egress_routes: List[EgressRouteConfig] = []
+    egress_error_threshold: float = pydantic.Field(0.5, gt=0., le=1.)
+    egress_quarantine_seconds: pydantic.PositiveFloat = 30.
+
+    @property
+    def all_queries(self) -> List[str]:
+        return list(dict.fromkeys(([self.query] if self.query else []) + (self.queries or [])))
+
+    @pydantic.model_validator(mode='after')
+    def validate_queries(self):
+        if not self.all_queries:
+            raise ValueError("either `query` or `queries` must be given")
+        return self
 
     # v1 style:
     # @pydantic.validator('start_page')
@@ -203,19 +1041,127 @@ class StepByStepConfig(pydantic.BaseModel):
         return value
 
 
-async def main():
+def _override_argument(name: str, field: pydantic.fields.FieldInfo) -> Dict[str, Any]:
+    """
+    :return: `add_argument` parameters of the command line override of the config field; the values are kept as
+        strings, the config validation converts them
+    """
+    annotation = field.annotation
+    optional = typing.get_origin(annotation) is Union and type(None) in typing.get_args(annotation)
+    if optional:
+        annotation = next(arg for arg in typing.get_args(annotation) if arg is not type(None))
+    kwargs: Dict[str, Any] = dict(dest=name, default=argparse.SUPPRESS)
+    if not field.is_required():
+        kwargs['help'] = f"default: {field.default}"
+    item = typing.get_args(annotation)[0] if typing.get_origin(annotation) in (list, List) else None
+    if annotation is bool:
+        kwargs['action'] = argparse.BooleanOptionalAction
+    elif isinstance(item, type) and issubclass(item, pydantic.BaseModel):
+        kwargs.update(type=json.loads, metavar='JSON', help="json list of objects")
+    elif item is not None:
+        kwargs['nargs'] = '*'
+        if typing.get_origin(item) is Literal:
+            kwargs['choices'] = typing.get_args(item)
+    elif typing.get_origin(annotation) is Literal:
+        kwargs['choices'] = typing.get_args(annotation) + (('null',) if optional else ())
+    return kwargs
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    :param argv: `sys.argv[1:]` by default
+    :return: the arguments with `config_overrides` - the config fields given on the command line,
+        and `config_given` - whether `--config` is
+    """
     current_file = Path(__file__)
-    configs_dir = current_file.parents[0] / 'configs'
-    config_filepath = configs_dir / (current_file.stem + '.yaml')
-    if config_filepath.exists() is False:
+    arg_parser = argparse.ArgumentParser(description="Asynchronous pubmed scraper")
+    arg_parser.add_argument('--config', type=Path, default=None,
+                            help=f"path to the yaml config, configs/{current_file.stem}.yaml by default; "
+                                 f"may be left out if the command line gives the required fields")
+    arg_parser.add_argument('--print-config', action='store_true',
+                            help="print the resolved config as yaml and exit")
+    arg_parser.add_argument('--resume', action='store_true',
+                            help="continue the crawl recorded in the journal instead of starting from scratch")
+    arg_parser.add_argument('--refresh', action='store_true',
+                            help="scrape only the articles published since the previous runs, "
+                                 "appending them to the output as a new part")
+    arg_parser.add_argument('--role', choices=('local', 'coordinator', 'worker'), default='local',
+                            help="`local` runs the whole crawl in this process; `coordinator` fills the shared work "
+                                 "queue, starts `worker_processes` workers and merges their output; "
+                                 "`worker` processes the queue (e.g. on another machine)")
+    arg_parser.add_argument('--worker-id', default=None, help="unique worker name, `{hostname}-{pid}` by default")
+    arg_parser.add_argument('--normalize', action='store_true',
+                            help="normalize the output of the previous runs again (citations, dates, keywords) "
+                                 "instead of scraping, nothing is fetched")
+    overrides = arg_parser.add_argument_group(
+        'config overrides', "every field of the yaml config, taking precedence over it; "
+                            "`null` unsets the optional ones")
+    fields = [name for name in StepByStepConfig.model_fields if name not in vars(arg_parser.parse_args([]))]
+    for name in fields:
+        overrides.add_argument(f"--{name.replace('_', '-')}",
+                               **_override_argument(name, StepByStepConfig.model_fields[name]))
+
+    args = arg_parser.parse_args(argv)
+    args.config_given = args.config is not None
+    if args.config is None:
+        args.config = current_file.parents[0] / 'configs' / (current_file.stem + '.yaml')
+    args.config_overrides = {}
+    for name in fields:
+        if hasattr(args, name):
+            value = vars(args).pop(name)
+            if value in ('null', 'none', ['null'], ['none']) and not StepByStepConfig.model_fields[name].is_required():
+                value = None
+            args.config_overrides[name] = value
+    return args
+
+
+def _worker_process_main(args: argparse.Namespace, worker_id: str) -> None:
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    worker_args = parse_args(['--role', 'worker', '--worker-id', worker_id])
+    # the same config as the coordinator, overrides included
+    worker_args.config, worker_args.config_given, worker_args.config_overrides = \
+        args.config, args.config_given, args.config_overrides
+    asyncio.run(main(worker_args))
+
+
+def start_worker_process(args: argparse.Namespace, worker_id: str) -> multiprocessing.Process:
+    process = multiprocessing.get_context('spawn').Process(target=_worker_process_main, name=worker_id,
+                                                           args=(args, worker_id))
+    process.start()
+    return process
+
+
+def load_config(args: argparse.Namespace) -> StepByStepConfig:
+    """
+    :param args: parsed command line, its `config_overrides` take precedence over the yaml config
+    :return: the validated config; without a yaml file at the default path the overrides alone make it
+    """
+    config_filepath: Path = args.config
+    overrides: Dict[str, Any] = getattr(args, 'config_overrides', {})
+    fields: Dict[str, Any] = {}
+    if config_filepath.exists():
+        fields = load_yaml(config_filepath, encoding='utf-8') or {}
+    elif args.config_given or not overrides:
         raise FileNotFoundError(f"not able to find {config_filepath}; try to use "
                                 f"{config_filepath.stem + '.example.yaml'} as starting point")
+    return StepByStepConfig(**{**fields, **overrides})
+
 
-    config = StepByStepConfig(**load_yaml(config_filepath, encoding='utf-8'))
+async def main(args: Optional[argparse.Namespace] = None):
+    args = args or parse_args()
+    config = load_config(args)
+    from scraping.aio import AsyncUserAgentManager
+    from scraping.sinks import ParquetSink, find_dataset_files
+
+    logging.basicConfig(format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger('scraping').setLevel(logging.DEBUG if config.verbose else logging.INFO)
+    events.rate = config.log_events_per_second
 
     max_agents_num: int = config.max_agents_num  # 100
     max_concurrent_requests: int = config.max_concurrent_requests  # 40
-    query = config.query  # "food allergies"
+    queries: List[str] = config.all_queries
+    query = queries[0]  # "food allergies"
     num_pages = config.num_pages  # 1000  # 50
     start_page: int = config.start_page  # 1  # first one was 1
     max_retries: int = config.max_retries  # 10
@@ -223,6 +1169,22 @@ async def main():
     user_agents_list_path: str = config.user_agents_list_path  # ...
     check_interval: float = config.check_interval
     output_dir = config.output_dir
+    batch_size: int = config.batch_size
+    search_only, summary_fields = split_fields(config.fields)
+    if search_only and args.role != 'local':
+        raise ValueError(f"fields={config.fields} are given by the search pages alone, which is supported "
+                         f"by the local role only")
+    if summary_fields and config.fetch_backend == 'eutils':
+        raise ValueError(f"fields={summary_fields} come from the html search pages, "
+                         f"not available with fetch_backend=eutils")
+    parse_executor = ParseExecutor(config.parse_mode, max_workers=config.parse_workers,
+                                   batch_size=config.parse_batch_size, backend=config.parser_backend,
+                                   fields=None if config.fields is None else
+                                   [field for field in config.fields if field in ARTICLE_COLUMNS])
+    response_cache: Optional[ResponseCache] = None
+    if config.cache_path is not None:
+        response_cache = ResponseCache(config.cache_path, max_bytes=config.cache_max_bytes,
+                                       ttls={'search': config.cache_search_ttl, 'article': config.cache_article_ttl})
 
     output_dir = Path(output_dir).absolute()
     # output_dir.parents[0].mkdir(exist_ok=True)
@@ -231,31 +1193,198 @@ async def main():
     if (start_page + num_pages) > 1001:
         num_pages = max(1000 - start_page, 0)
         print(f"num pages was adjusted to pubmed acceptable {num_pages} value")
+    queries_label = query if len(queries) == 1 else f"{query}_and_{len(queries) - 1}_more"
+    pages_label = "all" if config.shard_by_date else f"{start_page}_pages={num_pages}"
+    save_filepath = output_dir / f"{queries_label.replace(' ', '+')}_pubmed={pages_label}.parquet"
+    if args.normalize:
+        normalize_output(config, save_filepath)
+        return
 
     with open(user_agents_list_path, 'r', encoding='utf-8') as f:
         lines = f.readlines()
         user_agents = [line.strip() for line in lines]
 
+    egress_pool: Optional[EgressPool] = None
+    if config.egress_routes:
+        egress_pool = EgressPool([EgressRoute(**route.model_dump()) for route in config.egress_routes],
+                                 error_threshold=config.egress_error_threshold,
+                                 quarantine_seconds=config.egress_quarantine_seconds)
+        METRICS.add_collector(egress_pool.collect_metrics)
+    rate_limiter: Optional[AdaptiveRateLimiter] = None
+    if config.adaptive_rate_limit:
+        rate_limiter = AdaptiveRateLimiter(max_concurrency=max_concurrent_requests,
+                                           max_rate=config.max_requests_per_second)
     session_manager = AsyncUserAgentManager(user_agents, max_agents_num=max_agents_num,
-                                            max_concurrent_requests=max_concurrent_requests)
-    # # uncomment once .check_session_health code is not empty
-    # await session_manager.start_monitoring(check_url=PUBMED_BASE_URL, check_interval=check_interval)
+                                            max_concurrent_requests=max_concurrent_requests,
+                                            rate_limiter=rate_limiter, shared_session=config.shared_session,
+                                            pool_size=config.connection_pool_size,
+                                            keepalive_timeout=config.keepalive_timeout,
+                                            dns_cache_ttl=config.dns_cache_ttl, egress_pool=egress_pool)
+    dead_letters_filepath = save_filepath.with_name(save_filepath.stem + '_dead_letters.jsonl')
+    journal: Optional[CrawlJournal] = None
+    pmid_index: Optional[PmidIndex] = None
+    sink_kwargs: Dict[str, Any] = {}
+    refresh = config.refresh or args.refresh
+    if refresh and (args.resume or config.fetch_backend != 'html' or len(queries) > 1 or config.shard_by_date):
+        raise ValueError("refresh mode works with a single query and `fetch_backend: html` "
+                         "and can't be combined with --resume")
+    work_queue: Optional[WorkQueue] = None
+    parts_dir = save_filepath.with_name(save_filepath.stem + '.parts')
+    dataset_dir = save_filepath.with_suffix('')
+    if args.role != 'local':  # the work queue keeps the state of the crawl, neither the journal nor the index is used
+        if refresh or config.fetch_backend != 'html':
+            raise ValueError("distributed crawl works with `fetch_backend: html` and without the refresh mode")
+        work_queue = get_work_queue(
+            config.work_queue_backend,
+            path=config.work_queue_path or save_filepath.with_name(save_filepath.stem + '.queue.sqlite'),
+            lease_seconds=config.lease_timeout, max_attempts=max_retries + 1,
+            retry_base_delay=config.retry_base_delay, retry_max_delay=config.retry_max_delay)
+        if args.role == 'coordinator' and not args.resume:
+            work_queue.reset()
+            for path in sorted(parts_dir.glob(f"*{save_filepath.suffix}")):
+                print(f"removing {path} written by the previous run")
+                path.unlink()
+        parts_dir.mkdir(parents=True, exist_ok=True)
+    elif refresh:  # the journal isn't used - the output of the previous runs is kept as is
+        pmid_index = PmidIndex(save_filepath.with_name(save_filepath.stem + '.pmids.sqlite'))
+        parts = ParquetSink.find_parts(save_filepath)
+        read = pmid_index.update_from_files(([save_filepath] if save_filepath.exists() else []) + list(parts.values())
+                                            + find_dataset_files(dataset_dir))
+        print(f"refresh: {len(pmid_index)} pmids known, {len(read)} output files indexed")
+        sink_kwargs = dict(rows_per_file=config.rows_per_file, first_part=max(parts, default=-1) + 1,
+                           on_file_closed=lambda path, urls: pmid_index.add(map(pmid_from_url, urls), path))
+    elif config.checkpoint or args.resume:
+        journal = CrawlJournal(save_filepath.with_name(save_filepath.stem + '.journal.sqlite'))
+        if args.resume:
+            print(f"resuming: {journal.summary()}")
+        else:
+            for path in journal.reset():
+                print(f"removing {path} written by the previous run")
+                path.unlink(missing_ok=True)
+        sink_kwargs = dict(rows_per_file=config.rows_per_file, first_part=journal.next_batch_index(),
+                           on_file_closed=lambda path, urls: journal.record_batch(path, urls))
+    if config.output_format == 'dataset' and args.role != 'worker' and not refresh:
+        # the dataset is appended to by the partitions - drop the previous output, unless the journal resumes it
+        #   (its unfinished files can't be read anyway), the coordinator rebuilds it from the parts every time
+        keep = set(journal.batch_paths()) if journal is not None and args.resume else set()
+        for path in find_dataset_files(dataset_dir):
+            if path not in keep:
+                print(f"removing {path} written by the previous run")
+                path.unlink()
+    if args.role != 'worker':
+        print(f"streaming output to {dataset_dir if config.output_format == 'dataset' else save_filepath}")
+    dead_letters: List[Dict[str, Any]] = []
+    worker_id = args.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    metrics_filepath = parts_dir / f"worker-{worker_id}_metrics.json" if args.role == 'worker' \
+        else save_filepath.with_name(save_filepath.stem + '_metrics.json')
+    METRICS.add_collector(functools.partial(collect_run_metrics, rate_limiter=rate_limiter, work_queue=work_queue))
+    metrics_server: Optional[MetricsServer] = None
+    if config.metrics_port is not None and args.role != 'worker':
+        metrics_server = await MetricsServer(METRICS, config.metrics_host, config.metrics_port).start()
+        print(f"metrics served at http://{config.metrics_host}:{config.metrics_port}/metrics")
     s0 = time.time()
-    results = await async_search_pubmed(session_manager, query, num_pages, start_page, verbose=verbose,
-                                        max_retries=max_retries)
-    await session_manager.shutdown()
+    try:
+        if args.role != 'coordinator' and (egress_pool is not None or config.session_health_checks):
+            check_url = f"{config.eutils_base_url}/esearch.fcgi?db=pubmed&term=pubmed&retmax=0" \
+                if config.fetch_backend == 'eutils' else config.pubmed_base_url
+            await session_manager.start_monitoring(check_url=check_url, check_interval=check_interval)
+        search: Union[str, Sequence[Union[str, QueryShard]]] = query if len(queries) == 1 else queries
+        if config.shard_by_date and args.role != 'worker':
+            base_url = config.eutils_base_url if config.fetch_backend == 'eutils' else config.pubmed_base_url
+            search = await plan_query_shards(session_manager, queries, config.fetch_backend, base_url,
+                                             config.parser_backend, config.eutils_api_key, config.eutils_email,
+                                             response_cache, max_retries, verbose)
+            print(f"{len(search)} date shards planned for {len(queries)} queries, "
+                  f"{sum(shard.count for shard in search)} results in total")
+        if args.role == 'coordinator':
+            with open_output_sink(config, save_filepath, batch_size, transform=None) as sink:
+                await run_coordinator(work_queue, search, num_pages, start_page, parts_dir, sink,
+                                      functools.partial(start_worker_process, args),
+                                      config.worker_processes, verbose=verbose)
+            dead_letters.extend(work_queue.dead_letters())
+            print(f"time needed {time.time() - s0:.3f} sec")
+            return
+        if args.role == 'worker':
+            await run_worker(work_queue, session_manager, worker_id,
+                             parts_dir / f"worker-{worker_id}{save_filepath.suffix}", base_url=config.pubmed_base_url,
+                             verbose=verbose, parse_executor=parse_executor, backend=config.parser_backend,
+                             response_cache=response_cache, batch_size=batch_size, rows_per_file=config.rows_per_file,
+                             heartbeat_interval=config.lease_timeout / 4, sink_kwargs=output_options(config),
+                             fields=config.fields)
+            return
+        with open_output_sink(config, save_filepath, batch_size, **sink_kwargs) as sink:
+            if config.fetch_backend == 'eutils':
+                # the articles range of the html search pages: `num_pages + 1` of them, see `list_search_pages`
+                records = iter_eutils_articles(
+                    session_manager, search, max_records=(num_pages + 1) * RESULTS_PER_PAGE,
+                    start=(start_page - 1) * RESULTS_PER_PAGE,
+                    base_url=config.eutils_base_url, pubmed_url=config.pubmed_base_url,
+                    batch_size=config.eutils_batch_size, api_key=config.eutils_api_key, email=config.eutils_email,
+                    verbose=verbose, max_retries=max_retries, dead_letters=dead_letters,
+                    retry_base_delay=config.retry_base_delay, retry_max_delay=config.retry_max_delay, journal=journal)
+            else:
+                records = iter_articles(session_manager, search, num_pages, start_page, base_url=config.pubmed_base_url,
+                                        verbose=verbose, max_retries=max_retries, parse_executor=parse_executor,
+                                        backend=config.parser_backend, response_cache=response_cache,
+                                        dead_letters=dead_letters, retry_base_delay=config.retry_base_delay,
+                                        retry_max_delay=config.retry_max_delay, journal=journal,
+                                        known_pmids=pmid_index, fields=config.fields)
+            async for record in records:
+                sink.write(record)
+                METRICS.inc('records_total')
+    finally:
+        await session_manager.shutdown()
+        if dead_letters:
+            save_jsonl(dead_letters_filepath, dead_letters)
+            print(f"{len(dead_letters)} items failed after all the retries, see {dead_letters_filepath}")
+        parse_executor.shutdown()
+        if rate_limiter is not None:
+            print(f"rate limiter state at the end: {rate_limiter.snapshot()}, "
+                  f"{len(rate_limiter.history)} (time, concurrency, rate) changes recorded")
+        if egress_pool is not None:
+            for route in egress_pool.snapshot():
+                print(f"egress route {route['name']}: {route['state']}, {route['requests']} requests, "
+                      f"{route['errors']} errors, score={route['score']}")
+        if response_cache is not None:
+            print(response_cache.report())
+            response_cache.close()
+        if journal is not None:
+            print(journal.summary())
+            journal.close()
+        if pmid_index is not None:
+            print(f"refresh: {len(pmid_index)} pmids known after the run")
+            pmid_index.close()
+        if metrics_server is not None:
+            await metrics_server.stop()
+        if config.metrics_summary:
+            summary = METRICS.save_summary(metrics_filepath, role=args.role)
+            print(f"{summary['counters'].get('records_total', 0):.0f} records, "
+                  f"{summary['rates_per_second'].get('records_total', 0.):.2f} records/sec, "
+                  f"metrics summary saved at {metrics_filepath}")
+        if work_queue is not None:
+            work_queue.close()
     print(f"time needed {time.time() - s0:.3f} sec for num_pages={num_pages}")
-    output = pd.DataFrame()
-    for url_res in results:
-        if url_res is not None:
-            output = pd.concat([output, pd.DataFrame([url_res])], axis=0, ignore_index=True)
+    if config.output_format == 'dataset':
+        print(f"saved {sink.num_rows} rows in {sink.num_row_groups} row groups of {len(sink.paths)} files "
+              f"at {dataset_dir}")
+    else:
+        print(f"saved {sink.num_rows} rows in {sink.num_row_groups} row groups at {[str(path) for path in sink.paths]}")
 
-    save_filepath = output_dir / f"{query.replace(' ', '+')}_pubmed={start_page}_pages={num_pages}.parquet"
-    print(f"saving output of shape {output.shape} at path {save_filepath}")
-    output.to_parquet(save_filepath)
 
+def cli(argv: Optional[List[str]] = None) -> None:
+    """
+    Command line entry point, see `parse_args`
+    """
+    args = parse_args(argv)
+    if args.print_config:
+        import yaml
 
-if __name__ == '__main__':
-    if 'win' in sys.platform:
+        print(yaml.safe_dump(load_config(args).model_dump(mode='json'), sort_keys=False), end='')
+        return
+    if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-    asyncio.run(main())
+    asyncio.run(main(args))
+
+
+if __name__ == '__main__':
+    cli()
@@ -1,2 +1,54 @@
-from .common import *
-from .aio import *
+"""
+The names of the modules are resolved on first access (`from scraping import ParquetSink`, `scraping.METRICS`),
+importing just the module defining the name (looked up in `_MODULE_EXPORTS`, which must follow the `__all__`
+of the modules), so that `scraping.common` or `scraping.parsers` alone (e.g. in the parse workers) don't pull
+aiohttp and pyarrow in. `from scraping import *` imports everything
+"""
+import importlib
+
+from typing import Any, Dict, List, Tuple
+
+
+_MODULE_EXPORTS: Dict[str, Tuple[str, ...]] = {
+    'common': ('process_pubmed_page_text', 'extract_urls_from_search_page_text',
+               'extract_results_from_search_page_text', 'extract_results_count_from_search_page_text', 'split_citation',
+               'pmid_from_url', 'clean_text', 'PUBMED_BASE_URL', 'ARTICLE_COLUMNS', 'SEARCH_RESULT_COLUMNS',
+               'CITATION_COLUMNS', 'RESULTS_PER_PAGE', 'MAX_SEARCH_PAGES', 'RECORD_FIELDS', 'ArticleRecord'),
+    'aio': ('AsyncUserAgentManager', 'UserAgentSession', 'RoutedSession'),
+    'normalize': ('raw_schema', 'split_citations', 'parse_published_dates', 'split_keywords_column', 'normalize_table',
+                  'normalize_parquet_file'),
+    'sinks': ('ColumnarAccumulator', 'ParquetSink', 'PartitionedParquetSink', 'iter_unique_row_groups',
+              'merge_parquet_files', 'find_dataset_files', 'HIVE_NULL_PARTITION'),
+    'executors': ('ParseExecutor', 'parse_pages_batch'),
+    'parsers': ('PageParser', 'BeautifulSoupParser', 'LxmlParser', 'PARSER_BACKENDS', 'get_parser'),
+    'cache': ('ResponseCache', 'DEFAULT_TTLS'),
+    'ratelimit': ('AdaptiveRateLimiter', 'RateLimitedError', 'parse_retry_after'),
+    'scheduler': ('RetryScheduler', 'WorkItem', 'backoff_delay'),
+    'eutils': ('EUTILS_BASE_URL', 'EUTILS_MAX_RECORDS', 'parse_esearch_xml', 'iter_efetch_records',
+               'article_element_to_record', 'eutils_params'),
+    'journal': ('CrawlJournal',),
+    'index': ('PmidIndex',),
+    'sharding': ('QueryShard', 'as_query_shards', 'date_range_term', 'split_date_range', 'plan_shards',
+                 'MAX_SHARD_RESULTS', 'EARLIEST_PUBLICATION_DATE'),
+    'workqueue': ('Lease', 'WorkQueue', 'SqliteWorkQueue', 'WORK_QUEUE_BACKENDS', 'get_work_queue'),
+    'metrics': ('Histogram', 'MetricsRegistry', 'MetricsServer', 'EventLogger', 'METRICS', 'events', 'LATENCY_BUCKETS',
+                'ATTEMPT_BUCKETS'),
+    'egress': ('EgressRoute', 'EgressPool'),
+}
+_EXPORTS: Dict[str, str] = {name: module for module, names in _MODULE_EXPORTS.items() for name in names}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    if name in _MODULE_EXPORTS:
+        return importlib.import_module(f".{name}", __name__)
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_EXPORTS))
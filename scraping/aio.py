@@ -1,31 +1,210 @@
 import asyncio
 import random
-from collections import OrderedDict
+import time
+from collections import OrderedDict, Counter
 import aiohttp
 
-from typing import Tuple, List, Union, Iterable, Optional, Any
+from .ratelimit import AdaptiveRateLimiter, parse_retry_after
+from .egress import EgressPool, EgressRoute
+from .metrics import events
 
+from typing import Tuple, List, Union, Iterable, Optional, Any, Dict
 
-__all__ = ['AsyncUserAgentManager']
+
+__all__ = ['AsyncUserAgentManager', 'UserAgentSession', 'RoutedSession']
+
+
+class UserAgentSession:
+    """
+        Lightweight view of a client session of the manager sending requests with its own user agent headers.
+        The session is looked up per request, so the views handed out before a session is reopened use the new one
+    """
+
+    __slots__ = ('manager', 'key', 'headers')
+
+    def __init__(self, manager: 'AsyncUserAgentManager', key: Optional[str], headers: Dict[str, str]):
+        """
+        :param manager:
+        :param key: user agent of the session, None for the shared one
+        :param headers: sent with every request
+        """
+        self.manager = manager
+        self.key = key
+        self.headers = headers
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        return self.manager.get_agent_session(self.key)
+
+    def request(self, method: str, url: str, **kwargs) -> '_TrackedRequest':
+        headers = kwargs.pop('headers', None)
+        session = self.session
+        return _TrackedRequest(self.manager.in_flight, session,
+                               session.request(method, url, headers={**self.headers, **headers} if headers
+                                               else self.headers, **kwargs))
+
+    def get(self, url: str, **kwargs) -> '_TrackedRequest':
+        return self.request('GET', url, **kwargs)
+
+    @property
+    def closed(self) -> bool:
+        return False  # the sessions are reopened on demand
+
+
+class _TrackedRequest:
+    """
+        `async with` context of a request counted in flight of its session till the response is released:
+            a session is never closed under its requests
+    """
+
+    __slots__ = ('in_flight', 'session', '_context')
+
+    def __init__(self, in_flight: Counter, session: aiohttp.ClientSession, context: Any):
+        self.in_flight = in_flight
+        self.session = session
+        self._context = context
+
+    def _release(self) -> None:
+        self.in_flight[self.session] -= 1
+        if self.in_flight[self.session] <= 0:
+            del self.in_flight[self.session]
+
+    async def __aenter__(self) -> aiohttp.ClientResponse:
+        self.in_flight[self.session] += 1
+        try:
+            return await self._context.__aenter__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            await self._context.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._release()
+
+
+class _RoutedRequest:
+    """
+        `async with` context of a request sent through an egress route: the route is acquired on enter,
+            its health is fed with the outcome and it's released on exit
+    """
+
+    __slots__ = ('manager', 'method', 'url', 'kwargs', 'route', 'status', 'latency', 'retry_after', '_context')
+
+    def __init__(self, manager: 'AsyncUserAgentManager', method: str, url: str, kwargs: Dict[str, Any]):
+        self.manager = manager
+        self.method = method
+        self.url = url
+        self.kwargs = kwargs
+        self.route: Optional[EgressRoute] = None
+        self.status: Optional[int] = None
+        self.latency: Optional[float] = None
+        self.retry_after: Optional[float] = None
+        self._context = None
+
+    async def __aenter__(self) -> aiohttp.ClientResponse:
+        pool = self.manager.egress_pool
+        self.route = await pool.acquire()
+        s0 = time.monotonic()
+        try:
+            session = self.manager.get_route_session(self.route)
+            self._context = session.request(self.method, self.url, proxy=self.route.proxy, **self.kwargs)
+            response = await self._context.__aenter__()
+        except BaseException as exc:
+            pool.release(self.route, latency=time.monotonic() - s0,
+                         error=exc if isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError)) else None)
+            raise
+        self.status = response.status
+        self.latency = time.monotonic() - s0
+        self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+        return response
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            await self._context.__aexit__(exc_type, exc_val, exc_tb)
+        finally:
+            # the body may still fail after the headers have come
+            error = exc_val if isinstance(exc_val, (aiohttp.ClientError, asyncio.TimeoutError)) else None
+            self.manager.egress_pool.release(self.route, self.status, self.latency, error, self.retry_after)
+
+
+class RoutedSession:
+    """
+        View of the egress routes sending requests with its own user agent headers:
+            every request goes through the route chosen by the pool at the time it's sent
+    """
+
+    __slots__ = ('manager', 'headers')
+
+    def __init__(self, manager: 'AsyncUserAgentManager', headers: Dict[str, str]):
+        self.manager = manager
+        self.headers = headers
+
+    def request(self, method: str, url: str, **kwargs) -> _RoutedRequest:
+        headers = kwargs.pop('headers', None)
+        kwargs['headers'] = {**self.headers, **headers} if headers else self.headers
+        return _RoutedRequest(self.manager, method, url, kwargs)
+
+    def get(self, url: str, **kwargs) -> _RoutedRequest:
+        return self.request('GET', url, **kwargs)
+
+    @property
+    def closed(self) -> bool:
+        return False  # the route sessions are reopened on demand
 
 
 class AsyncUserAgentManager:
     """
         Provides class responsible for session retrieval
-            as well as their "health" check - if session is not responding it will be reopened
+            as well as their "health" check - if session fails to connect it will be reopened once it's idle.
+        By default all the user agents share a single session (one connection pool with keep-alive and dns cache)
+            and the user agent is rotated per request through the headers;
+            `shared_session=False` gives every user agent its own `aiohttp.ClientSession`.
+        With an `egress_pool` the requests leave through its routes (proxies / local addresses),
+            one session per route, the user agent is still rotated through the headers
     """
 
     USER_AGENT_KEY: str = 'User-Agent'
+    # extend headers with some additional info
+    #   https://stackoverflow.com/a/74674276
+    DEFAULT_HEADERS: Dict[str, str] = {'Accept-Language': 'en-US,en;q=0.5'}
 
     def __init__(self, user_agents: Iterable[str], max_agents_num: int = 100,
                  max_concurrent_requests: int = 30,
-                 do_shutdown: bool = False):
+                 do_shutdown: bool = False,
+                 rate_limiter: Optional[AdaptiveRateLimiter] = None,
+                 shared_session: bool = True,
+                 pool_size: int = 100,
+                 keepalive_timeout: float = 30.,
+                 dns_cache_ttl: Optional[int] = 300,
+                 trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+                 egress_pool: Optional[EgressPool] = None):
         self._user_agents = random.choices(tuple(user_agents), k=max_agents_num)
         self.agent_index = 0
         self.client_sessions: OrderedDict[str, aiohttp.ClientSession] = OrderedDict()
-        self.lock = asyncio.Lock()
+        self.shared_session = shared_session
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.trace_configs = trace_configs
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._agent_sessions: Dict[str, Union[UserAgentSession, RoutedSession]] = {}
+        self.in_flight: Counter = Counter()  # client session -> its requests in flight
         self.do_shutdown = do_shutdown
+        self.max_concurrent_requests = max_concurrent_requests
         self.semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self.rate_limiter = rate_limiter
+        self.egress_pool = egress_pool
+        self._route_sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._monitor_task: Optional[asyncio.Task] = None
+
+    @property
+    def request_limiter(self) -> Union[asyncio.Semaphore, AdaptiveRateLimiter]:
+        """
+        Object guarding the requests: the adaptive rate limiter if any, the fixed semaphore otherwise
+        """
+        return self.rate_limiter if self.rate_limiter is not None else self.semaphore
 
     @property
     def user_agents(self) -> Tuple[str, ...]:
@@ -41,48 +220,93 @@ class AsyncUserAgentManager:
         :return:
         """
         self.do_shutdown = True
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+            self._monitor_task = None
         await asyncio.sleep(0.01)
         await self.clean_up()
 
-    async def get_client_session(self, return_key: bool = False) -> \
-            Union[aiohttp.ClientSession, Tuple[aiohttp.ClientSession, str]]:
+    def _agent_headers(self, user_agent: str) -> Dict[str, str]:
+        headers = {self.USER_AGENT_KEY: user_agent}
+        headers.update(self.DEFAULT_HEADERS)
+        return headers
+
+    def _create_session(self, headers: Optional[Dict[str, str]] = None,
+                        local_address: Optional[str] = None) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_timeout,
+                                         use_dns_cache=self.dns_cache_ttl is not None, ttl_dns_cache=self.dns_cache_ttl,
+                                         local_addr=(local_address, 0) if local_address else None)
+        return aiohttp.ClientSession(connector=connector, headers=headers, trace_configs=self.trace_configs)
+
+    def get_route_session(self, route: EgressRoute) -> aiohttp.ClientSession:
+        session = self._route_sessions.get(route.name)
+        if session is None or session.closed:
+            session = self._route_sessions[route.name] = self._create_session(local_address=route.local_address)
+        return session
+
+    def get_agent_session(self, key: Optional[str] = None) -> aiohttp.ClientSession:
         """
+        :param key: user agent, None for the shared session
+        :return: the open client session of the user agent
+        """
+        if key is None:
+            if self._session is None or self._session.closed:
+                self._session = self._create_session()
+            return self._session
+        session = self.client_sessions.get(key)
+        if session is None or session.closed:
+            session = self.client_sessions[key] = self._create_session(self._agent_headers(key))
+        return session
 
+    async def get_client_session(self, return_key: bool = False) -> \
+            Union[UserAgentSession, RoutedSession, Tuple[Union[UserAgentSession, RoutedSession], str]]:
+        """
+        Returns the session for the next user agent - no awaiting happens here,
+            so it doesn't take any request slot
         :param return_key:
         :return:
         """
         user_agent = self.user_agents[self.agent_index]
-        # ---------------------------------------------
-        async with self.semaphore:  # Acquire the semaphore before creating a session
-            if user_agent not in self.client_sessions:
-                headers = {self.USER_AGENT_KEY: user_agent}
-                # extend headers with some additional info
-                #   https://stackoverflow.com/a/74674276
-                headers['Accept-Language'] = 'en-US,en;q=0.5'
-                #
-                self.client_sessions[user_agent] = aiohttp.ClientSession(headers=headers)
-
-            # update agent_index
-            self._switch_user_agent()
-            if not return_key:
-                return self.client_sessions[user_agent]
-            else:
-                return self.client_sessions[user_agent], user_agent
-
-    async def reopen_session(self, key: str) -> bool:
-        async with self.lock:
-            session: aiohttp.ClientSession = self.client_sessions.get(key, None)
-            if session is None:
-                return False
-            headers = {self.USER_AGENT_KEY: key}
-            await session.close()
-            # del self.client_sessions[key]
-            self.client_sessions[key] = aiohttp.ClientSession(headers=headers)
-            return True
+        if user_agent not in self._agent_sessions:
+            if self.egress_pool is not None:
+                self._agent_sessions[user_agent] = RoutedSession(self, self._agent_headers(user_agent))
+            elif self.shared_session:
+                self._agent_sessions[user_agent] = UserAgentSession(self, None, self._agent_headers(user_agent))
+            else:  # the headers are the ones of the session
+                self._agent_sessions[user_agent] = UserAgentSession(self, user_agent, {})
+        session = self._agent_sessions[user_agent]
+
+        # update agent_index
+        self._switch_user_agent()
+        if not return_key:
+            return session
+        else:
+            return session, user_agent
+
+    async def reopen_session(self, key: Optional[str] = None) -> bool:
+        """
+        Closes the client session of the user agent unless it has requests in flight, the next request opens a new one
+        :param key: user agent, None for the shared session
+        :return: whether the session has been closed
+        """
+        session = self._session if key is None else self.client_sessions.get(key)
+        if session is None or self.in_flight[session]:
+            return False
+        # no awaiting till the session is detached, so no request can take it anymore
+        if key is None:
+            self._session = None
+        else:
+            del self.client_sessions[key]
+        await session.close()
+        return True
 
     async def close_sessions(self) -> None:
         for session in self.client_sessions.values():
             await session.close()
+        if self._session is not None:
+            await self._session.close()
+        for session in self._route_sessions.values():
+            await session.close()
 
     def _switch_user_agent(self):
         self.agent_index = (self.agent_index + 1) % len(self.user_agents)
@@ -97,8 +321,74 @@ class AsyncUserAgentManager:
             await asyncio.sleep(check_interval)
             await self.check_session_health(check_url)
 
-    async def check_session_health(self, url_to_scrape: str) -> Exception:
-        raise NotImplementedError
+    async def _probe(self, session: aiohttp.ClientSession, url: str, timeout: float,
+                     proxy: Optional[str] = None) -> Tuple[Optional[int], float, Optional[Exception]]:
+        s0 = time.monotonic()
+        try:
+            async with session.get(url, proxy=proxy, headers=self._agent_headers(self.user_agents[0]),
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                await response.read()
+                return response.status, time.monotonic() - s0, None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            return None, time.monotonic() - s0, exc
+
+    async def _probe_route(self, route: EgressRoute, url: str,
+                           timeout: float) -> Optional[Tuple[Optional[int], float, Optional[Exception]]]:
+        """
+        Sends the health check through the route within its rate budget and feeds the route health with the outcome
+        :return: None if the route is busy, its requests tell its health already
+        """
+        if route.in_flight >= route.concurrency_limit:
+            return None
+        delay = route.reserve(time.monotonic())
+        try:
+            await asyncio.sleep(delay)
+            status, latency, error = await self._probe(self.get_route_session(route), url, timeout, route.proxy)
+        except BaseException:
+            self.egress_pool.release(route)
+            raise
+        self.egress_pool.release(route, status, latency, error)
+        return status, latency, error
+
+    async def check_session_health(self, url_to_scrape: str, timeout: float = 10.) -> Optional[Exception]:
+        """
+        Sends a request to the url through every egress route (but the quarantined ones) and feeds their health
+            with the outcomes; without egress routes checks the sessions and reopens the idle ones which fail
+            to connect. The checks take the request slots like any other request, a timeout closes nothing
+        :param url_to_scrape:
+        :param timeout: seconds per request
+        :return: the last error, None if everything has responded
+        """
+        last_error: Optional[Exception] = None
+        if self.egress_pool is not None:
+            for route in self.egress_pool.probe_candidates():
+                async with self.request_limiter:
+                    result = await self._probe_route(route, url_to_scrape, timeout)
+                if result is None:
+                    continue
+                status, _, error = result
+                if error is not None or status >= 400:
+                    last_error = error or ConnectionError(f"route={route.name}: response={status}")
+                    events.warning('health_check_failed', route=route.name, status=status, error=repr(error))
+            return last_error
+
+        if self.shared_session:
+            sessions = {None: self._session} if self._session is not None and not self._session.closed else {}
+        else:
+            sessions = {key: session for key, session in self.client_sessions.items() if not session.closed}
+        for key, session in sessions.items():
+            async with self.request_limiter:
+                status, _, error = await self._probe(session, url_to_scrape, timeout)
+            if error is None and status < 400:
+                continue
+            last_error = error or ConnectionError(f"response={status}")
+            events.warning('health_check_failed', session=key or 'shared', status=status, error=repr(error))
+            # only the connection failing makes a new session worth it: not the server answering with errors
+            #   and not a slow response
+            if error is not None and not isinstance(error, asyncio.TimeoutError):
+                if not await self.reopen_session(key):
+                    events.info('session_reopen_deferred', session=key or 'shared', in_flight=self.in_flight[session])
+        return last_error
 
     async def start_monitoring(self, check_url: str, check_interval: float = 2.0):
-        asyncio.create_task(self.monitor_sessions(check_url, check_interval))
+        self._monitor_task = asyncio.create_task(self.monitor_sessions(check_url, check_interval))
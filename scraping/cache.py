@@ -0,0 +1,122 @@
+import sqlite3
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from urllib.parse import urlencode
+
+from typing import Optional, Dict, Mapping, Union, Any
+
+
+__all__ = ['ResponseCache', 'DEFAULT_TTLS']
+
+
+DEFAULT_TTLS: Dict[str, float] = {
+    'search': 6 * 3600.,  # search results change as new articles are published
+    'article': 90 * 24 * 3600.,  # article pages almost never change
+}
+
+
+class ResponseCache:
+    """
+        Persistent response cache stored in a single SQLite file.
+        Bodies are zlib-compressed and keyed by url + sorted query parameters;
+            every resource kind (`search`, `article`, ...) has its own time to live.
+        Once the total size of the stored bodies exceeds `max_bytes`, the least recently used entries are evicted
+    """
+
+    def __init__(self, path: Union[str, Path], max_bytes: int = 1024 ** 3, ttls: Optional[Mapping[str, float]] = None,
+                 compression_level: int = 6):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls: Dict[str, float] = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.compression_level = compression_level
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.evictions: int = 0
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, body BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.commit()
+        self.total_bytes: int = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Mapping[str, Any]] = None) -> str:
+        if not params:
+            return url
+        return url + '?' + urlencode(sorted((str(key), str(value)) for key, value in params.items()))
+
+    def get(self, url: str, params: Optional[Mapping[str, Any]] = None, kind: str = 'article') -> Optional[str]:
+        key = self.make_key(url, params)
+        row = self._connection.execute("SELECT body, size, created_at FROM responses WHERE key = ?",
+                                       (key,)).fetchone()
+        now = time.time()
+        if row is not None and now - row[2] > self.ttls.get(kind, 0.):
+            self._delete(key, row[1])
+            row = None
+        if row is None:
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._connection.commit()
+        return zlib.decompress(row[0]).decode('utf-8')
+
+    def put(self, url: str, params: Optional[Mapping[str, Any]], kind: str, text: str) -> None:
+        if self.ttls.get(kind, 0.) <= 0:
+            return
+        key = self.make_key(url, params)
+        body = zlib.compress(text.encode('utf-8'), self.compression_level)
+        previous = self._connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        self._connection.execute("INSERT OR REPLACE INTO responses (key, kind, body, size, created_at, accessed_at) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", (key, kind, body, len(body), now, now))
+        self.total_bytes += len(body) - (previous[0] if previous else 0)
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        self._connection.commit()
+
+    def _delete(self, key: str, size: int) -> None:
+        self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._connection.commit()
+        self.total_bytes -= size
+
+    def _evict(self, target_ratio: float = 0.9) -> None:
+        # free a bit more than needed so that eviction doesn't run on every put once the cache is full
+        target = self.max_bytes * target_ratio
+        rows = self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at")
+        to_delete = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            to_delete.append((key,))
+            self.total_bytes -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'hits': dict(self.hits),
+            'misses': dict(self.misses),
+            'evictions': self.evictions,
+            'total_bytes': self.total_bytes,
+        }
+
+    def report(self) -> str:
+        lines = [f"cache {self.path}: {self.total_bytes / 1024 ** 2:.1f} MiB stored, {self.evictions} evictions"]
+        for kind in sorted(set(self.hits) | set(self.misses)):
+            hits, misses = self.hits[kind], self.misses[kind]
+            lines.append(f"  {kind}: hits={hits} misses={misses} hit rate={hits / max(hits + misses, 1):.1%}")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        self._connection.commit()
+        self._connection.close()
@@ -1,46 +1,177 @@
 from pathlib import Path
-from bs4 import BeautifulSoup
-from collections import OrderedDict
+from collections.abc import MutableMapping
 
-from typing import Optional
+from .metrics import events
 
+from typing import Optional, Tuple, List, Collection, Iterator, Any
 
-__all__ = ['process_pubmed_page_text', 'PUBMED_BASE_URL']
+
+__all__ = ['process_pubmed_page_text', 'extract_urls_from_search_page_text', 'extract_results_from_search_page_text',
+           'extract_results_count_from_search_page_text', 'split_citation', 'pmid_from_url', 'clean_text',
+           'PUBMED_BASE_URL', 'ARTICLE_COLUMNS', 'SEARCH_RESULT_COLUMNS', 'CITATION_COLUMNS', 'RESULTS_PER_PAGE',
+           'MAX_SEARCH_PAGES', 'RECORD_FIELDS', 'ArticleRecord']
 
 
 PUBMED_BASE_URL: str = "https://pubmed.ncbi.nlm.nih.gov"
+RESULTS_PER_PAGE: int = 10
+# pubmed doesn't serve search pages beyond the 1000th one, i.e. 10k results of a query
+MAX_SEARCH_PAGES: int = 1000
+
+ARTICLE_COLUMNS: Tuple[str, ...] = (
+    "url", "pmid", "abstract", "keywords", "published_date", "citation_doi", "journal", "volume", "issue", "pages",
+    "cit", "query",
+)
+# what a search page tells about every article found, no article page needed
+SEARCH_RESULT_COLUMNS: Tuple[str, ...] = ("url", "pmid", "title", "authors", "citation")
+# article columns split from the `cit` text of the article page (`scraping.normalize`), the parsers keep the text only
+CITATION_COLUMNS: Tuple[str, ...] = ("published_date", "volume", "issue", "pages")
+# everything a record may have: the article columns and the search result ones
+RECORD_FIELDS: Tuple[str, ...] = tuple(dict.fromkeys(ARTICLE_COLUMNS + SEARCH_RESULT_COLUMNS))
+_RECORD_FIELDS_SET = frozenset(RECORD_FIELDS)
+
+
+class ArticleRecord(MutableMapping):
+    """
+        Compact record of an article: a slot per `RECORD_FIELDS` column instead of a dict per article,
+            several times smaller than an `OrderedDict` of the same fields.
+        Reads and writes like a dict of all the fields (the ones not set are None), so `record['query'] = ...`,
+            `record.get(...)`, `record.update(...)` and `dict(record)` work as before; other keys are a `KeyError`
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, *values: Any, **fields: Any):
+        """
+        :param values: field values in the `RECORD_FIELDS` order, e.g. the url
+        :param fields: field values by name
+        """
+        for name, value in zip(RECORD_FIELDS, values):
+            setattr(self, name, value)
+        for name in RECORD_FIELDS[len(values):]:
+            setattr(self, name, None)
+        self.update(fields)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _RECORD_FIELDS_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in _RECORD_FIELDS_SET:
+            raise KeyError(f"{key}, expected one of {RECORD_FIELDS}")
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str) -> None:
+        self[key] = None  # the fields are fixed, deleting one clears it
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in _RECORD_FIELDS_SET else default
+
+    def __contains__(self, key: object) -> bool:
+        return key in _RECORD_FIELDS_SET
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(RECORD_FIELDS)
+
+    def __len__(self) -> int:
+        return len(RECORD_FIELDS)
+
+    def __reduce__(self):
+        # slots only: pickled as the plain tuple of values for the parse worker processes
+        return self.__class__, tuple(getattr(self, name) for name in RECORD_FIELDS)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({', '.join(f'{name}={getattr(self, name)!r}' for name in RECORD_FIELDS)})"
+
+
+def pmid_from_url(url: str) -> str:
+    """
+    :param url: article url like `https://pubmed.ncbi.nlm.nih.gov/12345678/`
+    :return: `12345678`
+    """
+    return url.rstrip('/').rsplit('/', 1)[-1]
+
+
+def _make_soup(text: str, parser: str = "html.parser"):
+    """
+    :return: BeautifulSoup tree of the text; bs4 is imported on the first call, the lxml backend doesn't need it
+    """
+    from bs4 import BeautifulSoup
+
+    return BeautifulSoup(text, parser)
+
+
+def clean_text(text: Optional[str]) -> Optional[str]:
+    """
+    :return: the text with whitespace runs (newlines, indentation of the markup) collapsed into single spaces
+    """
+    return " ".join(text.split()) if text is not None else None
+
+
+def split_citation(cit: Optional[str], url: str = '', verbose: bool = False) -> \
+        Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
+    """
+    Splits the citation string like `2023 Sep;42(3):101-120.` into its parts
+    :param cit:
+    :param url: used for messages only
+    :param verbose:
+    :return: published_date, volume, issue, pages
+    """
+    published_date, volume, issue, pages = None, None, None, None
+    if not cit:
+        return published_date, volume, issue, pages
+    # Split the string by semicolon to get the published date and the rest of the citation
+    try:
+        cit_splitted = cit.split(';')
+        published_date = cit_splitted[0]
+        rest_of_citation = cit_splitted[1:]
+        if len(rest_of_citation) == 1:
+            rest_of_citation = rest_of_citation[0]
+        else:
+            rest_of_citation = ';'.join(rest_of_citation)
+
+        # Split the rest of the citation by colon to get the volume, issue, and pages
+        volume_issue, pages = rest_of_citation.split(':')
+
+        # Split the volume and issue by parentheses to get the volume and issue numbers
+        vi_splitted = volume_issue.split('(')
+        if len(vi_splitted) == 2:
+            volume = vi_splitted[0]
+            issue = vi_splitted[1][:-1]
+        elif len(vi_splitted) == 1:
+            if verbose:
+                events.debug('citation_without_issue', url=url, citation=cit)
+            volume = vi_splitted[0]
+            issue = None
+        else:
+            events.warning('unexpected_citation', url=url, citation=cit)
+    except Exception as E:
+        events.warning('citation_parse_failed', url=url, citation=cit, error=repr(E))
+    return published_date, volume, issue, pages
 
 
 def process_pubmed_page_text(text: Optional[str], url: str, verbose: bool = False,
-                             error_on_null_id: bool = False) -> OrderedDict:
+                             error_on_null_id: bool = False, fields: Optional[Collection[str]] = None) -> ArticleRecord:
     """
 
     :param text:
     :param url:
     :param verbose:
     :param error_on_null_id:
-    :return:
+    :param fields: columns to extract, the extractors of the other ones are skipped and they are left None;
+        all if None. The abstract and the pmid are always looked for - a page without abstract gives
+        an empty record and a missing pmid may be an error
+    :return: the record, only its url is set if the page has no abstract
     """
-    none_respond = OrderedDict(**{
-            "url": url,
-            "pmid": None,
-            "abstract": None,
-            "keywords": None,
-            "published_date": None,
-            "citation_doi": None,
-            'journal': None,
-            "volume": None,
-            "issue": None,
-            "pages": None,
-        })
+    fields = frozenset(fields) if fields is not None else None
 
     if text is None:
-        return none_respond
+        return ArticleRecord(url)
 
-    article_soup = BeautifulSoup(text, "html.parser")
+    article_soup = _make_soup(text, "html.parser")
     if article_soup is None:
-        print(f"cannot parse url={url}: text={text}")
-        return none_respond
+        events.warning('unparsable_page', url=url)
+        return ArticleRecord(url)
     # Extract the abstract
     abstract_content_class = "abstract-content"
     abstract_content_selected_class ="abstract-content selected"
@@ -49,20 +180,18 @@ def process_pubmed_page_text(text: Optional[str], url: str, verbose: bool = Fals
     abstract = abstract_content_element.text.strip() if abstract_content_element else None  # "No abstract available."
     if abstract is None:
         # raise AssertionError(f"cannot parse abstract: abstract={abstract}")
-        print(f"{url} doesn't have {abstract_content_class}! Trying to access {abstract_content_selected_class} class")
+        events.debug('missing_element', url=url, element=abstract_content_class)
         abstract_content_element = article_soup.find("div", class_=abstract_content_selected_class)
         abstract = abstract_content_element.text.strip() if abstract_content_element else None  # "No abstract available."
         if abstract is None:
-            print(f"{url} doesn't have {abstract_content_selected_class}!")
-            return none_respond
-        else:
-            print(f"{url} does have an {abstract_content_selected_class}")
+            events.info('no_abstract', url=url)
+            return ArticleRecord(url)
 
     # Find the keywords element and extract its text
     # abstract_element = article_soup.find("div", class_="abstract")
     # keywords_element = article_soup.find("strong", class_="sub-title").find_next_sibling("p")
     # keywords = keywords_element.text.strip() if keywords_element else "No keywords available."
-    abstract_content = article_soup.find("div", class_="abstract")
+    abstract_content = article_soup.find("div", class_="abstract") if fields is None or "keywords" in fields else None
     keywords = None
     if abstract_content:
         # Find the keywords element and extract its text
@@ -84,63 +213,93 @@ def process_pubmed_page_text(text: Optional[str], url: str, verbose: bool = Fals
         if error_on_null_id:
             raise AssertionError(msg)
         else:  # then simply skip since you can't do anything with that
-            print(msg)
+            events.warning('no_pmid', url=url)
 
     pmid = pmid_element.text.strip() if pmid_element else None  # "No PMID available."
     # Extract the topics
     # topics = [topic.text.strip() for topic in article_soup.find_all("a", class_="tag")]
     # Extract the published date
-    cit_element = article_soup.find("span", class_="cit")
-    cit: Optional[str] = cit_element.text.strip() if cit_element else None
-    citation_doi_element = article_soup.find("span", class_="citation-doi")
-    citation_doi = citation_doi_element.text.strip() if citation_doi_element else None
+    cit: Optional[str] = None
+    if fields is None or 'cit' in fields or not fields.isdisjoint(CITATION_COLUMNS):
+        cit_element = article_soup.find("span", class_="cit")
+        cit = cit_element.text.strip() if cit_element else None
+    citation_doi = None
+    if fields is None or "citation_doi" in fields:
+        citation_doi_element = article_soup.find("span", class_="citation-doi")
+        citation_doi = citation_doi_element.text.strip() if citation_doi_element else None
     #  "No published date available."
 
     # Extract the journal
     # journal_element = article_soup.find("a", class_="journal-title-link")
     # journal = journal_element.text.strip() if journal_element else "No journal information available."
-    journal_element = article_soup.find("button", class_="journal-actions-trigger")
-    journal: Optional[str] = journal_element.text.strip() if journal_element else None
+    journal: Optional[str] = None
+    if fields is None or "journal" in fields:
+        journal_element = article_soup.find("button", class_="journal-actions-trigger")
+        journal = journal_element.text.strip() if journal_element else None
 
-    published_date, volume, issue, pages = None, None, None, None
-    if cit:
-        # Split the string by semicolon to get the published date and the rest of the citation
-        try:
-            cit_splitted = cit.split(';')
-            published_date = cit_splitted[0]
-            rest_of_citation = cit_splitted[1:]
-            if len(rest_of_citation) == 1:
-                rest_of_citation = rest_of_citation[0]
-            else:
-                rest_of_citation = ';'.join(rest_of_citation)
-
-            # Split the rest of the citation by colon to get the volume, issue, and pages
-            volume_issue, pages = rest_of_citation.split(':')
-
-            # Split the volume and issue by parentheses to get the volume and issue numbers
-            vi_splitted = volume_issue.split('(')
-            if len(vi_splitted) == 2:
-                volume = vi_splitted[0]
-                issue = vi_splitted[1][:-1]
-            elif len(vi_splitted) == 1:
-                if verbose:
-                    print(f"volume_issue.split('(')={vi_splitted}!!!")
-                volume = vi_splitted[0]
-                issue = None
-            else:
-                print(f"volume_issue.split('(')={vi_splitted}!!!")
-        except Exception as E:
-            print(f"url={url}, cit={cit}: {E}")
-
-    return OrderedDict(**{
-        "url": url,
-        "pmid": pmid,
-        "abstract": abstract,
-        "keywords": keywords,
-        "published_date": published_date,
-        "citation_doi": citation_doi,
-        'journal': journal,
-        "volume": volume,
-        "issue": issue,
-        "pages": pages,
-    })
+    return ArticleRecord(url=url, pmid=pmid, abstract=abstract if fields is None or "abstract" in fields else None,
+                         keywords=keywords, citation_doi=citation_doi, journal=journal, cit=cit)
+
+
+def extract_urls_from_search_page_text(text: str, base_url: str, parser: str = "html.parser") -> List[str]:
+    """
+    Collects article urls from the `docsum-content` blocks of a search page
+    :param text:
+    :param base_url:
+    :param parser: BeautifulSoup tree builder
+    :return:
+    """
+    soup = _make_soup(text, parser)
+    search_results = soup.find_all("div", class_="docsum-content")
+    urls = []
+
+    for result in search_results:
+        title_element = result.find("a", class_="docsum-title")
+        url = base_url + title_element["href"]
+        urls.append(url)
+
+    return urls
+
+
+def extract_results_count_from_search_page_text(text: str, parser: str = "html.parser") -> Optional[int]:
+    """
+    Reads the `results-amount` counter of a search page
+    :param text:
+    :param parser: BeautifulSoup tree builder
+    :return: number of results, None if the page has no counter (no results or a redirect to the single article)
+    """
+    soup = _make_soup(text, parser)
+    counter = soup.find("div", class_="results-amount")
+    value = counter.find("span", class_="value") if counter else None
+    if value is None:
+        return None
+    return int(value.text.strip().replace(",", ""))
+
+
+def extract_results_from_search_page_text(text: str, base_url: str,
+                                          parser: str = "html.parser") -> List[ArticleRecord]:
+    """
+    Collects what the `docsum-content` blocks of a search page tell about every article:
+        url, pmid, title, authors and the journal citation snippet (`SEARCH_RESULT_COLUMNS`)
+    :param text:
+    :param base_url:
+    :param parser: BeautifulSoup tree builder
+    :return:
+    """
+    soup = _make_soup(text, parser)
+    results = []
+    for result in soup.find_all("div", class_="docsum-content"):
+        title_element = result.find("a", class_="docsum-title")
+        url = base_url + title_element["href"]
+        # the full authors / citation go first, the short ones follow for the narrow layout
+        pmid_element = result.find("span", class_="docsum-pmid")
+        authors_element = result.find("span", class_="docsum-authors")
+        citation_element = result.find("span", class_="docsum-journal-citation")
+        results.append(ArticleRecord(
+            url=url,
+            pmid=clean_text(pmid_element.text) if pmid_element else pmid_from_url(url),
+            title=clean_text(title_element.text),
+            authors=clean_text(authors_element.text) if authors_element else None,
+            citation=clean_text(citation_element.text) if citation_element else None,
+        ))
+    return results
@@ -0,0 +1,126 @@
+import io
+import xml.etree.ElementTree as ET
+
+from .common import PUBMED_BASE_URL, ArticleRecord
+
+from typing import Optional, Iterator, Tuple, Dict, Union, List
+
+
+__all__ = ['EUTILS_BASE_URL', 'EUTILS_MAX_RECORDS', 'parse_esearch_xml', 'iter_efetch_records',
+           'article_element_to_record', 'eutils_params']
+
+
+EUTILS_BASE_URL: str = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+# esearch doesn't give access to the records beyond the first 10k of a query
+EUTILS_MAX_RECORDS: int = 10_000
+
+
+def eutils_params(api_key: Optional[str] = None, email: Optional[str] = None,
+                  tool: Optional[str] = 'async_pubmed_scraper') -> Dict[str, str]:
+    """
+    Common parameters identifying the client; `api_key` raises the allowed rate from 3 to 10 requests per second
+    """
+    params = {'db': 'pubmed'}
+    for key, value in (('api_key', api_key), ('email', email), ('tool', tool)):
+        if value:
+            params[key] = value
+    return params
+
+
+def parse_esearch_xml(text: str) -> Tuple[int, Optional[str], Optional[str], List[str]]:
+    """
+    :param text: esearch response
+    :return: count, WebEnv, query_key and the ids of the returned page
+    """
+    root = ET.fromstring(text)
+    error = root.findtext('ERROR')
+    if error:
+        raise ValueError(f"esearch error: {error}")
+    return (int(root.findtext('Count') or 0), root.findtext('WebEnv'), root.findtext('QueryKey'),
+            [id_element.text for id_element in root.iterfind('IdList/Id')])
+
+
+def _text(element: Optional[ET.Element]) -> Optional[str]:
+    if element is None:
+        return None
+    text = "".join(element.itertext()).strip()
+    return text or None
+
+
+def article_element_to_record(article: ET.Element, base_url: str = PUBMED_BASE_URL) -> ArticleRecord:
+    """
+    Converts a `PubmedArticle` element into a record with the same columns and formatting
+        as the html article pages give
+    :param article:
+    :param base_url: base of the `url` column
+    :return:
+    """
+    citation = article.find('MedlineCitation')
+    pmid = _text(citation.find('PMID')) if citation is not None else None
+    article_info = citation.find('Article') if citation is not None else None
+    if article_info is None:
+        article_info = ET.Element('Article')
+
+    abstract_parts = []
+    for part in article_info.iterfind('Abstract/AbstractText'):
+        part_text = _text(part)
+        if part_text is None:
+            continue
+        label = part.get('Label')
+        abstract_parts.append(f"{label}: {part_text}" if label else part_text)
+    abstract = "\n".join(abstract_parts) or None
+
+    keywords_list = [_text(keyword) for keyword in citation.iterfind('KeywordList/Keyword')] \
+        if citation is not None else []
+    keywords_list = [keyword for keyword in keywords_list if keyword]
+    keywords = "; ".join(keywords_list) + "." if keywords_list else None
+
+    issue_element = article_info.find('Journal/JournalIssue')
+    published_date = volume = issue = None
+    if issue_element is not None:
+        pub_date = issue_element.find('PubDate')
+        if pub_date is not None:
+            published_date = _text(pub_date.find('MedlineDate')) or " ".join(
+                value for value in (_text(pub_date.find(key)) for key in ('Year', 'Season', 'Month', 'Day')) if value
+            ) or None
+        volume = _text(issue_element.find('Volume'))
+        issue = _text(issue_element.find('Issue'))
+    pages = _text(article_info.find('Pagination/MedlinePgn'))
+    pages = pages + "." if pages else None
+
+    doi = None
+    for location in article_info.iterfind('ELocationID'):
+        if location.get('EIdType') == 'doi':
+            doi = _text(location)
+            break
+    if doi is None:
+        for article_id in article.iterfind('PubmedData/ArticleIdList/ArticleId'):
+            if article_id.get('IdType') == 'doi':
+                doi = _text(article_id)
+                break
+    citation_doi = f"doi: {doi}." if doi else None
+
+    journal = None
+    if citation is not None:
+        journal = _text(citation.find('MedlineJournalInfo/MedlineTA'))
+    journal = journal or _text(article_info.find('Journal/ISOAbbreviation'))
+
+    return ArticleRecord(url=f"{base_url}/{pmid}/", pmid=pmid, abstract=abstract, keywords=keywords,
+                         published_date=published_date, citation_doi=citation_doi, journal=journal, volume=volume,
+                         issue=issue, pages=pages)
+
+
+def iter_efetch_records(source: Union[str, bytes], base_url: str = PUBMED_BASE_URL) -> Iterator[ArticleRecord]:
+    """
+    Streams records out of an efetch xml response: every `PubmedArticle` is converted and cleared right away,
+        so the whole tree is never built
+    :param source: efetch response body
+    :param base_url: base of the `url` column
+    :return:
+    """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    for _, element in ET.iterparse(io.BytesIO(source), events=('end',)):
+        if element.tag == 'PubmedArticle':
+            yield article_element_to_record(element, base_url)
+            element.clear()
@@ -0,0 +1,128 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from .common import ArticleRecord
+from .parsers import get_parser
+from .metrics import METRICS
+
+from typing import Optional, List, Tuple, Any, Collection, FrozenSet
+
+
+__all__ = ['ParseExecutor', 'parse_pages_batch']
+
+
+ParseItem = Tuple[Optional[str], str, bool, bool]  # text, url, verbose, error_on_null_id
+
+
+def parse_pages_batch(items: List[ParseItem], backend: str = 'bs4',
+                      fields: Optional[Collection[str]] = None) -> List[Tuple[bool, Any, float]]:
+    """
+    Parses a batch of pages in a worker; exceptions are returned instead of raised
+        so that a single broken page doesn't fail the whole batch
+    :param items: (text, url, verbose, error_on_null_id) tuples
+    :param backend: name of the parser backend
+    :param fields: columns to extract, all if None
+    :return: (succeeded, record or exception, parse seconds) triples in the order of `items`
+    """
+    parser = get_parser(backend)
+    results = []
+    for text, url, verbose, error_on_null_id in items:
+        s0 = time.perf_counter()
+        try:
+            results.append((True, parser.parse_article(text, url, verbose, error_on_null_id, fields),
+                            time.perf_counter() - s0))
+        except Exception as exc:
+            results.append((False, exc, time.perf_counter() - s0))
+    return results
+
+
+class ParseExecutor:
+    """
+        Moves html parsing off the event loop thread.
+        Pages are collected into batches of `batch_size` (or whatever has arrived within `flush_interval` seconds)
+            and every batch is parsed by a single call in a thread or process pool,
+            which amortizes the cost of shipping page text to the workers.
+        `inline` mode parses on the event loop as before.
+        Only the extractors of `fields` run if given (field projection)
+    """
+
+    MODES: Tuple[str, ...] = ('inline', 'thread', 'process')
+
+    def __init__(self, mode: str = 'inline', max_workers: Optional[int] = None, batch_size: int = 8,
+                 flush_interval: float = 0.005, backend: str = 'bs4', fields: Optional[Collection[str]] = None):
+        if mode not in self.MODES:
+            raise ValueError(f"unknown parse mode={mode}, expected one of {self.MODES}")
+        if batch_size < 1:
+            raise ValueError(f"`batch_size` must be positive but got {batch_size}")
+        self.mode = mode
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.backend = backend
+        self.fields: Optional[FrozenSet[str]] = frozenset(fields) if fields is not None else None
+        get_parser(backend)  # fail fast on unknown / unavailable backends
+        self._executor: Optional[Executor] = None
+        if mode == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        elif mode == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._pending: List[Tuple[ParseItem, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+    async def parse(self, text: Optional[str], url: str, verbose: bool = False,
+                    error_on_null_id: bool = False) -> ArticleRecord:
+        if self._executor is None:
+            s0 = time.perf_counter()
+            try:
+                return get_parser(self.backend).parse_article(text, url, verbose, error_on_null_id, self.fields)
+            finally:
+                METRICS.observe('parse_seconds', time.perf_counter() - s0, kind='article')
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((text, url, verbose, error_on_null_id), future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.flush_interval, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        futures = [future for _, future in batch]
+        batch_future = asyncio.get_running_loop().run_in_executor(
+            self._executor, parse_pages_batch, [item for item, _ in batch], self.backend, self.fields)
+        batch_future.add_done_callback(lambda done: self._resolve(done, futures))
+
+    @staticmethod
+    def _resolve(batch_future: asyncio.Future, futures: List[asyncio.Future]) -> None:
+        if batch_future.cancelled() or batch_future.exception() is not None:
+            for future in futures:
+                if future.done():
+                    continue
+                if batch_future.cancelled():
+                    future.cancel()
+                else:
+                    future.set_exception(batch_future.exception())
+            return
+        for future, (succeeded, value, seconds) in zip(futures, batch_future.result()):
+            METRICS.observe('parse_seconds', seconds, kind='article')
+            if future.done():  # the awaiting coroutine has been cancelled
+                continue
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def shutdown(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
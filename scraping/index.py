@@ -0,0 +1,71 @@
+import sqlite3
+from pathlib import Path
+
+from .common import pmid_from_url
+
+from typing import Union, Iterable, Optional, List
+
+
+__all__ = ['PmidIndex']
+
+
+class PmidIndex:
+    """
+        Persistent set of the pmids scraped so far, stored in a SQLite file.
+        It's built from the output parquet files: every file is read once (its `url` column)
+            and remembered by size and modification time, so an update reads only new or changed files
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS pmids (pmid TEXT PRIMARY KEY) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL);")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM pmids").fetchone()[0]
+
+    def __contains__(self, pmid: object) -> bool:
+        return self._connection.execute("SELECT 1 FROM pmids WHERE pmid = ?", (str(pmid),)).fetchone() is not None
+
+    def add(self, pmids: Iterable[Optional[str]], path: Optional[Union[str, Path]] = None) -> None:
+        """
+        :param pmids:
+        :param path: file the pmids come from, it won't be read again by `update_from_files` unless it changes
+        """
+        with self._connection:
+            self._connection.executemany("INSERT OR IGNORE INTO pmids (pmid) VALUES (?)",
+                                         ((pmid,) for pmid in pmids if pmid))
+            if path is not None:
+                stat = Path(path).stat()
+                self._connection.execute("INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)",
+                                         (str(Path(path).absolute()), stat.st_size, stat.st_mtime_ns))
+
+    def update_from_files(self, paths: Iterable[Union[str, Path]], column: str = 'url') -> List[Path]:
+        """
+        Adds the pmids of the parquet files which haven't been indexed yet or have changed since
+        :param paths:
+        :param column: `url` (pmid is its last path segment) or `pmid` column
+        :return: files read
+        """
+        import pyarrow.parquet as pq  # the lookups don't need pyarrow
+
+        read = []
+        for path in map(Path, paths):
+            stat = path.stat()
+            row = self._connection.execute("SELECT size, mtime_ns FROM files WHERE path = ?",
+                                           (str(path.absolute()),)).fetchone()
+            if row == (stat.st_size, stat.st_mtime_ns):
+                continue
+            values = pq.read_table(path, columns=[column]).column(column).to_pylist()
+            self.add(values if column == 'pmid' else (pmid_from_url(url) for url in values if url), path)
+            read.append(path)
+        return read
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from typing import Union, Set, List, Iterable, Optional, Dict, Any, Mapping
+
+
+__all__ = ['CrawlJournal']
+
+
+class CrawlJournal:
+    """
+        Durable job journal of a crawl stored in a SQLite file:
+            - `pages`: search pages (or efetch batches) whose article urls have been harvested
+            - `articles`: harvested urls with what the search gave along (the query, the search result columns),
+                pending until the output file containing them is closed
+            - `batches`: output files written so far
+        Every change is committed right away, so after a crash, ban or Ctrl-C a resumed run knows exactly
+            which pages to skip and which urls are still to be fetched
+    """
+
+    PENDING: int = 0
+    WRITTEN: int = 1
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(self.path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(
+            # untyped page keys: page numbers of a single query, `{term} page={page}` strings of the shards
+            "CREATE TABLE IF NOT EXISTS pages (page PRIMARY KEY, harvested_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS articles (url TEXT PRIMARY KEY, page, status INTEGER NOT NULL, "
+            "batch_id INTEGER, extras TEXT);"
+            "CREATE INDEX IF NOT EXISTS articles_status ON articles (status);"
+            "CREATE TABLE IF NOT EXISTS batches (id INTEGER PRIMARY KEY, path TEXT NOT NULL, "
+            "num_rows INTEGER NOT NULL, flushed_at REAL NOT NULL);")
+        if 'extras' not in {row[1] for row in self._connection.execute("PRAGMA table_info(articles)")}:
+            self._connection.execute("ALTER TABLE articles ADD COLUMN extras TEXT")  # journals of the older versions
+        self._connection.commit()
+
+    def reset(self) -> List[Path]:
+        """
+        Forgets everything to start the crawl from scratch
+        :return: output files recorded by the previous run
+        """
+        paths = self.batch_paths()
+        with self._connection:
+            self._connection.executescript("DELETE FROM pages; DELETE FROM articles; DELETE FROM batches;")
+        return paths
+
+    def harvested_pages(self) -> Set[Union[int, str]]:
+        return {row[0] for row in self._connection.execute("SELECT page FROM pages")}
+
+    def pending_urls(self) -> List[str]:
+        return [row[0] for row in self._connection.execute(
+            "SELECT url FROM articles WHERE status = ? ORDER BY rowid", (self.PENDING,))]
+
+    def pending_extras(self) -> Dict[str, Dict[str, Any]]:
+        """
+        :return: pending urls with the columns recorded along with them (e.g. the query), in the harvesting order
+        """
+        return {url: json.loads(extras) if extras else {} for url, extras in self._connection.execute(
+            "SELECT url, extras FROM articles WHERE status = ? ORDER BY rowid", (self.PENDING,))}
+
+    def pending_pages(self) -> Set[Union[int, str]]:
+        """
+        :return: pages with urls which haven't been written yet
+        """
+        return {row[0] for row in self._connection.execute(
+            "SELECT DISTINCT page FROM articles WHERE status = ? AND page IS NOT NULL", (self.PENDING,))}
+
+    def record_page(self, page: Union[int, str], urls: Iterable[str],
+                    extras: Optional[Mapping[str, Mapping[str, Any]]] = None) -> List[str]:
+        """
+        Marks the page as harvested and stores its urls as pending in a single transaction
+        :param page:
+        :param urls:
+        :param extras: url -> columns the records of the url get from the search (the query, the search result ones),
+            given back by `pending_extras` on resume
+        :return: urls which hadn't been known before (urls may repeat across pages)
+        """
+        new_urls = []
+        now = time.time()
+        extras = extras or {}
+        with self._connection:
+            for url in urls:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO articles (url, page, status, extras) VALUES (?, ?, ?, ?)",
+                    (url, page, self.PENDING, json.dumps(extras[url]) if url in extras else None))
+                if cursor.rowcount:
+                    new_urls.append(url)
+            self._connection.execute("INSERT OR REPLACE INTO pages (page, harvested_at) VALUES (?, ?)", (page, now))
+        return new_urls
+
+    def record_batch(self, path: Union[str, Path], urls: Iterable[str], num_rows: Optional[int] = None) -> int:
+        """
+        Records a closed output file and marks its urls as written
+        :param path:
+        :param urls: urls of the records stored in the file
+        :param num_rows:
+        :return: batch identifier
+        """
+        urls = list(urls)
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO batches (path, num_rows, flushed_at) VALUES (?, ?, ?)",
+                (str(path), len(urls) if num_rows is None else num_rows, time.time()))
+            batch_id = cursor.lastrowid
+            self._connection.executemany(
+                "INSERT INTO articles (url, status, batch_id) VALUES (?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET status = excluded.status, batch_id = excluded.batch_id",
+                ((url, self.WRITTEN, batch_id) for url in urls))
+        return batch_id
+
+    def batch_paths(self) -> List[Path]:
+        return [Path(row[0]) for row in self._connection.execute("SELECT path FROM batches ORDER BY id")]
+
+    def next_batch_index(self) -> int:
+        return self._connection.execute("SELECT COALESCE(MAX(id), 0) FROM batches").fetchone()[0]
+
+    def summary(self) -> str:
+        pages = self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        written, pending = (self._connection.execute("SELECT COUNT(*) FROM articles WHERE status = ?",
+                                                     (status,)).fetchone()[0]
+                            for status in (self.WRITTEN, self.PENDING))
+        batches = self._connection.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+        return (f"journal {self.path}: {pages} pages harvested, {written} articles written in {batches} files, "
+                f"{pending} pending")
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,294 @@
+import bisect
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+
+from typing import Optional, List, Dict, Tuple, Callable, Any, Sequence, Union
+
+
+__all__ = ['Histogram', 'MetricsRegistry', 'MetricsServer', 'EventLogger', 'METRICS', 'events',
+           'LATENCY_BUCKETS', 'ATTEMPT_BUCKETS']
+
+
+# seconds, from a cache-speed response to a stalled one
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+ATTEMPT_BUCKETS: Tuple[float, ...] = (1., 2., 3., 5., 8., 13.)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+        Fixed-bucket histogram: `counts[i]` is the number of values in (buckets[i - 1], buckets[i]],
+            the last count is the +Inf bucket. Quantiles are interpolated within the buckets
+    """
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'min', 'max')
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum: float = 0.
+        self.count: int = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.min if i == 0 else max(self.buckets[i - 1], self.min)
+                upper = self.max if i == len(self.buckets) else min(self.buckets[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {'count': self.count, 'sum': self.sum, 'mean': self.sum / self.count if self.count else None,
+                'min': self.min, 'max': self.max,
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+def _labels_key(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """
+        In-process counters, gauges and histograms with labels, cheap enough to be updated per request.
+        Exported as Prometheus text (`render_prometheus`) or as a json friendly summary (`summary`).
+        `collectors` are called before every export to refresh the gauges of long-living objects
+            (rate limiter, work queue, ...)
+    """
+
+    def __init__(self, namespace: str = 'pubmed_scraper'):
+        self.namespace = namespace
+        self.started_at: float = time.monotonic()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._collectors: List[Callable[['MetricsRegistry'], None]] = []
+
+    def inc(self, name: str, value: float = 1., **labels: Any) -> None:
+        series = self._counters.setdefault(name, {})
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0.) + value
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        self._gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS, **labels: Any) -> None:
+        series = self._histograms.setdefault(name, {})
+        key = _labels_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(buckets)
+        histogram.observe(value)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        """
+        :return: value of the counter, summed over the label values not given
+        """
+        wanted = set(_labels_key(labels))
+        return sum(value for key, value in self._counters.get(name, {}).items() if wanted.issubset(key))
+
+    def histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        return self._histograms.get(name, {}).get(_labels_key(labels))
+
+    def add_collector(self, collector: Callable[['MetricsRegistry'], None]) -> None:
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector: Callable[['MetricsRegistry'], None]) -> None:
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def collect(self) -> None:
+        for collector in self._collectors:
+            collector(self)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def reset(self) -> None:
+        self.started_at = time.monotonic()
+        self._counters.clear()
+        self._gauges.clear()
+        self._histograms.clear()
+        self._collectors.clear()
+
+    def render_prometheus(self) -> str:
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        self.collect()
+        lines = [f"# TYPE {self.namespace}_uptime_seconds gauge", f"{self.namespace}_uptime_seconds {self.elapsed}"]
+        for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+            for name, series in sorted(metrics.items()):
+                lines.append(f"# TYPE {self.namespace}_{name} {kind}")
+                lines.extend(f"{self.namespace}_{name}{_format_labels(key)} {value}"
+                             for key, value in sorted(series.items()))
+        for name, series in sorted(self._histograms.items()):
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full_name} histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{full_name}_bucket{_format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {histogram.sum}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        :return: counters, gauges and histogram quantiles keyed by `name{labels}`, counters also as per second rates
+        """
+        self.collect()
+        elapsed = self.elapsed
+
+        def flatten(metrics: Dict[str, Dict[Labels, Any]], convert: Callable[[Any], Any]) -> Dict[str, Any]:
+            return {f"{name}{_format_labels(key)}": convert(value)
+                    for name, series in sorted(metrics.items()) for key, value in sorted(series.items())}
+
+        counters = flatten(self._counters, lambda value: value)
+        return {
+            'elapsed_seconds': elapsed,
+            'counters': counters,
+            'rates_per_second': {name: value / elapsed for name, value in counters.items()} if elapsed else {},
+            'gauges': flatten(self._gauges, lambda value: value),
+            'histograms': flatten(self._histograms, Histogram.summary),
+        }
+
+    def save_summary(self, filepath: Union[str, Path], **extra: Any) -> Dict[str, Any]:
+        summary = dict(self.summary(), **extra)
+        with open(filepath, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2, default=str)
+        return summary
+
+
+class MetricsServer:
+    """
+        Local http endpoint serving `/metrics` (Prometheus text) and `/summary` (json) of a registry
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self) -> 'MetricsServer':
+        from aiohttp import web  # the client part of aiohttp is all the crawl itself needs
+
+        async def metrics(_):
+            return web.Response(text=self.registry.render_prometheus(), content_type='text/plain',
+                                headers={'X-Content-Type-Options': 'nosniff'})
+
+        async def summary(_):
+            return web.json_response(self.registry.summary(), dumps=lambda obj: json.dumps(obj, default=str))
+
+        app = web.Application()
+        app.router.add_get('/metrics', metrics)
+        app.router.add_get('/summary', summary)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def _format_value(value: Any) -> str:
+    text = str(value)
+    if not text or any(char in text for char in ' ="\n'):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class EventLogger:
+    """
+        Structured logging of per-item events as `event=name key=value ...` lines, rate limited per event name:
+            a token bucket lets `burst` messages through at once and `rate` per second after that,
+            the number of suppressed messages is reported by the next one passed.
+        Disabled levels cost a single `isEnabledFor` check, so the events may stay in the hot paths
+    """
+
+    def __init__(self, logger: logging.Logger, rate: float = 1., burst: int = 5):
+        self.logger = logger
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # event -> (tokens, last update)
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()  # parse workers may log from threads
+
+    def _acquire(self, event: str) -> Tuple[bool, int]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(event, (float(self.burst), now))
+            tokens = min(tokens + (now - updated) * self.rate, float(self.burst))
+            if tokens < 1.:
+                self._buckets[event] = (tokens, now)
+                self._suppressed[event] = self._suppressed.get(event, 0) + 1
+                return False, 0
+            self._buckets[event] = (tokens - 1., now)
+            return True, self._suppressed.pop(event, 0)
+
+    def log(self, level: int, event: str, exc_info: Any = None, **fields: Any) -> bool:
+        """
+        :return: whether the message has been emitted
+        """
+        if not self.logger.isEnabledFor(level):
+            return False
+        passed, suppressed = self._acquire(event)
+        if not passed:
+            return False
+        if suppressed:
+            fields['suppressed'] = suppressed
+        message = ' '.join([f"event={event}"] + [f"{key}={_format_value(value)}" for key, value in fields.items()])
+        self.logger.log(level, message, exc_info=exc_info)
+        return True
+
+    def debug(self, event: str, **fields: Any) -> bool:
+        return self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields: Any) -> bool:
+        return self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields: Any) -> bool:
+        return self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields: Any) -> bool:
+        return self.log(logging.ERROR, event, **fields)
+
+
+# process-wide defaults, like the `logging` module's root logger
+METRICS: MetricsRegistry = MetricsRegistry()
+events: EventLogger = EventLogger(logging.getLogger('scraping'))
@@ -0,0 +1,211 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .common import CITATION_COLUMNS
+from .metrics import METRICS, events
+from .schema import ARTICLE_SCHEMA
+
+from typing import Optional, Dict, Union
+
+
+__all__ = ['raw_schema', 'split_citations', 'parse_published_dates', 'split_keywords_column', 'normalize_table',
+           'normalize_parquet_file']
+
+
+# the same rules as `split_citation` and `parse_published_date`, written for RE2 (no lookahead) to run over columns:
+# `2023 Sep;42(3):101-120.` - the date up to the first `;`, then `volume(issue):pages` with a single `:`
+_CITATION_DATE_PATTERN = r"^(?P<published_date>[^;]*)"
+_CITATION_REST_PATTERN = r"^[^;]*;(?P<volume_issue>[^:]*):(?P<pages>[^:]*)$"
+_VOLUME_ISSUE_PATTERN = r"^(?P<volume>[^(]*)\((?P<issue>[^(]*)$"
+_DATE_PATTERN = r"^\s*(?P<year>\d{4})(?:[\s/-]+(?P<month>[A-Za-z]+|\d{1,2})(?:[\s/-]+(?P<day>\d{1,2})(?:\D|$))?)?"
+_MONTH_NAMES = pa.array(['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])
+_SEASON_NAMES = pa.array(['spring', 'summer', 'autumn', 'fall', 'winter'])
+_SEASON_MONTHS = np.array([3, 6, 9, 9, 12])
+# columns derived from the citation text
+_DERIVED_COLUMNS = frozenset(('published_date', 'published_date_raw') + CITATION_COLUMNS)
+
+ArrayLike = Union[pa.Array, pa.ChunkedArray]
+
+
+def _array(values: ArrayLike) -> pa.Array:
+    return values.combine_chunks() if isinstance(values, pa.ChunkedArray) else values
+
+
+def _strings(values: Optional[ArrayLike]) -> Optional[pa.Array]:
+    """
+    :return: the values if they are the text as parsed, None for the typed ones
+    """
+    if values is None:
+        return None
+    values = _array(values)
+    if pa.types.is_dictionary(values.type):
+        values = values.dictionary_decode()
+    return values if pa.types.is_string(values.type) or pa.types.is_large_string(values.type) else None
+
+
+def _coalesce(*values: Optional[pa.Array]) -> Optional[pa.Array]:
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    return pc.coalesce(*values) if len(values) > 1 else values[0]
+
+
+def raw_schema(schema: pa.Schema = ARTICLE_SCHEMA) -> pa.Schema:
+    """
+    :param schema: schema `normalize_table` is asked for
+    :return: string columns of the parsed records it's made of: the columns of `schema` and, for the columns derived
+        from the citation, the raw citation `cit` and the date / volume / issue / pages given without it (E-utilities)
+    """
+    names = [name for name in schema.names if name != 'published_date_raw']
+    if not _DERIVED_COLUMNS.isdisjoint(schema.names):
+        names += ['cit', 'published_date']
+    return pa.schema([(name, pa.string()) for name in dict.fromkeys(names)])
+
+
+def split_citations(cit: ArrayLike) -> Dict[str, pa.Array]:
+    """
+    Splits citations like `2023 Sep;42(3):101-120.` column-wise
+    :param cit: citation texts of the article pages
+    :return: string columns `published_date` (the date text), `volume`, `issue`, `pages`;
+        null where the citation is missing or doesn't have the part
+    """
+    cit = _array(cit)
+    cit = pc.if_else(pc.equal(cit, ''), pa.scalar(None, cit.type), cit)
+    published_date = pc.struct_field(pc.extract_regex(cit, _CITATION_DATE_PATTERN), 'published_date')
+    rest = pc.extract_regex(cit, _CITATION_REST_PATTERN)
+    volume_issue = pc.struct_field(rest, 'volume_issue')
+    parts = pc.extract_regex(volume_issue, _VOLUME_ISSUE_PATTERN)
+    with_issue = pc.match_substring(volume_issue, '(')
+    volume = pc.if_else(with_issue, pc.struct_field(parts, 'volume'), volume_issue)
+    issue = pc.utf8_slice_codeunits(pc.struct_field(parts, 'issue'), 0, -1)  # the closing parenthesis
+
+    # the raw citations are kept in the output, the ones not split can be normalized again once the rules change
+    unsplit = pc.sum(pc.and_(pc.is_valid(cit), pc.or_kleene(pc.is_null(rest), pc.is_null(volume)))).as_py() or 0
+    if unsplit:
+        METRICS.inc('unsplit_citations_total', unsplit)
+        events.warning('unsplit_citations', count=unsplit, rows=len(cit))
+    return {'published_date': published_date, 'volume': volume, 'issue': issue,
+            'pages': pc.struct_field(rest, 'pages')}
+
+
+def parse_published_dates(text: ArrayLike) -> pa.Array:
+    """
+    Column-wise `parse_published_date`
+    :param text: publication dates like `2023 Sep 21`, `2023 Sep-Oct`, `2023 Winter`, `2023 09 21` or `2023`
+    :return: date32 column, the first day of the month / season / year if the day / month isn't given;
+        null if there is no year
+    """
+    text = _array(text)
+    parts = pc.extract_regex(text, _DATE_PATTERN)
+    matched = parts.is_valid().to_numpy(zero_copy_only=False)
+    year = pc.cast(pc.fill_null(pc.struct_field(parts, 'year'), '0'), pa.int64()).to_numpy(zero_copy_only=False)
+    month_text = pc.fill_null(pc.struct_field(parts, 'month'), '')
+    day_text = pc.fill_null(pc.struct_field(parts, 'day'), '')
+
+    is_number = pc.utf8_is_digit(month_text)
+    month_number = pc.cast(pc.if_else(is_number, month_text, '0'), pa.int64()).to_numpy(zero_copy_only=False)
+    month_name = pc.fill_null(pc.index_in(pc.utf8_lower(pc.utf8_slice_codeunits(month_text, 0, 3)),
+                                          value_set=_MONTH_NAMES), -1).to_numpy(zero_copy_only=False)
+    season = pc.fill_null(pc.index_in(pc.utf8_lower(month_text), value_set=_SEASON_NAMES),
+                          -1).to_numpy(zero_copy_only=False)
+    month = np.where(is_number.to_numpy(zero_copy_only=False),
+                     np.where((month_number >= 1) & (month_number <= 12), month_number, 1),
+                     np.where(month_name >= 0, month_name + 1, np.where(season >= 0, _SEASON_MONTHS[season], 1)))
+    day = pc.cast(pc.if_else(pc.utf8_is_digit(day_text), day_text, '1'), pa.int64()).to_numpy(zero_copy_only=False)
+
+    first_day = ((year - 1970) * 12 + month - 1).astype('datetime64[M]').astype('datetime64[D]')
+    days_in_month = ((year - 1970) * 12 + month).astype('datetime64[M]').astype('datetime64[D]') - first_day
+    day = np.where((day >= 1) & (day <= days_in_month.astype(np.int64)), day, 1)  # a day which doesn't exist
+    return pa.array(first_day + (day - 1), type=pa.date32(), mask=~(matched & (year >= 1)))
+
+
+def split_keywords_column(text: ArrayLike) -> pa.Array:
+    """
+    Column-wise `split_keywords`
+    :param text: keywords like `allergy; asthma; children.`
+    :return: list column of the keywords without the separators, null if there are none
+    """
+    text = _array(text)
+    lists = pc.split_pattern(text, ';')
+    keywords = pc.utf8_trim_whitespace(pc.utf8_rtrim(pc.utf8_trim_whitespace(pc.list_flatten(lists)), characters='.'))
+    keep = pc.greater(pc.utf8_length(keywords), 0)
+    parents = pc.filter(pc.list_parent_indices(lists), keep).to_numpy(zero_copy_only=False)
+    counts = np.bincount(parents, minlength=len(text))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), pc.filter(keywords, keep), mask=pa.array(counts == 0))
+
+
+def normalize_table(table: pa.Table, schema: pa.Schema = ARTICLE_SCHEMA) -> pa.Table:
+    """
+    Batch normalization of the parsed records: the citation is split into the publication date, volume, issue and
+        pages, the date is parsed, the keywords are split and every column is cast to `schema`, all of it column-wise.
+        The columns typed already are kept, so the output of a previous run can be normalized again,
+        the raw citation and date text (`cit`, `published_date_raw`) are what the derived columns are made of
+    :param table: records of `raw_schema(schema)` or an earlier output, the missing columns are null
+    :param schema: `ARTICLE_SCHEMA`, `RAW_ARTICLE_SCHEMA` or their projection
+    :return: the table of `schema`
+    """
+    def given(name: str) -> Optional[pa.Array]:
+        return _array(table.column(name)) if name in table.column_names else None
+
+    citation: Dict[str, pa.Array] = {}
+    if 'cit' in table.column_names and not _DERIVED_COLUMNS.isdisjoint(schema.names):
+        citation = split_citations(table.column('cit'))
+    date_text = _coalesce(citation.get('published_date'), _strings(given('published_date_raw')),
+                          _strings(given('published_date')))
+
+    columns = []
+    for field in schema:
+        name, values = field.name, given(field.name)
+        if name == 'published_date_raw':
+            values = date_text
+        elif name == 'published_date':
+            if pa.types.is_date(field.type):
+                values = _coalesce(parse_published_dates(date_text) if date_text is not None else None,
+                                   values if values is not None and pa.types.is_date(values.type) else None)
+            else:
+                values = date_text
+        elif name in CITATION_COLUMNS:
+            values = _coalesce(citation.get(name), values)
+        elif name == 'keywords' and values is not None:
+            if pa.types.is_list(field.type) and _strings(values) is not None:
+                values = split_keywords_column(_strings(values))
+            elif not pa.types.is_list(field.type) and pa.types.is_list(values.type):
+                values = pc.binary_join(values, '; ')
+        elif name == 'pmid' and values is not None and pa.types.is_integer(field.type) \
+                and _strings(values) is not None:
+            digits = pc.match_substring_regex(_strings(values), r"^\d+$")
+            values = pc.if_else(digits, _strings(values), pa.scalar(None, pa.string()))
+        columns.append(pa.nulls(table.num_rows, field.type) if values is None else values.cast(field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def normalize_parquet_file(path: Union[str, Path], schema: Optional[pa.Schema] = None, compression: str = 'zstd',
+                           compression_level: Optional[int] = None) -> int:
+    """
+    Normalizes a parquet file written before again, row group by row group, nothing is fetched;
+        the file is replaced once the new one is complete
+    :param path:
+    :param schema: schema of the new file, the one of the file by default
+    :param compression:
+    :param compression_level:
+    :return: number of the rows
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    num_rows = 0
+    with pq.ParquetFile(path) as parquet_file:
+        schema = schema or parquet_file.schema_arrow
+        with pq.ParquetWriter(tmp_path, schema, compression=compression,
+                              compression_level=compression_level) as writer:
+            for i in range(parquet_file.num_row_groups):
+                table = normalize_table(parquet_file.read_row_group(i), schema)
+                writer.write_table(table, row_group_size=max(table.num_rows, 1))
+                num_rows += table.num_rows
+    os.replace(tmp_path, path)
+    return num_rows
@@ -0,0 +1,202 @@
+from .common import process_pubmed_page_text, extract_urls_from_search_page_text, \
+    extract_results_count_from_search_page_text, extract_results_from_search_page_text, pmid_from_url, clean_text, \
+    CITATION_COLUMNS, ArticleRecord
+from .metrics import events
+
+from typing import Optional, List, Dict, Tuple, Type, Any, Collection
+
+
+__all__ = ['PageParser', 'BeautifulSoupParser', 'LxmlParser', 'PARSER_BACKENDS', 'get_parser']
+
+
+class PageParser:
+    """
+        Interface of the backends turning pubmed html into records and urls.
+        Every backend must produce exactly the same output as `BeautifulSoupParser` which is the reference one
+    """
+
+    name: str = ''
+
+    def parse_article(self, text: Optional[str], url: str, verbose: bool = False,
+                      error_on_null_id: bool = False, fields: Optional[Collection[str]] = None) -> ArticleRecord:
+        """
+        :param fields: columns to extract (see `process_pubmed_page_text`), all if None
+        """
+        raise NotImplementedError
+
+    def parse_search_page(self, text: str, base_url: str) -> List[str]:
+        raise NotImplementedError
+
+    def parse_search_results(self, text: str, base_url: str) -> List[ArticleRecord]:
+        """
+        :return: `SEARCH_RESULT_COLUMNS` of every article found
+        """
+        raise NotImplementedError
+
+    def parse_results_count(self, text: str) -> Optional[int]:
+        raise NotImplementedError
+
+
+class BeautifulSoupParser(PageParser):
+    """
+        Reference backend: builds the full BeautifulSoup tree and walks it with separate `find` calls
+    """
+
+    name: str = 'bs4'
+
+    def __init__(self, features: str = "html.parser"):
+        self.features = features
+
+    def parse_article(self, text: Optional[str], url: str, verbose: bool = False,
+                      error_on_null_id: bool = False, fields: Optional[Collection[str]] = None) -> ArticleRecord:
+        return process_pubmed_page_text(text, url, verbose, error_on_null_id, fields)
+
+    def parse_search_page(self, text: str, base_url: str) -> List[str]:
+        return extract_urls_from_search_page_text(text, base_url, self.features)
+
+    def parse_search_results(self, text: str, base_url: str) -> List[ArticleRecord]:
+        return extract_results_from_search_page_text(text, base_url, self.features)
+
+    def parse_results_count(self, text: str) -> Optional[int]:
+        return extract_results_count_from_search_page_text(text, self.features)
+
+
+def _has_class(class_name: str) -> str:
+    # xpath equivalent of BeautifulSoup's `class_=...` matching a single class among several ones
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+class LxmlParser(PageParser):
+    """
+        Fast backend: parses the page with the lxml C parser and collects all the fields
+            with xpath expressions compiled once per parser instance
+    """
+
+    name: str = 'lxml'
+
+    def __init__(self):
+        try:
+            from lxml import etree, html
+        except ImportError as exc:
+            raise ImportError("`lxml` backend requires lxml package: pip install lxml") from exc
+        self._html = html
+        self._abstract_content = etree.XPath(f"(//div[{_has_class('abstract-content')}])[1]")
+        self._abstract_content_selected = etree.XPath("(//div[@class='abstract-content selected'])[1]")
+        self._parser = html.HTMLParser(encoding='utf-8')
+        self._keywords = etree.XPath(f"((//div[{_has_class('abstract')}])[1]//strong[{_has_class('sub-title')}])[1]")
+        self._pmid_container = etree.XPath("(//span[@class='identifier pubmed'])[1]")
+        self._pmid = etree.XPath(f"(.//strong[{_has_class('current-id')}])[1]")
+        self._cit = etree.XPath(f"(//span[{_has_class('cit')}])[1]")
+        self._citation_doi = etree.XPath(f"(//span[{_has_class('citation-doi')}])[1]")
+        self._journal = etree.XPath(f"(//button[{_has_class('journal-actions-trigger')}])[1]")
+        self._search_hrefs = etree.XPath(f"//div[{_has_class('docsum-content')}]"
+                                         f"/descendant::a[{_has_class('docsum-title')}][1]/@href")
+        self._docsums = etree.XPath(f"//div[{_has_class('docsum-content')}]")
+        self._docsum_title = etree.XPath(f"(.//a[{_has_class('docsum-title')}])[1]")
+        self._docsum_pmid = etree.XPath(f"(.//span[{_has_class('docsum-pmid')}])[1]")
+        self._docsum_authors = etree.XPath(f"(.//span[{_has_class('docsum-authors')}])[1]")
+        self._docsum_citation = etree.XPath(f"(.//span[{_has_class('docsum-journal-citation')}])[1]")
+        self._results_count = etree.XPath(f"(//div[{_has_class('results-amount')}])[1]"
+                                          f"/descendant::span[{_has_class('value')}][1]")
+
+    def _parse(self, text: str):
+        # feed utf-8 bytes: lxml refuses unicode strings with an encoding declaration
+        return self._html.document_fromstring(text.encode('utf-8'), parser=self._parser)
+
+    @staticmethod
+    def _first_text(xpath, node) -> Optional[str]:
+        found = xpath(node)
+        return found[0].text_content().strip() if found else None
+
+    @staticmethod
+    def _keywords_text(keywords_element) -> Optional[str]:
+        # same as `strong.nextSibling.text`: a text node following the element if any, the next element otherwise
+        if keywords_element.tail:
+            return keywords_element.tail.strip()
+        next_element = keywords_element.getnext()
+        return next_element.text_content().strip() if next_element is not None else None
+
+    def parse_article(self, text: Optional[str], url: str, verbose: bool = False,
+                      error_on_null_id: bool = False, fields: Optional[Collection[str]] = None) -> ArticleRecord:
+        fields = frozenset(fields) if fields is not None else None
+        if not text:
+            return process_pubmed_page_text(None, url, verbose, error_on_null_id)
+        root = self._parse(text)
+
+        abstract = self._first_text(self._abstract_content, root)
+        if abstract is None:
+            abstract = self._first_text(self._abstract_content_selected, root)
+            if abstract is None:
+                events.info('no_abstract', url=url)
+                return process_pubmed_page_text(None, url, verbose, error_on_null_id)
+
+        keywords = None
+        if fields is None or 'keywords' in fields:
+            keywords_elements = self._keywords(root)
+            keywords = self._keywords_text(keywords_elements[0]) if keywords_elements else None
+
+        pmid = None
+        pmid_container = self._pmid_container(root)
+        if pmid_container:
+            pmid = self._first_text(self._pmid, pmid_container[0])
+        else:
+            msg = f"url={url}: cannot parse identifier: None"
+            if error_on_null_id:
+                raise AssertionError(msg)
+            events.warning('no_pmid', url=url)
+
+        cit = self._first_text(self._cit, root) \
+            if fields is None or 'cit' in fields or not fields.isdisjoint(CITATION_COLUMNS) else None
+        citation_doi = self._first_text(self._citation_doi, root) if fields is None or 'citation_doi' in fields \
+            else None
+        journal = self._first_text(self._journal, root) if fields is None or 'journal' in fields else None
+        return ArticleRecord(url=url, pmid=pmid,
+                             abstract=abstract if fields is None or 'abstract' in fields else None,
+                             keywords=keywords, citation_doi=citation_doi, journal=journal, cit=cit)
+
+    def parse_search_page(self, text: str, base_url: str) -> List[str]:
+        root = self._parse(text)
+        return [base_url + str(href) for href in self._search_hrefs(root)]
+
+    def parse_search_results(self, text: str, base_url: str) -> List[ArticleRecord]:
+        results = []
+        for docsum in self._docsums(self._parse(text)):
+            title = self._docsum_title(docsum)[0]
+            url = base_url + title.get('href')
+            pmid = self._first_text(self._docsum_pmid, docsum)
+            results.append(ArticleRecord(
+                url=url,
+                pmid=clean_text(pmid) if pmid is not None else pmid_from_url(url),
+                title=clean_text(title.text_content()),
+                authors=clean_text(self._first_text(self._docsum_authors, docsum)),
+                citation=clean_text(self._first_text(self._docsum_citation, docsum)),
+            ))
+        return results
+
+    def parse_results_count(self, text: str) -> Optional[int]:
+        value = self._first_text(self._results_count, self._parse(text))
+        return int(value.replace(",", "")) if value is not None else None
+
+
+PARSER_BACKENDS: Dict[str, Type[PageParser]] = {
+    BeautifulSoupParser.name: BeautifulSoupParser,
+    LxmlParser.name: LxmlParser,
+}
+
+_parsers_cache: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], PageParser] = {}
+
+
+def get_parser(name: str = BeautifulSoupParser.name, **kwargs) -> PageParser:
+    """
+    Returns a (cached) parser backend instance, so that the compiled expressions are reused
+        within the process - worker processes build their own instance once
+    :param name: one of `PARSER_BACKENDS` keys
+    :param kwargs: backend constructor parameters
+    :return:
+    """
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"unknown parser backend={name}, expected one of {tuple(PARSER_BACKENDS)}")
+    key = (name, tuple(sorted(kwargs.items())))
+    if key not in _parsers_cache:
+        _parsers_cache[key] = PARSER_BACKENDS[name](**kwargs)
+    return _parsers_cache[key]
@@ -0,0 +1,196 @@
+import asyncio
+import math
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from typing import Optional, Deque, Tuple, Dict, Any, Union
+
+
+__all__ = ['AdaptiveRateLimiter', 'RateLimitedError', 'parse_retry_after']
+
+
+class RateLimitedError(ConnectionError):
+    """
+        Raised on 429 / 503 responses; carries the `Retry-After` delay if the server has sent one
+    """
+
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"response={status}, retry_after={retry_after}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    :param value: `Retry-After` header value - either delay seconds or an http date
+    :return: delay in seconds or None if it's missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+        Drop-in replacement for the request semaphore (`async with limiter: ...`) which adapts to the server:
+            - concurrency is controlled by AIMD: it grows by `increase_step` after every healthy window
+              (as many healthy responses as the current concurrency) and is multiplied by `decrease_factor`
+              on 429 / 5xx responses, connection errors and latency rising above `latency_threshold` times the baseline
+            - request rate is limited by a token bucket whose rate follows the same AIMD rule
+            - `Retry-After` pauses all the requests for the requested delay
+        Decreases are applied at most once per `cooldown` seconds, so a burst of errors from the requests
+            sent at the same time counts as a single congestion signal
+    """
+
+    def __init__(self, max_concurrency: int = 50, max_rate: float = 10., min_concurrency: int = 1,
+                 min_rate: float = 0.5, initial_concurrency: Optional[int] = None, initial_rate: Optional[float] = None,
+                 increase_step: int = 1, rate_increase_step: float = 0.5, decrease_factor: float = 0.5,
+                 latency_threshold: float = 3., cooldown: float = 2., history_size: int = 1000):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase_step = increase_step
+        self.rate_increase_step = rate_increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_threshold = latency_threshold
+        self.cooldown = cooldown
+
+        self._concurrency: int = initial_concurrency or max(min_concurrency, max_concurrency // 2)
+        self._rate: float = initial_rate or max(min_rate, max_rate / 2)
+        self._in_flight: int = 0
+        self._condition = asyncio.Condition()
+        self._bucket_lock = asyncio.Lock()
+        self._tokens: float = 1.
+        self._last_refill: float = time.monotonic()
+        self._paused_until: float = 0.
+        self._last_decrease: float = -math.inf
+        self._healthy_in_window: int = 0
+        self._latency_ewma: Optional[float] = None
+        self._latency_baseline: Optional[float] = None
+        self.history: Deque[Tuple[float, int, float]] = deque(maxlen=history_size)
+        self._record_history()
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'concurrency': self._concurrency,
+            'rate': round(self._rate, 3),
+            'in_flight': self._in_flight,
+            'latency_ewma': self._latency_ewma,
+            'latency_baseline': self._latency_baseline,
+            'paused_for': max(self._paused_until - time.monotonic(), 0.),
+        }
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(concurrency={self._concurrency}, rate={self._rate:.2f}/s)"
+
+    async def __aenter__(self) -> 'AdaptiveRateLimiter':
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self._concurrency)
+            self._in_flight += 1
+        try:
+            await self._take_token()
+        except BaseException:
+            await self._release()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self._release()
+
+    async def _release(self) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            # wake up as many waiters as there are free slots - the limit may have grown since they started waiting
+            self._condition.notify(max(self._concurrency - self._in_flight, 1))
+
+    async def _take_token(self) -> None:
+        async with self._bucket_lock:  # waiters are served one by one in arrival order
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(max(self._rate, 1.), self._tokens + (now - self._last_refill) * self._rate)
+                self._last_refill = now
+                if self._tokens >= 1.:
+                    self._tokens -= 1.
+                    return
+                await asyncio.sleep((1. - self._tokens) / self._rate)
+
+    def record_response(self, status: int, latency: float, retry_after: Union[str, float, None] = None) -> None:
+        """
+        Feeds the controller with the outcome of a request
+        :param status: http status
+        :param latency: seconds from sending the request till the response headers
+        :param retry_after: `Retry-After` header value or delay in seconds
+        :return:
+        """
+        if isinstance(retry_after, str):
+            retry_after = parse_retry_after(retry_after)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+        if status == 429 or status >= 500:
+            self._decrease()
+            return
+
+        self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+        if self._latency_baseline is None or self._latency_ewma < self._latency_baseline:
+            self._latency_baseline = self._latency_ewma
+        else:  # let the baseline follow a permanent latency change slowly
+            self._latency_baseline *= 1.001
+        if self._latency_ewma > self._latency_baseline * self.latency_threshold:
+            self._decrease()
+            return
+        self._healthy_in_window += 1
+        if self._healthy_in_window >= self._concurrency:
+            self._increase()
+
+    def record_error(self) -> None:
+        """
+        Connection errors and timeouts are treated as congestion
+        """
+        self._decrease()
+
+    def _increase(self) -> None:
+        self._healthy_in_window = 0
+        concurrency = min(self._concurrency + self.increase_step, self.max_concurrency)
+        rate = min(self._rate + self.rate_increase_step, self.max_rate)
+        if concurrency != self._concurrency or rate != self._rate:
+            self._set(concurrency, rate)
+
+    def _decrease(self) -> None:
+        self._healthy_in_window = 0
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self._set(max(int(self._concurrency * self.decrease_factor), self.min_concurrency),
+                  max(self._rate * self.decrease_factor, self.min_rate))
+
+    def _set(self, concurrency: int, rate: float) -> None:
+        self._concurrency, self._rate = concurrency, rate
+        self._record_history()
+
+    def _record_history(self) -> None:
+        self.history.append((time.time(), self._concurrency, self._rate))
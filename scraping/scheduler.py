@@ -0,0 +1,159 @@
+import asyncio
+import itertools
+import random
+from collections import Counter
+
+from .ratelimit import RateLimitedError
+from .metrics import METRICS, ATTEMPT_BUCKETS, events
+
+from typing import Optional, List, Dict, Callable, Awaitable, Any, Tuple
+
+
+__all__ = ['RetryScheduler', 'WorkItem', 'backoff_delay']
+
+
+class WorkItem:
+    """
+        Item of work together with its attempts state
+    """
+
+    __slots__ = ('ident', 'params', 'attempts', 'last_error')
+
+    def __init__(self, ident: Any, params: Tuple[Any, ...]):
+        self.ident = ident
+        self.params = params
+        self.attempts: int = 0
+        self.last_error: Optional[BaseException] = None
+
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 30.) -> float:
+    """
+    Exponential backoff with "equal" jitter: a half of the delay is fixed, the other half is random
+    :param attempt: number of failed attempts so far, starting from 1
+    :param base_delay:
+    :param max_delay:
+    :return:
+    """
+    delay = min(base_delay * 2 ** (attempt - 1), max_delay)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryScheduler:
+    """
+        Runs `handler(*params)` for every submitted item on a fixed number of worker coroutines.
+        Failed items are put back into the queue after an exponential backoff with jitter (or `Retry-After` if the
+            server has sent one) and go before the new ones; items failed more than `max_retries` times go to
+            `dead_letters`. At most `capacity` items are admitted at once (`put` waits otherwise),
+            so memory and scheduling overhead depend on the concurrency, not on the number of items
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable[Any]], num_workers: int, max_retries: int = 10,
+                 on_result: Optional[Callable[[Any, Any], Awaitable[None]]] = None, capacity: Optional[int] = None,
+                 base_delay: float = 0.5, max_delay: float = 30., name: str = 'tasks', verbose: bool = False):
+        if num_workers < 1:
+            raise ValueError(f"`num_workers` must be positive but got {num_workers}")
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_retries = max_retries
+        self.on_result = on_result
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.name = name
+        self.verbose = verbose
+        self.dead_letters: List[Dict[str, Any]] = []
+        self.stats: Counter = Counter()
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._capacity = asyncio.Semaphore(capacity or 2 * num_workers)
+        self._counter = itertools.count()
+        self._unfinished: int = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._error: Optional[BaseException] = None
+        self._workers: List[asyncio.Task] = []
+        self._delayed: Dict[int, asyncio.TimerHandle] = {}
+
+    def start(self) -> 'RetryScheduler':
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work(), name=f"{self.name}-worker-{i}")
+                             for i in range(self.num_workers)]
+        return self
+
+    async def put(self, ident: Any, params: Tuple[Any, ...]) -> None:
+        await self._capacity.acquire()
+        self._unfinished += 1
+        self._idle.clear()
+        self._queue.put_nowait((1, next(self._counter), WorkItem(ident, params)))
+
+    async def join(self) -> None:
+        """
+        Waits for all the submitted items (including the delayed retries) to finish and stops the workers
+        """
+        try:
+            await self._idle.wait()
+            if self._error is not None:
+                raise self._error
+        finally:
+            await self.stop()
+
+    async def stop(self) -> None:
+        for handle in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _work(self) -> None:
+        while True:
+            _, _, item = await self._queue.get()
+            METRICS.set('queue_depth', self._queue.qsize(), queue=self.name)
+            item.attempts += 1
+            self.stats['attempts'] += 1
+            try:
+                result = await self.handler(*item.params)
+            except Exception as exc:
+                self._on_failure(item, exc)
+                continue
+            self.stats['succeeded'] += 1
+            METRICS.inc('items_total', scheduler=self.name, outcome='succeeded')
+            METRICS.observe('item_attempts', item.attempts, ATTEMPT_BUCKETS, scheduler=self.name)
+            if self.on_result is not None:
+                try:
+                    await self.on_result(item.ident, result)
+                except Exception as exc:  # not the item's fault - stop the whole run
+                    self._error = exc
+                    self._idle.set()
+                    return
+            self._finish()
+
+    def _on_failure(self, item: WorkItem, exc: Exception) -> None:
+        item.last_error = exc
+        events.warning('attempt_failed', scheduler=self.name, item=item.ident, attempt=item.attempts, error=repr(exc))
+        if item.attempts > self.max_retries:
+            events.error('item_failed', scheduler=self.name, item=item.ident, retries=item.attempts - 1,
+                         error=repr(exc))
+            self.stats['failed'] += 1
+            METRICS.inc('items_total', scheduler=self.name, outcome='failed')
+            METRICS.observe('item_attempts', item.attempts, ATTEMPT_BUCKETS, scheduler=self.name)
+            self.dead_letters.append({'kind': self.name, 'ident': item.ident, 'attempts': item.attempts,
+                                      'error': repr(exc)})
+            self._finish()
+            return
+        self.stats['retries'] += 1
+        METRICS.inc('retries_total', scheduler=self.name)
+        delay = backoff_delay(item.attempts, self.base_delay, self.max_delay)
+        if isinstance(exc, RateLimitedError) and exc.retry_after:
+            delay = max(delay, exc.retry_after)
+        key = next(self._counter)
+        self._delayed[key] = asyncio.get_running_loop().call_later(delay, self._requeue, key, item)
+
+    def _requeue(self, key: int, item: WorkItem) -> None:
+        del self._delayed[key]
+        self._queue.put_nowait((0, key, item))  # retries go first so that admitted items are done sooner
+
+    def _finish(self) -> None:
+        self._unfinished -= 1
+        self._capacity.release()
+        if self._unfinished == 0:
+            self._idle.set()
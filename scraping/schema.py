@@ -0,0 +1,126 @@
+import re
+from datetime import date
+
+import pyarrow as pa
+
+from .common import ARTICLE_COLUMNS, CITATION_COLUMNS, RECORD_FIELDS, split_citation
+
+from typing import Optional, List, Mapping, Any, Dict, Sequence
+
+
+__all__ = ['ARTICLE_SCHEMA', 'RAW_ARTICLE_SCHEMA', 'OUTPUT_SCHEMAS', 'OUTPUT_FIELDS', 'parse_published_date',
+           'split_keywords', 'normalize_record', 'publication_year', 'project_schema']
+
+
+# what the parsers give: every column is the text found on the page
+RAW_ARTICLE_SCHEMA: pa.Schema = pa.schema([(column, pa.string()) for column in ARTICLE_COLUMNS])
+
+# typed and compact: a handful of journals / queries repeat over millions of rows, so they are dictionary encoded
+ARTICLE_SCHEMA: pa.Schema = pa.schema([
+    ('url', pa.string()),
+    ('pmid', pa.int64()),
+    ('abstract', pa.string()),
+    ('keywords', pa.list_(pa.string())),
+    ('published_date', pa.date32()),
+    ('published_date_raw', pa.string()),
+    ('citation_doi', pa.string()),
+    ('journal', pa.dictionary(pa.int32(), pa.string())),
+    ('volume', pa.string()),
+    ('issue', pa.string()),
+    ('pages', pa.string()),
+    ('cit', pa.string()),
+    ('query', pa.dictionary(pa.int32(), pa.string())),
+])
+
+OUTPUT_SCHEMAS: Dict[str, pa.Schema] = {'typed': ARTICLE_SCHEMA, 'string': RAW_ARTICLE_SCHEMA}
+OUTPUT_FIELDS: Sequence[str] = RECORD_FIELDS
+
+_MONTHS: Dict[str, int] = {name: i for i, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), start=1)}
+_SEASONS: Dict[str, int] = {'spring': 3, 'summer': 6, 'autumn': 9, 'fall': 9, 'winter': 12}
+# `2023 Sep 21`, `2023 Sep`, `2023 Sep-Oct`, `2023 Winter`, `2023 09 21` (E-utilities) or just `2023`
+_DATE_PATTERN = re.compile(r"^\s*(\d{4})(?:[\s/-]+([A-Za-z]+|\d{1,2})(?:[\s/-]+(\d{1,2})(?!\d))?)?")
+
+
+def parse_published_date(text: Optional[str]) -> Optional[date]:
+    """
+    :param text: publication date of the citation
+    :return: the date, the first day of the month / season / year if the day / month isn't given;
+        None if there is no year
+    """
+    if not text:
+        return None
+    match = _DATE_PATTERN.match(text)
+    if match is None:
+        return None
+    year, month_text, day_text = match.groups()
+    month = 1
+    if month_text:
+        if month_text.isdigit():
+            month = int(month_text) if 1 <= int(month_text) <= 12 else 1
+        else:
+            month = _MONTHS.get(month_text[:3].lower()) or _SEASONS.get(month_text.lower(), 1)
+    try:
+        return date(int(year), month, int(day_text) if day_text and month_text else 1)
+    except ValueError:  # a day which doesn't exist in the month
+        return date(int(year), month, 1)
+
+
+def split_keywords(text: Optional[str]) -> Optional[List[str]]:
+    """
+    :param text: keywords like `allergy; asthma; children.`
+    :return: the keywords without the separators, None if there are none
+    """
+    if not text:
+        return None
+    keywords = [keyword.strip().rstrip('.').strip() for keyword in text.split(';')]
+    return [keyword for keyword in keywords if keyword] or None
+
+
+def publication_year(record: Mapping[str, Any]) -> Optional[int]:
+    published_date = record.get('published_date')
+    return published_date.year if isinstance(published_date, date) else None
+
+
+def normalize_record(record: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Converts a parsed record (all strings) to the `ARTICLE_SCHEMA` types: the citation is split, the original
+        publication date text is kept in `published_date_raw`. Records converted already are returned as they are.
+        The record by record counterpart of `scraping.normalize.normalize_table`, which the sinks use
+    """
+    if 'published_date_raw' in record:
+        return dict(record)
+    normalized = dict(record)
+    if record.get('cit'):
+        for name, value in zip(CITATION_COLUMNS, split_citation(record['cit'], record.get('url', ''))):
+            if value is not None:
+                normalized[name] = value
+    pmid = record.get('pmid')
+    normalized['pmid'] = int(pmid) if pmid and str(pmid).isdigit() else None
+    normalized['keywords'] = split_keywords(record.get('keywords'))
+    normalized['published_date_raw'] = normalized.get('published_date')
+    normalized['published_date'] = parse_published_date(normalized.get('published_date'))
+    return normalized
+
+
+def project_schema(schema: pa.Schema, fields: Optional[Sequence[str]] = None) -> pa.Schema:
+    """
+    :param schema: `ARTICLE_SCHEMA` or `RAW_ARTICLE_SCHEMA`
+    :param fields: output columns, the search result ones (`title`, `authors`, `citation`) are strings;
+        `url` is always kept as the key of the records, `published_date_raw` goes along with `published_date`
+        and the raw citation `cit` with the columns split from it
+    :return: schema of the columns in the order of `schema`, then of `fields`, the whole `schema` if no fields
+    """
+    if fields is None:
+        return schema
+    unknown = set(fields) - set(OUTPUT_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown fields={sorted(unknown)}, expected some of {OUTPUT_FIELDS}")
+    wanted = {'url', *fields}
+    if 'published_date' in wanted:
+        wanted.add('published_date_raw')
+    if not wanted.isdisjoint(CITATION_COLUMNS):
+        wanted.add('cit')
+    projected = [field for field in schema if field.name in wanted]
+    projected.extend(pa.field(name, pa.string()) for name in fields if name not in schema.names)
+    return pa.schema(projected)
@@ -0,0 +1,103 @@
+import math
+from datetime import date, timedelta
+
+from .common import RESULTS_PER_PAGE, MAX_SEARCH_PAGES
+
+from typing import NamedTuple, Optional, List, Tuple, Dict, Callable, Awaitable, Sequence, Union
+
+
+__all__ = ['QueryShard', 'as_query_shards', 'date_range_term', 'split_date_range', 'plan_shards',
+           'MAX_SHARD_RESULTS', 'EARLIEST_PUBLICATION_DATE']
+
+
+# both the search pages and esearch give access to the first 10k results of a query only
+MAX_SHARD_RESULTS: int = RESULTS_PER_PAGE * MAX_SEARCH_PAGES
+EARLIEST_PUBLICATION_DATE: date = date(1700, 1, 1)
+
+
+class QueryShard(NamedTuple):
+    """
+        Part of a query's results small enough to be fully available:
+            `term` is the query restricted to the [start, end] publication date range
+            (or the query itself if it fits as is), `count` is the number of results if known
+    """
+    query: str
+    term: str
+    start: Optional[date] = None
+    end: Optional[date] = None
+    count: Optional[int] = None
+
+    @property
+    def num_pages(self) -> Optional[int]:
+        if self.count is None:
+            return None
+        return min(math.ceil(self.count / RESULTS_PER_PAGE), MAX_SEARCH_PAGES)
+
+
+def as_query_shards(queries: Union[str, Sequence[Union[str, QueryShard]]]) -> List[QueryShard]:
+    """
+    :param queries: query, queries or shards
+    :return: shards, a plain query becomes a shard with an unknown number of results
+    """
+    if isinstance(queries, str):
+        queries = [queries]
+    return [QueryShard(query, query) if isinstance(query, str) else query for query in queries]
+
+
+def date_range_term(query: str, start: date, end: date) -> str:
+    """
+    :return: the query restricted to the publication dates in [start, end], both ends included
+    """
+    return f'({query}) AND ("{start:%Y/%m/%d}"[dp] : "{end:%Y/%m/%d}"[dp])'
+
+
+def split_date_range(start: date, end: date) -> Tuple[Tuple[date, date], Tuple[date, date]]:
+    """
+    Splits [start, end] into two non-overlapping halves
+    """
+    middle = start + timedelta(days=(end - start).days // 2)
+    return (start, middle), (middle + timedelta(days=1), end)
+
+
+async def plan_shards(query: str, count_results: Callable[[Sequence[str]], Awaitable[Dict[str, int]]],
+                      start: Optional[date] = None, end: Optional[date] = None,
+                      max_results: int = MAX_SHARD_RESULTS, verbose: bool = False) -> List[QueryShard]:
+    """
+    Splits the query into publication date shards of at most `max_results` results each: date ranges with
+        too many results are halved recursively, all the ranges of a level are counted at once
+    :param query:
+    :param count_results: returns the number of results of every given term
+    :param start: first publication date, the query isn't restricted by the dates if neither start nor end is given
+    :param end: last publication date, today by default
+    :param max_results:
+    :param verbose:
+    :return: non-empty shards, newest first
+    """
+    if start is None and end is None:
+        count = (await count_results([query]))[query]
+        if count <= max_results:
+            return [QueryShard(query, query, count=count)] if count else []
+    start, end = start or EARLIEST_PUBLICATION_DATE, end or date.today()
+
+    shards: List[QueryShard] = []
+    ranges = [(start, end)]
+    while ranges:
+        terms = {date_range_term(query, range_start, range_end): (range_start, range_end)
+                 for range_start, range_end in ranges}
+        counts = await count_results(list(terms))
+        ranges = []
+        for term, (range_start, range_end) in terms.items():
+            count = counts[term]
+            if count == 0:
+                continue
+            if count <= max_results or range_start == range_end:
+                if count > max_results:
+                    print(f"{count} results published on {range_start} can't be split further, "
+                          f"only the first {max_results} of them are available")
+                shards.append(QueryShard(query, term, range_start, range_end, count))
+            else:
+                ranges.extend(split_date_range(range_start, range_end))
+        if verbose:
+            print(f"query={query}: {len(shards)} shards planned, {len(ranges)} date ranges to split further")
+    shards.sort(key=lambda shard: shard.start, reverse=True)
+    return shards
@@ -0,0 +1,458 @@
+from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .normalize import normalize_table, parse_published_dates, raw_schema
+from .schema import ARTICLE_SCHEMA
+
+from typing import Optional, List, Mapping, Any, Union, Callable, Dict, Iterable, Iterator, Set, Sequence, Tuple
+
+
+__all__ = ['ColumnarAccumulator', 'ParquetSink', 'PartitionedParquetSink', 'iter_unique_row_groups', 'merge_parquet_files',
+           'find_dataset_files', 'HIVE_NULL_PARTITION']
+
+
+# directory name of the null partition values, the one pyarrow reads back as null
+HIVE_NULL_PARTITION: str = '__HIVE_DEFAULT_PARTITION__'
+
+
+class ColumnarAccumulator:
+    """
+        Collects records column by column: the values go straight into a list per `schema` column,
+            so no object per record is kept, only the values themselves.
+        Every `chunk_size` rows the lists are turned into an arrow record batch (one `pa.array` call per column)
+            and the python values are released; `to_table` gives the batches as they are, without copying them
+    """
+
+    def __init__(self, schema: pa.Schema, chunk_size: Optional[int] = None):
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError(f"`chunk_size` must be positive but got {chunk_size}")
+        self.schema = schema
+        self.chunk_size = chunk_size
+        self.names: List[str] = schema.names
+        self.num_rows: int = 0
+        self._columns: List[List[Any]] = [[] for _ in self.names]
+        self._batches: List[pa.RecordBatch] = []
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def append(self, record: Mapping[str, Any]) -> None:
+        """
+        :param record: values of the schema columns, the missing ones are null
+        """
+        get = record.get
+        for values, name in zip(self._columns, self.names):
+            values.append(get(name))
+        self.num_rows += 1
+        if self.chunk_size is not None and len(self._columns[0]) >= self.chunk_size:
+            self._batches.append(self._build_batch())
+
+    def extend(self, records: Iterable[Mapping[str, Any]]) -> None:
+        for record in records:
+            self.append(record)
+
+    def extend_table(self, table: pa.Table) -> None:
+        """
+        :param table: rows of `schema`, kept as the arrow batches they are
+        """
+        if self._columns[0]:
+            self._batches.append(self._build_batch())
+        self._batches.extend(table.select(self.names).cast(self.schema).to_batches())
+        self.num_rows += table.num_rows
+
+    def column(self, name: str) -> List[Any]:
+        """
+        :return: python values of the column, e.g. the keys of the records
+        """
+        index = self.names.index(name)
+        return [value for batch in self._batches for value in batch.column(index).to_pylist()] + \
+            self._columns[index]
+
+    def _build_batch(self) -> pa.RecordBatch:
+        batch = pa.RecordBatch.from_arrays([pa.array(values, type=field.type)
+                                            for values, field in zip(self._columns, self.schema)], schema=self.schema)
+        for values in self._columns:
+            values.clear()
+        return batch
+
+    def to_table(self) -> pa.Table:
+        """
+        :return: the rows collected so far, one chunk per `chunk_size` rows
+        """
+        if self._columns[0] or not self._batches:
+            self._batches.append(self._build_batch())
+        return pa.Table.from_batches(self._batches, schema=self.schema)
+
+    def clear(self) -> None:
+        for values in self._columns:
+            values.clear()
+        self._batches = []
+        self.num_rows = 0
+
+
+class ParquetSink:
+    """
+        Streams records into a parquet file: records are buffered column by column (`ColumnarAccumulator`)
+            into fixed-size arrow record batches and every batch is written as a separate row group, so memory stays flat for any number of records.
+        Use it as a context manager - the file footer is written on exit (including exceptions and Ctrl-C),
+            so an interrupted run still leaves a readable file with all flushed row groups.
+        With `rows_per_file` the output is rolled over into `{stem}-part-{index}{suffix}` files of that many rows,
+            so that even a killed process loses at most the file being written;
+            `on_file_closed(path, keys)` is called with the `key_column` values of every closed file.
+        Records are buffered as parsed (the string columns of `raw_schema(schema)`) and every batch goes through
+            `transform(table, schema)` before it's written: `normalize_table` splits the citations and converts them
+            to the typed `ARTICLE_SCHEMA` by default, column-wise; with `transform=None` the records are taken
+            as they are
+    """
+
+    def __init__(self, filepath: Union[str, Path], batch_size: int = 1000, schema: Optional[pa.Schema] = None,
+                 compression: str = 'zstd', rows_per_file: Optional[int] = None,
+                 on_file_closed: Optional[Callable[[Path, List[Any]], None]] = None, key_column: str = 'url',
+                 first_part: int = 0,
+                 transform: Optional[Callable[[pa.Table, pa.Schema], pa.Table]] = normalize_table,
+                 compression_level: Optional[int] = None):
+        if batch_size < 1:
+            raise ValueError(f"`batch_size` must be positive but got {batch_size}")
+        self.filepath = Path(filepath)
+        self.batch_size = batch_size
+        self.schema = schema or ARTICLE_SCHEMA
+        self.compression = compression
+        self.compression_level = compression_level
+        self.transform = transform
+        self.rows_per_file = rows_per_file
+        self.on_file_closed = on_file_closed
+        self.key_column = key_column
+        self.num_rows: int = 0
+        self.num_row_groups: int = 0
+        self.paths: List[Path] = []
+        self._part: int = first_part
+        self._file_keys: List[Any] = []
+        self._file_rows: int = 0
+        self.input_schema = raw_schema(self.schema) if transform is not None else self.schema
+        self._buffer = ColumnarAccumulator(self.input_schema)
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._closed: bool = False
+
+    def part_path(self, part: int) -> Path:
+        return self.filepath.with_name(f"{self.filepath.stem}-part-{part:05d}{self.filepath.suffix}")
+
+    @staticmethod
+    def find_parts(filepath: Union[str, Path]) -> Dict[int, Path]:
+        """
+        :param filepath: output path without the part suffix
+        :return: part files of the output existing on disk by their index
+        """
+        filepath = Path(filepath)
+        prefix = f"{filepath.stem}-part-"
+        parts = {}
+        for path in filepath.parent.glob(f"*{filepath.suffix}"):
+            index = path.stem[len(prefix):]
+            if path.stem.startswith(prefix) and index.isdigit():
+                parts[int(index)] = path
+        return dict(sorted(parts.items()))
+
+    @property
+    def current_path(self) -> Path:
+        return self.filepath if self.rows_per_file is None else self.part_path(self._part)
+
+    def __enter__(self) -> 'ParquetSink':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def write(self, record: Optional[Mapping[str, Any]]) -> None:
+        if record is None:
+            return
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def write_rows(self, table: pa.Table) -> None:
+        """
+        Buffers the rows of a table as if they were written record by record (`input_schema` columns)
+        """
+        self._buffer.extend_table(table)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        table = self._buffer.to_table()  # `batch_size` rows, a bit more if `write_rows` has filled the buffer
+        self._buffer.clear()
+        self._write(table if self.transform is None else self.transform(table, self.schema))
+
+    def write_table(self, table: pa.Table) -> None:
+        """
+        Writes the rows of a table of `schema` as they are (no `transform`), e.g. the row groups of files being merged
+        """
+        if not table.num_rows:
+            return
+        self.flush()
+        self._write(table)
+
+    def _write(self, table: pa.Table) -> None:
+        if self._writer is None:
+            self._writer = self._open_writer(self.current_path)
+        self._writer.write_table(table, row_group_size=self.batch_size)
+        self.num_rows += table.num_rows
+        self.num_row_groups += -(-table.num_rows // self.batch_size)
+        self._file_rows += table.num_rows
+        if self.on_file_closed is not None:
+            self._file_keys.extend(table.column(self.key_column).to_pylist())
+        if self.rows_per_file is not None and self._file_rows >= self.rows_per_file:
+            self._close_file()
+            self._part += 1
+
+    def _open_writer(self, path: Path) -> pq.ParquetWriter:
+        return pq.ParquetWriter(path, self.schema, compression=self.compression,
+                                compression_level=self.compression_level)
+
+    def roll(self) -> None:
+        """
+        Flushes the buffer and closes the current part file right away (`rows_per_file` mode only),
+            e.g. to make the records durable while the producer is idle
+        """
+        if self.rows_per_file is None:
+            raise ValueError("only the part files of the `rows_per_file` mode can be rolled over")
+        self.flush()
+        if self._writer is not None:
+            self._close_file()
+            self._part += 1
+
+    def _close_file(self) -> None:
+        path = self.current_path
+        self._writer.close()
+        self._writer = None
+        self.paths.append(path)
+        if self.on_file_closed is not None:
+            self.on_file_closed(path, self._file_keys)
+        self._file_keys = []
+        self._file_rows = 0
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        if self._writer is None and self.rows_per_file is None:
+            # nothing has been written - still leave a valid (empty) file
+            self._writer = self._open_writer(self.filepath)
+        if self._writer is not None:
+            self._close_file()
+
+
+class PartitionedParquetSink:
+    """
+        Streams records into a hive partitioned parquet dataset, `{root}/query=.../year=.../data-part-N.parquet`
+            by default; values are url-quoted, a missing one goes to the `HIVE_NULL_PARTITION` directory.
+        Records are buffered as parsed, every `batch_size` of them are normalized together (see `ParquetSink`),
+            then split by partition; every partition is written by its own `ParquetSink` rolled over every
+            `rows_per_file` rows.
+        Once more than `max_open_files` partitions have open files, the least recently written one is rolled over,
+            which bounds both the file handles and the buffered records.
+        The partition columns are kept in the directory names only, as the hive convention goes:
+            `pyarrow.dataset.dataset(root, partitioning='hive')` (or pandas / spark / duckdb) reads them back
+    """
+
+    PARTITION_COLUMNS: Tuple[str, ...] = ('query', 'year')
+
+    def __init__(self, root: Union[str, Path], partition_by: Sequence[str] = PARTITION_COLUMNS,
+                 batch_size: int = 1000, schema: Optional[pa.Schema] = None, compression: str = 'zstd',
+                 rows_per_file: int = 100_000, on_file_closed: Optional[Callable[[Path, List[Any]], None]] = None,
+                 key_column: str = 'url',
+                 transform: Optional[Callable[[pa.Table, pa.Schema], pa.Table]] = normalize_table,
+                 compression_level: Optional[int] = None, max_open_files: int = 64, basename: str = 'data'):
+        unknown = set(partition_by) - set(self.PARTITION_COLUMNS)
+        if unknown:
+            raise ValueError(f"unknown partition columns={sorted(unknown)}, expected some of {self.PARTITION_COLUMNS}")
+        if max_open_files < 1:
+            raise ValueError(f"`max_open_files` must be positive but got {max_open_files}")
+        self.root = Path(root)
+        self.partition_by = tuple(partition_by)
+        self.schema = schema or ARTICLE_SCHEMA
+        self.file_schema = pa.schema([field for field in self.schema if field.name not in self.partition_by])
+        self.key_column = key_column
+        self.batch_size = batch_size
+        self.transform = transform
+        # the records are split by the query even when it's not among the output columns
+        self._batch_schema = pa.schema(list(self.schema) + [
+            pa.field(column, pa.string()) for column in self.partition_by
+            if column != 'year' and column not in self.schema.names])
+        self.input_schema = raw_schema(self._batch_schema) if transform is not None else self.schema
+        self.max_open_files = max_open_files
+        self.basename = basename
+        self._sink_kwargs = dict(batch_size=batch_size, schema=self.file_schema, compression=compression,
+                                 compression_level=compression_level, rows_per_file=rows_per_file,
+                                 on_file_closed=on_file_closed, key_column=key_column, transform=None)
+        self._sinks: Dict[Tuple[Any, ...], ParquetSink] = {}
+        self._open: OrderedDict[Tuple[Any, ...], None] = OrderedDict()  # least recently written first
+        self._buffer = ColumnarAccumulator(self.input_schema)
+        self._closed: bool = False
+
+    def __enter__(self) -> 'PartitionedParquetSink':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def num_rows(self) -> int:
+        return sum(sink.num_rows for sink in self._sinks.values())
+
+    @property
+    def num_row_groups(self) -> int:
+        return sum(sink.num_row_groups for sink in self._sinks.values())
+
+    @property
+    def paths(self) -> List[Path]:
+        return [path for sink in self._sinks.values() for path in sink.paths]
+
+    def partition_values(self, table: pa.Table) -> List[Tuple[Any, ...]]:
+        """
+        :param table: rows of `schema`
+        :return: partition values of every row, the year comes from the publication date (parsed from its text
+            with the string schema); None if there is no column
+        """
+        def years(published_date: pa.ChunkedArray) -> pa.Array:
+            return pc.year(published_date if pa.types.is_date(published_date.type)
+                           else parse_published_dates(published_date))
+
+        sources = ['published_date' if column == 'year' else column for column in self.partition_by]
+        columns = [pa.nulls(table.num_rows) if source not in table.column_names
+                   else years(table.column(source)) if column == 'year' else table.column(source)
+                   for column, source in zip(self.partition_by, sources)]
+        return list(zip(*(column.to_pylist() for column in columns))) if columns else [()] * table.num_rows
+
+    def partition_dir(self, values: Sequence[Any]) -> Path:
+        return self.root.joinpath(*(
+            f"{column}={HIVE_NULL_PARTITION if value is None else quote(str(value), safe='')}"
+            for column, value in zip(self.partition_by, values)))
+
+    def _sink(self, values: Tuple[Any, ...]) -> ParquetSink:
+        sink = self._sinks.get(values)
+        if sink is None:
+            directory = self.partition_dir(values)
+            directory.mkdir(parents=True, exist_ok=True)
+            filepath = directory / f"{self.basename}.parquet"
+            # the files of the previous runs (resume / refresh) are kept - continue after them
+            sink = self._sinks[values] = ParquetSink(
+                filepath, first_part=max(ParquetSink.find_parts(filepath), default=-1) + 1, **self._sink_kwargs)
+        return sink
+
+    def write(self, record: Optional[Mapping[str, Any]]) -> None:
+        if record is None:
+            return
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Normalizes the buffered records and passes them to their partitions
+        """
+        if not self._buffer:
+            return
+        table = self._buffer.to_table()
+        self._buffer.clear()
+        self._write_partitions(table if self.transform is None else self.transform(table, self._batch_schema))
+
+    def write_table(self, table: pa.Table) -> None:
+        """
+        Writes the rows of a table of `schema` (no `transform`), e.g. the row groups of other files being merged
+        """
+        if not table.num_rows:
+            return
+        self.flush()
+        self._write_partitions(table)
+
+    def _write_partitions(self, table: pa.Table) -> None:
+        rows: Dict[Tuple[Any, ...], List[int]] = {}
+        for i, values in enumerate(self.partition_values(table)):
+            rows.setdefault(values, []).append(i)
+        table = table.select(self.file_schema.names)
+        for values, indices in rows.items():
+            self._sink(values).write_rows(table.take(indices) if len(rows) > 1 else table)
+            self._open[values] = None
+            self._open.move_to_end(values)
+            if len(self._open) > self.max_open_files:
+                self._sinks[self._open.popitem(last=False)[0]].roll()
+
+    def roll(self) -> None:
+        """
+        Flushes the buffers and closes the open files of all the partitions
+        """
+        self.flush()
+        for values in self._open:
+            self._sinks[values].roll()
+        self._open.clear()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        for sink in self._sinks.values():
+            sink.close()
+        self._open.clear()
+
+
+def find_dataset_files(root: Union[str, Path], suffix: str = '.parquet') -> List[Path]:
+    """
+    :return: files of a partitioned dataset
+    """
+    root = Path(root)
+    return sorted(root.rglob(f"*{suffix}")) if root.is_dir() else []
+
+
+def iter_unique_row_groups(paths: Iterable[Union[str, Path]], key_column: Optional[str] = 'url',
+                           schema: Optional[pa.Schema] = None) -> Iterator[pa.Table]:
+    """
+    Reads parquet files row group by row group, so that memory doesn't depend on the total size
+    :param paths:
+    :param key_column: rows with a key seen before are dropped; no deduplication if None
+    :param schema: schema of the files
+    :return: row groups without the rows seen before
+    """
+    schema = schema or ARTICLE_SCHEMA
+    seen: Set[Any] = set()
+    for path in paths:
+        parquet_file = pq.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(i).select(schema.names).cast(schema)
+            if key_column is not None:
+                keys = table.column(key_column).to_pylist()
+                mask = []
+                for key in keys:
+                    mask.append(key not in seen)
+                    seen.add(key)
+                table = table.filter(pa.array(mask, type=pa.bool_()))
+            yield table
+
+
+def merge_parquet_files(paths: Iterable[Union[str, Path]], filepath: Union[str, Path],
+                        key_column: Optional[str] = 'url', schema: Optional[pa.Schema] = None,
+                        compression: str = 'zstd', compression_level: Optional[int] = None) -> int:
+    """
+    Merges parquet files into one, row group by row group
+    :param paths:
+    :param filepath: output file
+    :param key_column: rows with a key seen before are dropped; no deduplication if None
+    :param schema: schema of the files
+    :param compression:
+    :param compression_level:
+    :return: number of the rows written
+    """
+    schema = schema or ARTICLE_SCHEMA
+    num_rows = 0
+    with pq.ParquetWriter(filepath, schema, compression=compression, compression_level=compression_level) as writer:
+        for table in iter_unique_row_groups(paths, key_column, schema):
+            writer.write_table(table)
+            num_rows += table.num_rows
+    return num_rows
@@ -0,0 +1,268 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from .scheduler import backoff_delay
+
+from typing import NamedTuple, Optional, List, Dict, Any, Iterable, Tuple, Union, Type
+
+
+__all__ = ['Lease', 'WorkQueue', 'SqliteWorkQueue', 'WORK_QUEUE_BACKENDS', 'get_work_queue']
+
+
+class Lease(NamedTuple):
+    kind: str
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+
+
+class WorkQueue:
+    """
+        Interface of the work queues shared by the processes (or machines) of a distributed crawl.
+        Tasks are identified by `(kind, key)` - putting a task which is already there does nothing.
+        A worker leases tasks for `lease_seconds` and keeps the leases alive with `heartbeat`; tasks of a worker
+            which has stopped heartbeating (died) are leased by the others once their leases expire.
+        Life of a task:
+            pending -> leased -> processed (the result isn't durable yet, e.g. buffered in the output) -> done,
+            a failed attempt puts the task back after a backoff, `max_attempts` failures make it failed
+    """
+
+    name: str = ''
+
+    def put(self, kind: str, tasks: Iterable[Tuple[str, Dict[str, Any]]], priority: int = 0) -> int:
+        """
+        :param kind:
+        :param tasks: (key, payload) pairs
+        :param priority: tasks with lower values are leased first
+        :return: number of the new tasks
+        """
+        raise NotImplementedError
+
+    def lease(self, worker: str, limit: int) -> List[Lease]:
+        raise NotImplementedError
+
+    def heartbeat(self, worker: str) -> None:
+        raise NotImplementedError
+
+    def mark_processed(self, worker: str, kind: str, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def complete(self, kind: str, keys: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def complete_file(self, name: str, kind: str, keys: Iterable[str]) -> None:
+        """
+        Records a closed output file and completes the tasks whose results it holds, both at once:
+            the files not recorded (e.g. torn by a killed worker) are left out of the output
+        :param name: file name
+        :param kind:
+        :param keys:
+        """
+        raise NotImplementedError
+
+    def completed_files(self) -> List[str]:
+        """
+        :return: names of the recorded files in the order they were closed
+        """
+        raise NotImplementedError
+
+    def fail(self, worker: str, kind: str, key: str, error: str) -> bool:
+        """
+        :return: whether the task will be retried
+        """
+        raise NotImplementedError
+
+    def requeue_expired(self) -> int:
+        raise NotImplementedError
+
+    def unfinished(self) -> int:
+        """
+        :return: number of tasks which are neither done nor failed
+        """
+        raise NotImplementedError
+
+    def counts(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def reset(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteWorkQueue(WorkQueue):
+    """
+        Work queue in a SQLite file (WAL mode) for the worker processes of one machine
+            or several machines sharing a file system with working locks.
+        Leases rely on the wall clock, so the clocks of the machines must be in sync
+    """
+
+    name: str = 'sqlite'
+
+    PENDING: int = 0
+    LEASED: int = 1
+    PROCESSED: int = 2
+    DONE: int = 3
+    FAILED: int = 4
+    STATUSES: Tuple[str, ...] = ('pending', 'leased', 'processed', 'done', 'failed')
+
+    def __init__(self, path: Union[str, Path], lease_seconds: float = 120., max_attempts: int = 11,
+                 retry_base_delay: float = 0.5, retry_max_delay: float = 30., busy_timeout: float = 60.):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        # autocommit mode: transactions are opened explicitly, `BEGIN IMMEDIATE` takes the write lock right away
+        self._connection = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, key TEXT NOT NULL, payload TEXT NOT NULL, "
+            "priority INTEGER NOT NULL, status INTEGER NOT NULL, available_at REAL NOT NULL, worker TEXT, "
+            "lease_until REAL, attempts INTEGER NOT NULL, error TEXT, UNIQUE (kind, key))")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, priority, id)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS tasks_worker ON tasks (worker, status)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+
+    def _transaction(self, sql: str, parameters: Iterable[Any] = (), many: bool = False) -> int:
+        """
+        Runs the statement (`executemany` if `many`) in a write transaction
+        :return: number of the changed rows
+        """
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            before = self._connection.total_changes
+            if many:
+                self._connection.executemany(sql, parameters)
+            else:
+                self._connection.execute(sql, tuple(parameters))
+            changes = self._connection.total_changes - before
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return changes
+
+    def put(self, kind: str, tasks: Iterable[Tuple[str, Dict[str, Any]]], priority: int = 0) -> int:
+        return self._transaction(
+            "INSERT OR IGNORE INTO tasks (kind, key, payload, priority, status, available_at, attempts) "
+            "VALUES (?, ?, ?, ?, ?, 0, 0)",
+            [(kind, key, json.dumps(payload), priority, self.PENDING) for key, payload in tasks], many=True)
+
+    def lease(self, worker: str, limit: int) -> List[Lease]:
+        if limit < 1:
+            return []
+        self.requeue_expired()
+        now = time.time()
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._connection.execute(
+                "SELECT id, kind, key, payload, attempts FROM tasks WHERE status = ? AND available_at <= ? "
+                "ORDER BY priority, id LIMIT ?", (self.PENDING, now, limit)).fetchall()
+            self._connection.executemany(
+                "UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                ((self.LEASED, worker, now + self.lease_seconds, row[0]) for row in rows))
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+        return [Lease(kind, key, json.loads(payload), attempts + 1) for _, kind, key, payload, attempts in rows]
+
+    def heartbeat(self, worker: str) -> None:
+        self._transaction("UPDATE tasks SET lease_until = ? WHERE worker = ? AND status IN (?, ?)",
+                          (time.time() + self.lease_seconds, worker, self.LEASED, self.PROCESSED))
+
+    def mark_processed(self, worker: str, kind: str, keys: Iterable[str]) -> None:
+        self._transaction("UPDATE tasks SET status = ? WHERE kind = ? AND key = ? AND worker = ? AND status = ?",
+                          [(self.PROCESSED, kind, key, worker, self.LEASED) for key in keys], many=True)
+
+    def complete(self, kind: str, keys: Iterable[str]) -> None:
+        # whoever completes the task first - a slow worker may finish a task whose lease has been taken over
+        self._transaction("UPDATE tasks SET status = ?, lease_until = NULL WHERE kind = ? AND key = ?",
+                          [(self.DONE, kind, key) for key in keys], many=True)
+
+    def complete_file(self, name: str, kind: str, keys: Iterable[str]) -> None:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.execute("INSERT OR IGNORE INTO files (name) VALUES (?)", (name,))
+            self._connection.executemany("UPDATE tasks SET status = ?, lease_until = NULL WHERE kind = ? AND key = ?",
+                                         [(self.DONE, kind, key) for key in keys])
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def completed_files(self) -> List[str]:
+        return [name for name, in self._connection.execute("SELECT name FROM files ORDER BY id")]
+
+    def fail(self, worker: str, kind: str, key: str, error: str) -> bool:
+        row = self._connection.execute("SELECT attempts FROM tasks WHERE kind = ? AND key = ? AND worker = ?",
+                                       (kind, key, worker)).fetchone()
+        if row is None:
+            return False
+        attempts = row[0]
+        if attempts >= self.max_attempts:
+            self._transaction("UPDATE tasks SET status = ?, error = ? WHERE kind = ? AND key = ? AND worker = ? "
+                              "AND status = ?", (self.FAILED, error, kind, key, worker, self.LEASED))
+            return False
+        available_at = time.time() + backoff_delay(attempts, self.retry_base_delay, self.retry_max_delay)
+        self._transaction("UPDATE tasks SET status = ?, available_at = ?, error = ? WHERE kind = ? AND key = ? "
+                          "AND worker = ? AND status = ?",
+                          (self.PENDING, available_at, error, kind, key, worker, self.LEASED))
+        return True
+
+    def requeue_expired(self) -> int:
+        """
+        Puts the tasks of the workers which have stopped heartbeating back to the queue
+        :return: number of the requeued tasks
+        """
+        return self._transaction(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, available_at = 0, "
+            "error = 'lease expired' WHERE status IN (?, ?) AND lease_until < ?",
+            (self.max_attempts, self.FAILED, self.PENDING, self.LEASED, self.PROCESSED, time.time()))
+
+    def unfinished(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM tasks WHERE status < ?", (self.DONE,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(self.STATUSES, 0)
+        for status, count in self._connection.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"):
+            counts[self.STATUSES[status]] = count
+        return counts
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        return [{'kind': kind, 'ident': key, 'attempts': attempts, 'error': error}
+                for kind, key, attempts, error in self._connection.execute(
+                    "SELECT kind, key, attempts, error FROM tasks WHERE status = ? ORDER BY id", (self.FAILED,))]
+
+    def reset(self) -> None:
+        self._transaction("DELETE FROM tasks")
+        self._transaction("DELETE FROM files")
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+WORK_QUEUE_BACKENDS: Dict[str, Type[WorkQueue]] = {
+    SqliteWorkQueue.name: SqliteWorkQueue,
+}
+
+
+def get_work_queue(name: str = SqliteWorkQueue.name, **kwargs) -> WorkQueue:
+    """
+    :param name: one of `WORK_QUEUE_BACKENDS` keys
+    :param kwargs: backend constructor parameters
+    :return:
+    """
+    if name not in WORK_QUEUE_BACKENDS:
+        raise ValueError(f"unknown work queue backend={name}, expected one of {tuple(WORK_QUEUE_BACKENDS)}")
+    return WORK_QUEUE_BACKENDS[name](**kwargs)
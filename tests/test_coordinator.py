@@ -0,0 +1,58 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from main import list_search_pages, run_coordinator
+from scraping.sinks import ParquetSink
+from scraping.workqueue import SqliteWorkQueue
+
+
+URLS = [f"https://pubmed.ncbi.nlm.nih.gov/{40_000_000 + i}/" for i in range(6)]
+
+
+def write_and_die(queue_path: str, filepath: str, urls: list, rows_per_file: int) -> None:
+    """
+    Worker writing its part files the way `run_worker` does, killed once the last part has row groups but no footer
+    """
+    work_queue = SqliteWorkQueue(queue_path)
+    sink = ParquetSink(filepath, batch_size=2, rows_per_file=rows_per_file,
+                       on_file_closed=lambda path, keys: work_queue.complete_file(path.name, 'article', keys))
+    for url in urls:
+        sink.write({'url': url, 'pmid': url.rstrip('/').rsplit('/', 1)[-1], 'query': 'food allergies'})
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_merge_skips_part_of_killed_worker(tmp_path):
+    parts_dir = tmp_path / 'out.parts'
+    parts_dir.mkdir()
+    queue_path = tmp_path / 'queue.sqlite'
+    # the tasks of the killed worker aren't retried, so the coordinator moves on to the merge once its leases expire
+    work_queue = SqliteWorkQueue(queue_path, lease_seconds=0.2, max_attempts=1)
+    pages = list_search_pages('food allergies', num_pages=1)
+    work_queue.put('search', [(str(key), {}) for key, _, _ in pages])
+    work_queue.complete('search', [str(key) for key, _, _ in pages])
+    work_queue.put('article', [(url, {'url': url}) for url in URLS])
+    assert len(work_queue.lease('worker-1', len(URLS))) == len(URLS)
+
+    process = multiprocessing.get_context('spawn').Process(
+        target=write_and_die, args=(str(queue_path), str(parts_dir / 'worker-1.parquet'), URLS, 4))
+    process.start()
+    process.join()
+    assert process.exitcode == -signal.SIGKILL
+    worker_sink = ParquetSink(parts_dir / 'worker-1.parquet', rows_per_file=4)
+    closed, torn = worker_sink.part_path(0), worker_sink.part_path(1)
+    assert closed.exists() and torn.exists()
+    with pytest.raises(pa.ArrowInvalid):
+        pq.ParquetFile(torn)
+
+    sink = ParquetSink(tmp_path / 'out.parquet', transform=None)  # as `open_output_sink` for the coordinator
+    num_rows = asyncio.run(run_coordinator(work_queue, 'food allergies', 1, 1, parts_dir, sink, poll_interval=0.1))
+    assert num_rows == 4
+    assert pq.read_table(tmp_path / 'out.parquet').column('url').to_pylist() == URLS[:4]
+    assert [letter['ident'] for letter in work_queue.dead_letters()] == URLS[4:]
+    work_queue.close()
@@ -0,0 +1,19 @@
+import importlib
+import subprocess
+import sys
+from pathlib import Path
+
+import scraping
+
+
+def test_export_table_follows_modules():
+    for module, names in scraping._MODULE_EXPORTS.items():
+        assert tuple(importlib.import_module(f"scraping.{module}").__all__) == names, module
+
+
+def test_name_imports_its_module_only():
+    code = ("import sys\nfrom scraping import get_parser\n"
+            "print(','.join(name for name in ('aiohttp', 'pyarrow', 'numpy', 'scraping.sinks') if name in sys.modules))")
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                             cwd=Path(scraping.__file__).parents[1])
+    assert process.stdout.strip() == ''
@@ -0,0 +1,59 @@
+import pytest
+
+from scraping.common import PUBMED_BASE_URL
+from scraping.parsers import PARSER_BACKENDS, BeautifulSoupParser, get_parser
+
+from benchmarks.fixtures import article_page_variants, search_page
+
+
+BACKENDS = [name for name in PARSER_BACKENDS if name != BeautifulSoupParser.name]
+ARTICLE_PAGES = article_page_variants(size=2000)
+SEARCH_PAGES = {
+    'first': search_page(1),
+    'last': search_page(7, per_page=3, total=63),
+    'padded': search_page(2, size=5000),
+    'no_results': search_page(1, per_page=0, total=0),
+}
+
+
+@pytest.fixture(scope='module')
+def reference():
+    return get_parser(BeautifulSoupParser.name)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('variant', ARTICLE_PAGES)
+def test_parse_article(reference, backend, variant):
+    url = f"{PUBMED_BASE_URL}/{variant}/"
+    expected = reference.parse_article(ARTICLE_PAGES[variant], url)
+    assert get_parser(backend).parse_article(ARTICLE_PAGES[variant], url) == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('fields', [['url', 'pmid', 'abstract'], ['keywords', 'published_date', 'volume']])
+def test_parse_article_fields(reference, backend, fields):
+    for variant, text in ARTICLE_PAGES.items():
+        url = f"{PUBMED_BASE_URL}/{variant}/"
+        expected = reference.parse_article(text, url, fields=fields)
+        assert get_parser(backend).parse_article(text, url, fields=fields) == expected, variant
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('page', SEARCH_PAGES)
+def test_parse_search_page(reference, backend, page):
+    expected = reference.parse_search_page(SEARCH_PAGES[page], PUBMED_BASE_URL)
+    assert get_parser(backend).parse_search_page(SEARCH_PAGES[page], PUBMED_BASE_URL) == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('page', SEARCH_PAGES)
+def test_parse_search_results(reference, backend, page):
+    expected = reference.parse_search_results(SEARCH_PAGES[page], PUBMED_BASE_URL)
+    assert get_parser(backend).parse_search_results(SEARCH_PAGES[page], PUBMED_BASE_URL) == expected
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('page', SEARCH_PAGES)
+def test_parse_results_count(reference, backend, page):
+    expected = reference.parse_results_count(SEARCH_PAGES[page])
+    assert get_parser(backend).parse_results_count(SEARCH_PAGES[page]) == expected
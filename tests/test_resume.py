@@ -0,0 +1,58 @@
+import asyncio
+from datetime import date
+
+from benchmarks.mock_server import MockPubmed
+from main import iter_articles, iter_eutils_articles
+from scraping.journal import CrawlJournal
+from scraping.sharding import date_range_term
+
+from tests.utils import serve_mock
+
+
+# 5 results a day back from 2024-12-31: pmids 40000000-39999991 and 39999990-39999976
+QUERIES = [date_range_term('food allergies', date(2024, 12, 30), date(2024, 12, 31)),
+           date_range_term('asthma', date(2024, 12, 27), date(2024, 12, 29))]
+
+
+def expected_query(record) -> str:
+    return QUERIES[0] if int(record['pmid']) > 39_999_990 else QUERIES[1]
+
+
+async def crawl(journal: CrawlJournal, eutils: bool, stop_after: int = None) -> list:
+    """
+    Runs the crawl of both queries, records written after the first `stop_after` ones are lost as in a crash
+    """
+    records = []
+    async with serve_mock(MockPubmed(num_results=1000)) as (url, session_manager):
+        if eutils:
+            articles = iter_eutils_articles(session_manager, QUERIES, max_records=20, base_url=f"{url}/entrez/eutils",
+                                            pubmed_url=url, batch_size=5, journal=journal)
+        else:
+            articles = iter_articles(session_manager, QUERIES, num_pages=1, base_url=url, journal=journal)
+        async for record in articles:
+            records.append(record)
+            if len(records) == stop_after:
+                journal.record_batch('part-0.parquet', [record['url'] for record in records])
+                break
+        await articles.aclose()
+    return records
+
+
+def check_resume(tmp_path, eutils: bool):
+    journal = CrawlJournal(tmp_path / 'journal.sqlite')
+    written = asyncio.run(crawl(journal, eutils, stop_after=8))
+    assert journal.pending_urls()
+    resumed = asyncio.run(crawl(journal, eutils))
+    journal.close()
+
+    records = written + resumed
+    assert sorted(int(record['pmid']) for record in records) == list(range(39_999_976, 40_000_001))
+    assert all(record['query'] == expected_query(record) for record in records)
+
+
+def test_resume_keeps_queries(tmp_path):
+    check_resume(tmp_path, eutils=False)
+
+
+def test_eutils_resume_keeps_queries(tmp_path):
+    check_resume(tmp_path, eutils=True)
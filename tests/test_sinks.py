@@ -0,0 +1,26 @@
+import pyarrow.dataset as ds
+import pytest
+
+from scraping.schema import OUTPUT_SCHEMAS
+from scraping.sinks import PartitionedParquetSink
+
+
+RECORDS = [
+    {'url': 'https://pubmed.ncbi.nlm.nih.gov/1/', 'pmid': '1', 'cit': '2021 Mar;17:e123.', 'query': 'food allergies'},
+    {'url': 'https://pubmed.ncbi.nlm.nih.gov/2/', 'pmid': '2', 'cit': '2019 Winter;12(4):1-5.', 'query': 'asthma'},
+    {'url': 'https://pubmed.ncbi.nlm.nih.gov/3/', 'pmid': '3', 'cit': '2021 Sep 2;4(1):7-9.', 'query': 'asthma'},
+    {'url': 'https://pubmed.ncbi.nlm.nih.gov/4/', 'pmid': '4', 'cit': None, 'query': 'asthma'},
+]
+
+
+@pytest.mark.parametrize('output_schema', OUTPUT_SCHEMAS)
+def test_partitioned_by_query_and_year(tmp_path, output_schema):
+    with PartitionedParquetSink(tmp_path / 'out', ['query', 'year'], batch_size=3,
+                                schema=OUTPUT_SCHEMAS[output_schema]) as sink:
+        for record in RECORDS:
+            sink.write(record)
+    table = ds.dataset(tmp_path / 'out', partitioning='hive').to_table().sort_by('url')
+    assert table.column('query').to_pylist() == [record['query'] for record in RECORDS]
+    assert table.column('year').to_pylist() == [2021, 2019, 2021, None]
+    assert sorted(path.parent.name for path in sink.paths) == \
+        ['year=2019', 'year=2021', 'year=2021', 'year=__HIVE_DEFAULT_PARTITION__']
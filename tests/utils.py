@@ -0,0 +1,23 @@
+import contextlib
+
+from benchmarks.mock_server import MockPubmed, start_mock_server
+from scraping.aio import AsyncUserAgentManager
+
+from typing import AsyncIterator, Tuple
+
+
+@contextlib.asynccontextmanager
+async def serve_mock(mock: MockPubmed) -> AsyncIterator[Tuple[str, AsyncUserAgentManager]]:
+    """
+    Runs the stand-in server on a free port within the running event loop
+    :return: its base url and a session manager
+    """
+    runner = await start_mock_server(mock, port=0)
+    host, port = runner.addresses[0][:2]
+    session_manager = AsyncUserAgentManager(['test-agent'], max_agents_num=1, max_concurrent_requests=8)
+    try:
+        yield f"http://{host}:{port}", session_manager
+    finally:
+        await session_manager.shutdown()
+        await runner.cleanup()
+
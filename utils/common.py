@@ -1,12 +1,20 @@
-import yaml
+import json
 from pathlib import Path
-from typing import Union, Dict, Optional, Any
+from typing import Union, Dict, Optional, Any, Iterable
 
 
-__all__ = ['load_yaml']
+__all__ = ['load_yaml', 'save_jsonl']
 
 
 def load_yaml(filepath: Union[str, Path], **kwargs) -> Dict[str, Any]:
+    import yaml  # only the entry point reads configs, the workers don't pay for the import
+
     with open(filepath, 'r', **kwargs) as file:
         config = yaml.safe_load(file)
     return config
+
+
+def save_jsonl(filepath: Union[str, Path], records: Iterable[Dict[str, Any]], mode: str = 'w') -> None:
+    with open(filepath, mode, encoding='utf-8') as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')